@@ -0,0 +1,327 @@
+from collections.abc import Mapping
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from retrieval import InvertedIndex
+
+# Root directory for trained model artifacts, shared by every worker on the node
+MODEL_ARTIFACT_DIR = os.getenv(
+    "MODEL_ARTIFACT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_artifacts")
+)
+# Number of artifact versions kept per bot; older ones are pruned after each save
+MODEL_ARTIFACT_KEEP = int(os.getenv("MODEL_ARTIFACT_KEEP", "2"))
+
+ARTIFACT_FORMAT = 3
+
+
+class MappedTexts:
+    """Read-only sequence of strings backed by a memory-mapped UTF-8 blob"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+        # Plain buffer views: slicing them is much cheaper than slicing a numpy memmap
+        self._blob_view = memoryview(blob)
+        self._offsets_view = memoryview(offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("text index out of range")
+        return str(self.encoded(idx), "utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def encoded(self, idx: int) -> memoryview:
+        """The UTF-8 bytes of text idx, without decoding"""
+        return self._blob_view[self._offsets_view[idx]:self._offsets_view[idx + 1]]
+
+    def arrays(self) -> tuple:
+        return self._blob, self._offsets
+
+    def take(self, rows) -> "MappedTexts":
+        """The texts at increasing positions rows, copied as bytes without decoding"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return MappedTexts(np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64))
+        # Rows are mostly long runs of neighbours, each one contiguous slice of the blob
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        run_starts = rows[np.concatenate([[0], breaks])]
+        run_ends = rows[np.concatenate([breaks - 1, [len(rows) - 1]])] + 1
+        offsets = np.asarray(self._offsets)
+        blob = np.concatenate([self._blob[offsets[a]:offsets[b]] for a, b in zip(run_starts, run_ends)])
+        lengths = offsets[rows + 1] - offsets[rows]
+        new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        return MappedTexts(blob, new_offsets)
+
+    def extend(self, texts) -> "MappedTexts":
+        """These texts followed by more, as a new MappedTexts"""
+        blob, offsets = MappedTexts.encode(texts)
+        return MappedTexts(
+            np.concatenate([self._blob, blob]),
+            np.concatenate([self._offsets, offsets[1:] + self._offsets[-1]])
+        )
+
+    @classmethod
+    def of(cls, texts) -> "MappedTexts":
+        return texts if isinstance(texts, cls) else cls(*cls.encode(texts))
+
+    @staticmethod
+    def encode(texts) -> tuple:
+        """(blob, offsets) arrays for texts, the inverse of MappedTexts(blob, offsets)"""
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class MappedVocabulary(Mapping):
+    """Read-only term -> column mapping over sorted terms in a memory-mapped blob.
+
+    Stands in for a fitted vectorizer's vocabulary_ dict, so the vocabulary
+    is shared through the page cache like the matrices instead of being
+    rebuilt as a dict in every worker. Lookups binary-search the terms.
+    """
+
+    def __init__(self, terms: MappedTexts, columns):
+        self._terms = terms
+        self._columns = columns
+
+    def __getitem__(self, term):
+        if not isinstance(term, str):
+            raise KeyError(term)
+        # UTF-8 byte order is code point order, the order the terms were sorted in
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self._terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._terms.encoded(mid).tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._terms) and self._terms.encoded(lo) == key:
+            return int(self._columns[lo])
+        raise KeyError(term)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def arrays(self) -> tuple:
+        return self._terms.arrays() + (self._columns,)
+
+
+class MappedTfidfVectorizer:
+    """Query-side TF-IDF over an artifact's vocabulary and IDF vector.
+
+    Does what a fitted TfidfVectorizer's transform does: counts the analyzer's
+    terms over the vocabulary, scales them by IDF and L2-normalizes each row.
+    Only public scikit-learn API is used, so nothing depends on how the
+    installed version keeps its fitted state.
+    """
+
+    def __init__(self, analyzer, vocabulary, idf, dtype=np.float32):
+        self.analyzer = analyzer
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.dtype = dtype
+        # Scaling in the output dtype matches the fitted vectorizer bit for bit
+        self._idf = np.asarray(idf, dtype=dtype)
+
+    def transform(self, texts) -> csr_matrix:
+        from sklearn.preprocessing import normalize
+        indices, counts, indptr = [], [], [0]
+        for text in texts:
+            row = {}
+            for term in self.analyzer(text):
+                column = self.vocabulary_.get(term)
+                if column is not None:
+                    row[column] = row.get(column, 0) + 1
+            indices.extend(row)
+            counts.extend(row.values())
+            indptr.append(len(indices))
+        matrix = csr_matrix(
+            (np.asarray(counts, dtype=self.dtype), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, len(self._idf))
+        )
+        matrix.sort_indices()
+        matrix.data *= self._idf[matrix.indices]
+        return normalize(matrix, norm="l2", copy=False)
+
+
+def artifact_path(bot_id: int, version: int, root: str = None) -> str:
+    return os.path.join(root or MODEL_ARTIFACT_DIR, f"bot_{bot_id}", f"v{version}")
+
+
+def save_artifact(trainer, version: int, root: str = None) -> str:
+    """Write a trainer's fitted model to a versioned artifact directory.
+
+    The directory is assembled under a temporary name and renamed into place,
+    so readers only ever see complete artifacts. A directory already holding
+    this version is replaced, not trusted: it may be left over from a run
+    whose version was never committed. Callers hold artifact_lock.
+    """
+    path = artifact_path(trainer.bot_id, version, root)
+    bot_dir = os.path.dirname(path)
+    os.makedirs(bot_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    try:
+        matrix = trainer.trained_data.tocsr()
+        # Incrementally updated models already hold their texts encoded
+        texts, offsets = MappedTexts.of(trainer.raw_texts).arrays()
+
+        np.save(os.path.join(tmp_path, "data.npy"), matrix.data)
+        np.save(os.path.join(tmp_path, "indices.npy"), matrix.indices)
+        np.save(os.path.join(tmp_path, "indptr.npy"), matrix.indptr)
+        np.save(os.path.join(tmp_path, "text_offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "texts.npy"), texts)
+        np.save(os.path.join(tmp_path, "script_ids.npy"), np.asarray(trainer.script_ids, dtype=np.int64))
+        for name, array in trainer.index.arrays().items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        if trainer.incremental:
+            # Raw counts share indptr with the weighted matrix; their indices are hashed features
+            np.save(os.path.join(tmp_path, "counts.npy"), trainer.term_counts.data)
+            np.save(os.path.join(tmp_path, "counts_indices.npy"), trainer.term_counts.indices)
+            for name, array in zip(("columns", "df", "idf"), trainer.vectorizer.arrays()):
+                np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+            with open(os.path.join(tmp_path, "word_counts.json"), "w") as f:
+                json.dump(trainer.word_counts, f)
+        else:
+            np.save(os.path.join(tmp_path, "idf.npy"), trainer.vectorizer.idf_)
+            # Sorted by term so MappedVocabulary can binary-search it
+            vocabulary = sorted(trainer.vectorizer.vocabulary_.items())
+            terms, term_offsets = MappedTexts.encode(term for term, _ in vocabulary)
+            np.save(os.path.join(tmp_path, "vocabulary_terms.npy"), terms)
+            np.save(os.path.join(tmp_path, "vocabulary_offsets.npy"), term_offsets)
+            np.save(os.path.join(tmp_path, "vocabulary_columns.npy"), np.asarray([c for _, c in vocabulary], dtype=np.int64))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({
+                "format": ARTIFACT_FORMAT,
+                "bot_id": trainer.bot_id,
+                "version": version,
+                "vectorizer": "hashing" if trainer.incremental else "tfidf",
+                "n_docs": getattr(trainer.vectorizer, "n_docs", matrix.shape[0]),
+                "shape": list(matrix.shape),
+                "personality_profile": trainer.personality_profile
+            }, f)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    if os.path.isdir(path):
+        stale_path = f"{path}.stale-{os.getpid()}"
+        os.rename(path, stale_path)
+        shutil.rmtree(stale_path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+    _prune_versions(bot_dir, keep=MODEL_ARTIFACT_KEEP)
+    logging.info(f"Saved model artifact for bot {trainer.bot_id} version {version} to {path}")
+    return path
+
+
+def load_artifact(trainer, version: int, root: str = None) -> bool:
+    """Populate an unfitted trainer from a saved artifact.
+
+    Arrays, texts and the vocabulary are memory-mapped read-only, so every
+    worker on the node shares one physical copy through the page cache
+    instead of holding a private one. Returns False when no artifact exists
+    for this version.
+    """
+    path = artifact_path(trainer.bot_id, version, root)
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format") != ARTIFACT_FORMAT:
+        logging.warning(f"Ignoring artifact {path} with unsupported format {meta.get('format')}")
+        return False
+    if meta.get("bot_id") != trainer.bot_id or meta.get("version") != version:
+        logging.warning(f"Ignoring artifact {path} written for bot {meta.get('bot_id')} version {meta.get('version')}")
+        return False
+
+    def mapped(name):
+        return np.load(os.path.join(path, name), mmap_mode="r")
+
+    shape = tuple(meta["shape"])
+    indices, indptr = mapped("indices.npy"), mapped("indptr.npy")
+    trainer.incremental = meta["vectorizer"] == "hashing"
+    trainer.vectorizer = trainer.build_vectorizer()
+    if trainer.incremental:
+        trainer.vectorizer.set_frequencies(mapped("columns.npy"), mapped("df.npy"), meta["n_docs"], mapped("idf.npy"))
+        trainer.term_counts = csr_matrix(
+            (mapped("counts.npy"), mapped("counts_indices.npy"), indptr),
+            shape=(shape[0], trainer.vectorizer.n_features),
+            copy=False
+        )
+        # Only incremental updates need the word counts; serving workers never read them
+        trainer.word_counts = None
+    else:
+        vocabulary = MappedVocabulary(
+            MappedTexts(mapped("vocabulary_terms.npy"), mapped("vocabulary_offsets.npy")),
+            mapped("vocabulary_columns.npy")
+        )
+        fitted = trainer.vectorizer
+        trainer.vectorizer = MappedTfidfVectorizer(fitted.analyzer, vocabulary, mapped("idf.npy"), fitted.dtype)
+    trainer.trained_data = csr_matrix((mapped("data.npy"), indices, indptr), shape=shape, copy=False)
+    trainer.set_index(InvertedIndex(
+        mapped("postings_indptr.npy"),
+        mapped("postings_docs.npy"),
+        mapped("postings_weights.npy"),
+        mapped("max_weights.npy"),
+        shape[0]
+    ))
+    trainer.raw_texts = MappedTexts(mapped("texts.npy"), mapped("text_offsets.npy"))
+    trainer.script_ids = mapped("script_ids.npy")
+    trainer.personality_profile = meta["personality_profile"]
+    trainer.artifact_dir = path
+    return True
+
+
+def load_word_counts(path: str) -> dict:
+    """The word counts saved with an incremental model's artifact"""
+    with open(os.path.join(path, "word_counts.json")) as f:
+        return json.load(f)
+
+
+@contextmanager
+def artifact_lock(bot_id: int, root: str = None):
+    """Exclusive lock on a bot's artifacts across the processes of this node"""
+    bot_dir = os.path.dirname(artifact_path(bot_id, 0, root))
+    os.makedirs(bot_dir, exist_ok=True)
+    with open(os.path.join(bot_dir, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _prune_versions(bot_dir: str, keep: int):
+    versions = []
+    for name in os.listdir(bot_dir):
+        if name.startswith("v") and name[1:].isdigit():
+            versions.append(int(name[1:]))
+    for version in sorted(versions)[:-keep]:
+        # Workers that still have the old files mapped keep reading them until they reload
+        shutil.rmtree(os.path.join(bot_dir, f"v{version}"), ignore_errors=True)
@@ -0,0 +1 @@
+# Performance benchmarks for the training and inference hot paths
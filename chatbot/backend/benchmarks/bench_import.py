@@ -0,0 +1,54 @@
+"""Measure how long the API takes to become importable in a fresh interpreter.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_import --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def import_seconds(statement: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(module: str, top: int):
+    """Modules with the largest cumulative import time, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main", help="module to import (default: main, which defines app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    baseline = statistics.median(import_seconds("pass") for _ in range(args.runs))
+    timings = [import_seconds(f"from {args.module} import app" if args.module == "main" else f"import {args.module}")
+               for _ in range(args.runs)]
+    print(f"interpreter startup: {baseline * 1000:.0f} ms")
+    print(f"import {args.module}: median {(statistics.median(timings) - baseline) * 1000:.0f} ms "
+          f"(min {(min(timings) - baseline) * 1000:.0f} ms over {args.runs} runs)")
+    print("slowest imports (cumulative):")
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Benchmark training and inference across synthetic corpus sizes and check for regressions.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_suite --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.bench_suite --sizes 1000000 --queries 500 --modes incremental
+    python -m benchmarks.bench_suite --write-baseline --note "4-CPU CI runner"
+
+Both training modes are measured by default: "tfidf" (TfidfVectorizer) and
+"incremental" (the hashed vocabulary INCREMENTAL_TRAINING selects), each
+under its own "<mode>/<size>" entry. Each run uses a fresh process so its
+peak RSS is its own, and on Linux the peak is reset once the corpus is
+built, so peak_rss_mb covers training and inference only. The results are
+compared against benchmarks/baseline.json (or --baseline) and the exit
+status is non-zero when a metric regressed by more than --tolerance.
+Timings only compare across similar machines; the baseline's meta records
+the one it was taken on.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Documents generated and inserted per batch, so building a 1M corpus stays within memory
+GENERATE_BATCH = 50000
+# Documents timed through preprocess_text
+PREPROCESS_SAMPLE = 10000
+# Training modes, by the name their results are stored under
+MODES = {"tfidf": False, "incremental": True}
+# Reported but not checked against the baseline: the RSS before training is the corpus build's
+UNGATED_METRICS = ("docs", "rss_before_train_mb")
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss(), or else since the process started"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and cannot be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking from the current RSS (Linux only; elsewhere a no-op)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def sample_queries(texts, n_queries: int, seed: int):
+    """Short queries cut from the corpus, plus a few that match nothing"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for doc in rng.integers(0, len(texts), size=n_queries):
+        words = texts[doc].split()
+        length = int(rng.integers(3, 9))
+        start = int(rng.integers(0, max(1, len(words) - length)))
+        queries.append(" ".join(words[start:start + length]))
+    for i in range(0, len(queries), 10):
+        queries[i] = "completely unrelated question about the weather"
+    return queries
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+def run_size(n_docs: int, n_queries: int, seed: int, mode: str = "tfidf") -> dict:
+    """Build an n_docs corpus in a scratch database and measure mode's training and inference paths"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from training import ChatbotTrainer
+    from benchmarks.corpus import synthetic_scripts
+    import models
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        owner = models.User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(owner)
+        db.commit()
+        bot = models.Bot(name="bench", description="Benchmark bot", owner_id=owner.id)
+        db.add(bot)
+        db.commit()
+        sample = None
+        for batch, start in enumerate(range(0, n_docs, GENERATE_BATCH)):
+            texts = synthetic_scripts(min(GENERATE_BATCH, n_docs - start), seed=seed * 1000 + batch)
+            db.bulk_insert_mappings(models.Script, [{"content": text, "bot_id": bot.id} for text in texts])
+            db.commit()
+            if sample is None:
+                sample = texts
+        del texts
+        rss_before_train = peak_rss_mb()
+        # Generating the corpus is not what is measured
+        reset_peak_rss()
+
+        trainer = ChatbotTrainer(bot.id, incremental=MODES[mode])
+        start = time.perf_counter()
+        trainer.train(db)
+        train_seconds = time.perf_counter() - start
+        db.close()
+
+    preprocess_docs = sample[:PREPROCESS_SAMPLE]
+    start = time.perf_counter()
+    for text in preprocess_docs:
+        trainer.preprocess_text(text)
+    preprocess_seconds = time.perf_counter() - start
+
+    queries = sample_queries(sample, n_queries, seed)
+    trainer.generate_response(queries[0])  # builds the inverted index
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        trainer.generate_response(query)
+        latencies.append((time.perf_counter() - query_start) * 1e6)
+    respond_seconds = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "docs": n_docs,
+        "train_seconds": train_seconds,
+        "train_docs_per_second": n_docs / train_seconds,
+        "preprocess_us": preprocess_seconds / len(preprocess_docs) * 1e6,
+        "preprocess_docs_per_second": len(preprocess_docs) / preprocess_seconds,
+        "respond_p50_us": percentile(latencies, 50),
+        "respond_p95_us": percentile(latencies, 95),
+        "respond_p99_us": percentile(latencies, 99),
+        "respond_mean_us": statistics.fmean(latencies),
+        "respond_queries_per_second": len(queries) / respond_seconds,
+        "rss_before_train_mb": rss_before_train,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def lower_is_better(metric: str) -> bool:
+    return metric.endswith(("_seconds", "_us", "_mb"))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics worse than the baseline by more than tolerance, as (run, metric, baseline, current, change)"""
+    regressions = []
+    for run, metrics in results["results"].items():
+        reference = baseline.get("results", {}).get(run)
+        if not reference:
+            continue
+        for metric, value in metrics.items():
+            old = reference.get(metric)
+            if metric in UNGATED_METRICS or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old if lower_is_better(metric) else (old - value) / old
+            if change > tolerance:
+                regressions.append((run, metric, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated corpus sizes, from 1000 up to 1000000")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"comma-separated training modes out of {', '.join(MODES)} (default: all)")
+    parser.add_argument("--queries", type=int, default=1000, help="generate_response calls per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression per metric (default: 0.25)")
+    parser.add_argument("--write-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--note", help="describe the machine in the results' meta, e.g. when writing a baseline")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "queries": args.queries,
+            "seed": args.seed,
+            "note": args.note
+        },
+        "results": {}
+    }
+    context = multiprocessing.get_context("spawn")
+    runs = [(mode, int(size)) for mode in args.modes.split(",") for size in args.sizes.split(",")]
+    for mode, size in runs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            metrics = pool.submit(run_size, size, args.queries, args.seed, mode).result()
+        results["results"][f"{mode}/{size}"] = metrics
+        print(
+            f"{mode:>11} {size:>8} docs: train {metrics['train_seconds']:.2f}s ({metrics['train_docs_per_second']:,.0f} docs/s), "
+            f"preprocess {metrics['preprocess_us']:.1f} us/doc, respond p50 {metrics['respond_p50_us']:.0f} us "
+            f"p95 {metrics['respond_p95_us']:.0f} us, peak RSS {metrics['peak_rss_mb']:.0f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --write-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    baseline_cpus = baseline.get("meta", {}).get("cpu_count")
+    if baseline_cpus != os.cpu_count():
+        print(f"warning: the baseline was recorded with {baseline_cpus} CPUs, this machine has {os.cpu_count()}")
+    regressions = compare(results, baseline, args.tolerance)
+    for run, metric, old, new, change in regressions:
+        print(f"REGRESSION {run} docs {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+    if not regressions:
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Compare training-time text preprocessing against the previous NLTK path.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_tokenizer --docs 100000
+"""
+import argparse
+import re
+import time
+from sklearn.feature_extraction.text import TfidfVectorizer
+from nlp_resources import get_stopwords
+from tokenizer import Analyzer, tokenize_many
+from benchmarks.corpus import synthetic_scripts
+
+
+def legacy_features(texts, analyzer):
+    """The previous path: lower/re.sub/word_tokenize/join, then the vectorizer re-tokenizes"""
+    from nltk.tokenize import word_tokenize
+    features = []
+    for text in texts:
+        text = re.sub(r'[^\w\s]', '', text.lower())
+        features.append(analyzer(' '.join(word_tokenize(text))))
+    return features
+
+
+def current_features(texts, analyzer, workers):
+    return [analyzer(tokens) for tokens in tokenize_many(texts, workers=workers)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=None, help="tokenizer processes (default: TOKENIZER_WORKERS)")
+    args = parser.parse_args()
+
+    texts = synthetic_scripts(args.docs)
+    stop_words = sorted(get_stopwords('english'))
+    reference = TfidfVectorizer(stop_words=stop_words, ngram_range=(1, 2)).build_analyzer()
+
+    current, current_seconds = timed(current_features, texts, Analyzer(stop_words), args.workers)
+    serial, serial_seconds = timed(current_features, texts, Analyzer(stop_words), 1)
+    print(f"tokenizer (parallel): {args.docs / current_seconds:,.0f} docs/s")
+    print(f"tokenizer (serial):   {args.docs / serial_seconds:,.0f} docs/s")
+    try:
+        legacy, legacy_seconds = timed(legacy_features, texts, reference)
+    except (ImportError, LookupError) as e:
+        print(f"legacy path skipped, NLTK or its punkt data is unavailable: {e}")
+        return
+    print(f"legacy NLTK path:     {args.docs / legacy_seconds:,.0f} docs/s")
+    print(f"speedup: {legacy_seconds / serial_seconds:.1f}x serial, {legacy_seconds / current_seconds:.1f}x parallel")
+    mismatches = sum(a != b for a, b in zip(legacy, current))
+    print(f"documents with different features: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
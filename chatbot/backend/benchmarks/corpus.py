@@ -0,0 +1,28 @@
+from typing import List
+import numpy as np
+
+_COMMON_WORDS = (
+    "the a to and of is in it you for on that with are your this our can be "
+    "we have will not at please from or if do my how what when price hours order "
+    "delivery refund account password reset help support plan monthly free"
+).split()
+_PUNCTUATION = np.array(["", "", "", "", ",", ".", "?", "!"])
+
+
+def synthetic_scripts(n_docs: int, seed: int = 0, vocabulary_size: int = 20000,
+                      min_words: int = 10, max_words: int = 120) -> List[str]:
+    """Generate script-like documents with a Zipf-distributed vocabulary and punctuation"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(_COMMON_WORDS + [f"word{i}" for i in range(vocabulary_size)])
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    lengths = rng.integers(min_words, max_words + 1, size=n_docs)
+    words = vocabulary[rng.choice(len(vocabulary), size=lengths.sum(), p=weights)]
+    marks = _PUNCTUATION[rng.integers(0, len(_PUNCTUATION), size=lengths.sum())]
+    tokens = np.char.add(words, marks)
+    # Capitalize the first word of each document like a sentence
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return [
+        " ".join(tokens[start:end]).capitalize()
+        for start, end in zip(offsets[:-1], offsets[1:])
+    ]
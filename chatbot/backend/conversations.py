@@ -0,0 +1,102 @@
+from collections import OrderedDict
+import os
+import threading
+from sqlalchemy.exc import IntegrityError
+import models
+
+# Conversation ids remembered per (platform, user_id, bot_id), least recently used evicted first
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "100000"))
+
+
+class ConversationCache:
+    """Bounded LRU map from (platform, user_id, bot_id) to conversation id.
+
+    Conversations are never re-keyed, so an entry stays valid for as long
+    as it is cached.
+    """
+
+    def __init__(self, max_entries: int = CONVERSATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        with self._lock:
+            conversation_id = self._entries.get(key)
+            if conversation_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return conversation_id
+
+    def put(self, key: tuple, conversation_id: int):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = conversation_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+conversation_cache = ConversationCache()
+
+
+def _insert_ignoring_conflict(db, platform: str, user_id: str, bot_id: int):
+    values = {"platform": platform, "user_id": user_id, "bot_id": bot_id}
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # No ON CONFLICT: rely on the unique index and treat a violation as "already there"
+        try:
+            with db.begin_nested():
+                db.add(models.Conversation(**values))
+        except IntegrityError:
+            pass
+        return
+    db.execute(
+        insert(models.Conversation).values(**values).on_conflict_do_nothing(
+            index_elements=["platform", "user_id", "bot_id"]
+        )
+    )
+
+
+def get_or_create_conversation_id(db, platform: str, user_id: str, bot_id: int) -> int:
+    """Id of the conversation between a platform user and a bot, created atomically on first contact.
+
+    Returning users are answered from conversation_cache without touching
+    the database. Otherwise the row is looked up, and only if it is missing
+    inserted with ON CONFLICT DO NOTHING against the unique
+    (platform, user_id, bot_id) index, so concurrent first messages from
+    any number of processes end up in the same conversation.
+    """
+    key = (platform, user_id, bot_id)
+    conversation_id = conversation_cache.get(key)
+    if conversation_id is not None:
+        return conversation_id
+
+    lookup = db.query(models.Conversation.id).filter(
+        models.Conversation.platform == platform,
+        models.Conversation.user_id == user_id,
+        models.Conversation.bot_id == bot_id
+    )
+    conversation_id = lookup.scalar()
+    if conversation_id is None:
+        _insert_ignoring_conflict(db, platform, user_id, bot_id)
+        db.commit()
+        conversation_id = lookup.scalar()
+    conversation_cache.put(key, conversation_id)
+    return conversation_id
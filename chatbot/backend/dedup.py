@@ -0,0 +1,162 @@
+from hashlib import blake2b
+from typing import Optional, Tuple
+import os
+import zlib
+import numpy as np
+from sqlalchemy import and_, or_
+from tokenizer import tokenize
+import models
+
+# Estimated Jaccard similarity of word shingles at which an upload counts as a duplicate
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# What an upload that duplicates an existing script does by default: 'reject', 'merge' or 'flag'
+DEDUP_MODE = os.getenv("DEDUP_MODE", "flag")
+DEDUP_MODES = ("reject", "merge", "flag")
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+# LSH banding: scripts become candidates when all rows of any band agree.
+# 16 bands of 8 rows make candidates likely from about 0.7 similarity upwards.
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 31) - 1
+# Fixed seed: signatures are persisted, so the permutations must never change
+_rng = np.random.default_rng(20240331)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of the text's word shingles, or None for text without words"""
+    tokens = tokenize(text)
+    if not tokens:
+        return None
+    size = min(SHINGLE_SIZE, len(tokens))
+    shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # a * x + b stays below 2**63 since a < 2**31 and x < 2**32
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return float(np.mean(a == b))
+
+
+def band_buckets(signature: np.ndarray):
+    """(band, bucket) pairs of a signature; equal buckets in a band mean equal rows"""
+    rows = signature.reshape(BANDS, ROWS)
+    return [
+        (band, int.from_bytes(blake2b(rows[band].tobytes(), digest_size=8).digest(), "big", signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def lock_bot(db, bot_id: int) -> Optional[models.Bot]:
+    """Lock the bot's row until the transaction ends, serializing changes to its scripts.
+
+    Uploads check for duplicates and index the new script under this lock,
+    so two concurrent copies cannot both miss each other. SQLite has no row
+    locks and serializes writers on its own.
+    """
+    return db.query(models.Bot).filter(models.Bot.id == bot_id).with_for_update().first()
+
+
+def find_duplicate(db, bot_id: int, signature: np.ndarray, threshold: float = None) -> Optional[Tuple[int, float]]:
+    """Return (script_id, similarity) of the bot's most similar indexed script above threshold.
+
+    Only scripts sharing an LSH bucket with the signature are compared, found
+    through the (bot_id, band, bucket) index, so the cost does not grow with
+    the number of scripts the bot has.
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    candidate_ids = {
+        script_id for (script_id,) in db.query(models.ScriptBand.script_id).filter(
+            models.ScriptBand.bot_id == bot_id,
+            or_(*(
+                and_(models.ScriptBand.band == band, models.ScriptBand.bucket == bucket)
+                for band, bucket in band_buckets(signature)
+            ))
+        ).distinct()
+    }
+    if not candidate_ids:
+        return None
+    best = None
+    for script_id, stored in db.query(models.ScriptSignature.script_id, models.ScriptSignature.signature).filter(
+        models.ScriptSignature.script_id.in_(candidate_ids)
+    ):
+        score = similarity(signature, np.frombuffer(stored, dtype=np.uint32))
+        if score >= threshold and (best is None or score > best[1]):
+            best = (script_id, score)
+    return best
+
+
+def index_script(db, script: models.Script, signature: np.ndarray = None):
+    """Add a script's signature and LSH buckets to its bot's index (not committed)"""
+    if signature is None:
+        signature = minhash(script.content or "")
+    if signature is None:
+        return
+    db.add(models.ScriptSignature(script_id=script.id, bot_id=script.bot_id, signature=signature.tobytes()))
+    db.add_all(
+        models.ScriptBand(bot_id=script.bot_id, band=band, bucket=bucket, script_id=script.id)
+        for band, bucket in band_buckets(signature)
+    )
+
+
+def unindex_script(db, script_id: int):
+    """Remove a script from its bot's index (not committed)"""
+    db.query(models.ScriptBand).filter(models.ScriptBand.script_id == script_id).delete(synchronize_session=False)
+    db.query(models.ScriptSignature).filter(models.ScriptSignature.script_id == script_id).delete(synchronize_session=False)
+
+
+def supersede(db, old: models.Script, new: models.Script, signature: np.ndarray = None):
+    """Make new the indexed, trained copy of old's content; old and its duplicates point to new"""
+    db.query(models.Script).filter(models.Script.duplicate_of == old.id).update(
+        {models.Script.duplicate_of: new.id}, synchronize_session=False
+    )
+    old.duplicate_of = new.id
+    unindex_script(db, old.id)
+    index_script(db, new, signature)
+
+
+def release_duplicates(db, script: models.Script):
+    """Before deleting a script, promote its oldest flagged duplicate in its place (not committed)"""
+    unindex_script(db, script.id)
+    duplicates = db.query(models.Script).filter(
+        models.Script.duplicate_of == script.id
+    ).order_by(models.Script.id).all()
+    if not duplicates:
+        return None
+    promoted, rest = duplicates[0], duplicates[1:]
+    promoted.duplicate_of = None
+    for duplicate in rest:
+        duplicate.duplicate_of = promoted.id
+    index_script(db, promoted)
+    return promoted
+
+
+def backfill(db, bot_id: int) -> int:
+    """Index the bot's trained scripts that have no signature yet, e.g. ones uploaded before dedup existed.
+
+    Flushed so duplicate checks in the same transaction see them, but not committed.
+    """
+    missing = db.query(models.Script).outerjoin(
+        models.ScriptSignature, models.ScriptSignature.script_id == models.Script.id
+    ).filter(
+        models.Script.bot_id == bot_id,
+        models.Script.duplicate_of.is_(None),
+        models.ScriptSignature.script_id.is_(None)
+    ).order_by(models.Script.id).all()
+    for script in missing:
+        index_script(db, script)
+    db.flush()
+    return len(missing)
+
+
+def backfill_if_unindexed(db, bot_id: int) -> int:
+    """Backfill the bot's index when it is empty, as it is for bots whose scripts predate dedup"""
+    indexed = db.query(models.ScriptSignature.script_id).filter(models.ScriptSignature.bot_id == bot_id).first()
+    return 0 if indexed is not None else backfill(db, bot_id)
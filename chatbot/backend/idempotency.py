@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from typing import Iterable, List
+import os
+import time
+import threading
+
+# Platform message ids remembered for spotting redeliveries, oldest evicted first
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "200000"))
+# Seconds an id is remembered; later redeliveries are caught by the unique messages column instead
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+
+class IdempotencyStore:
+    """Bounded TTL set of (platform, bot_id, platform message id) keys already accepted.
+
+    claim() checks and records keys in one step under a lock, so of two
+    concurrent deliveries of the same message exactly one gets it.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> expires_at, oldest first
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+
+    def claim(self, keys: Iterable[tuple]) -> List[bool]:
+        """For each key, True if it is new (and now recorded), False if it was already seen"""
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            # Entries share one TTL, so the expired ones are at the front
+            while self._entries and next(iter(self._entries.values())) <= now:
+                self._entries.popitem(last=False)
+            for key in keys:
+                self.checked += 1
+                if key in self._entries:
+                    self.duplicates += 1
+                    results.append(False)
+                    continue
+                self._entries[key] = now + self.ttl
+                results.append(True)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results
+
+    def release(self, keys: Iterable[tuple]):
+        """Forget claimed keys whose messages were not accepted after all, so a retry gets through"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / self.checked if self.checked else 0.0
+        }
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,119 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Size of the hashed feature space; large enough that collisions are rare for n-gram vocabularies
+HASH_FEATURES = 2 ** 18
+
+
+class IncrementalTfidfVectorizer:
+    """TF-IDF over a hashed vocabulary whose document frequencies can be updated in place.
+
+    Unlike TfidfVectorizer, nothing here depends on the whole corpus except the
+    document-frequency vector, so scripts can be added or removed by tokenizing
+    only those scripts and adjusting the counts.
+
+    Raw counts (count, add_counts, remove_counts) are in the hashed feature
+    space. Only the features that occur in the corpus get a column of the
+    weighted matrices, so per-model arrays grow with the vocabulary rather
+    than with n_features.
+    """
+
+    def __init__(self, analyzer="word", n_features: int = HASH_FEATURES):
+        self.analyzer = analyzer
+        self.n_features = n_features
+        self._hasher = HashingVectorizer(
+            analyzer=analyzer,
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32
+        )
+        self.set_frequencies(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0)
+
+    def set_frequencies(self, columns, df, n_docs: int, idf=None):
+        """Use the given hashed features (sorted), their document frequencies and IDF weights"""
+        self.columns = columns
+        self.df = df
+        self.n_docs = n_docs
+        # Same smoothed formula as sklearn's TfidfTransformer, computed once per change of the counts
+        self._idf = np.log((1 + n_docs) / (1 + df)) + 1 if idf is None else idf
+
+    @property
+    def idf_(self):
+        return self._idf
+
+    def arrays(self) -> tuple:
+        return self.columns, self.df, self._idf
+
+    def count(self, texts) -> csr_matrix:
+        """Raw term counts for texts, one row per text"""
+        return self._hasher.transform(texts).tocsr()
+
+    def add_counts(self, counts: csr_matrix):
+        self._update(counts, 1)
+
+    def remove_counts(self, counts: csr_matrix):
+        self._update(counts, -1)
+
+    def _update(self, counts: csr_matrix, sign: int):
+        # Rows hold each feature at most once, so occurrences are document frequencies
+        features, frequencies = np.unique(counts.indices, return_counts=True)
+        columns = np.union1d(self.columns, features)
+        df = np.zeros(len(columns), dtype=np.int64)
+        df[np.searchsorted(columns, self.columns)] = self.df
+        df[np.searchsorted(columns, features)] += sign * frequencies
+        present = df > 0
+        self.set_frequencies(columns[present], df[present], self.n_docs + sign * counts.shape[0])
+
+    def weight(self, counts: csr_matrix) -> csr_matrix:
+        """Apply the current IDF weights and L2-normalize each row, keeping the sparsity pattern.
+
+        counts are raw counts of documents in the corpus, so every feature has a
+        column. Weights are computed in float64 and stored as float32, like
+        TfidfVectorizer's output.
+        """
+        columns = np.searchsorted(self.columns, counts.indices)
+        data = self._normalize(counts.data * self._idf[columns], counts.indptr)
+        return csr_matrix((data.astype(np.float32), columns, counts.indptr), shape=(counts.shape[0], len(self.columns)))
+
+    def fit_count(self, texts) -> csr_matrix:
+        """Reset document frequencies to those of texts and return their term counts"""
+        self.set_frequencies(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0)
+        counts = self.count(texts)
+        self.add_counts(counts)
+        return counts
+
+    def transform(self, texts) -> csr_matrix:
+        """Weighted rows for texts outside the corpus, over the corpus columns.
+
+        Features the corpus lacks (df = 0) still count towards each row's norm,
+        as in a full hashed space, but have no column to be stored in.
+        """
+        counts = self.count(texts)
+        positions = np.searchsorted(self.columns, counts.indices)
+        known = positions < len(self.columns)
+        known[known] = self.columns[positions[known]] == counts.indices[known]
+        idf = np.full(counts.nnz, np.log(1 + self.n_docs) + 1)
+        idf[known] = self._idf[positions[known]]
+        data = self._normalize(counts.data * idf, counts.indptr)
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        indptr = np.zeros(counts.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[known], minlength=counts.shape[0]), out=indptr[1:])
+        return csr_matrix(
+            (data[known].astype(np.float32), positions[known], indptr),
+            shape=(counts.shape[0], len(self.columns))
+        )
+
+    @staticmethod
+    def _normalize(data, indptr):
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=len(indptr) - 1))
+        norms[norms == 0] = 1.0
+        return data / norms[rows]
+
+    def copy(self):
+        clone = IncrementalTfidfVectorizer(self.analyzer, self.n_features)
+        # Updates replace the arrays rather than writing into them, so they can be shared
+        clone.set_frequencies(self.columns, self.df, self.n_docs, self._idf)
+        return clone
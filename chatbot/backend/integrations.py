@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import os
+import time
+import threading
+from sqlalchemy import and_
+from database import SessionLocal
+import models
+
+# Seconds a bot's platform credentials are used before being read again; bounds
+# how long other processes keep using credentials changed through the API
+INTEGRATION_CACHE_TTL_SECONDS = float(os.getenv("INTEGRATION_CACHE_TTL_SECONDS", "60"))
+# (bot, platform) entries kept, least recently used evicted first; unknown bot ids are
+# remembered in a separate LRU of the same size
+INTEGRATION_CACHE_SIZE = int(os.getenv("INTEGRATION_CACHE_SIZE", "10000"))
+
+
+class Credentials(NamedTuple):
+    account_id: Optional[str] = None
+    access_token: Optional[str] = None
+    webhook_secret: Optional[str] = None  # verifies the platform's webhook requests
+
+
+class IntegrationCache:
+    """Bounded LRU cache with a TTL of each bot's platform credentials, including the absence of any.
+
+    Lookups answer None for a bot that does not exist and empty Credentials
+    for a bot without an integration on the platform, so webhooks learn
+    both from one cached entry. Webhook routes are unauthenticated, so
+    unknown bot ids get their own LRU: a flood of made-up ids cannot grow
+    the cache or push out the credentials of real bots.
+    """
+
+    def __init__(self, ttl: float = INTEGRATION_CACHE_TTL_SECONDS, max_entries: int = INTEGRATION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (bot_id, platform) -> (Credentials, expires_at), least recently used first
+        self._missing = OrderedDict()  # (bot_id, platform) of unknown bots -> (None, expires_at)
+        self._lock = threading.Lock()
+
+    def cached(self, bot_id: int, platform: str):
+        """Return (found, credentials) without touching the database"""
+        key = (bot_id, platform)
+        with self._lock:
+            for entries in (self._entries, self._missing):
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= time.monotonic():
+                    del entries[key]
+                    break
+                entries.move_to_end(key)
+                return True, entry[0]
+        return False, None
+
+    def get(self, bot_id: int, platform: str) -> Optional[Credentials]:
+        """The bot's credentials for platform, or None when there is no such bot"""
+        found, credentials = self.cached(bot_id, platform)
+        if found:
+            return credentials
+        db = SessionLocal()
+        try:
+            row = db.query(models.Bot.id, models.BotIntegration).outerjoin(
+                models.BotIntegration,
+                and_(models.BotIntegration.bot_id == models.Bot.id, models.BotIntegration.platform == platform)
+            ).filter(models.Bot.id == bot_id).first()
+            if row is None:
+                credentials = None
+            elif row[1] is None:
+                credentials = Credentials()
+            else:
+                integration = row[1]
+                credentials = Credentials(integration.account_id, integration.access_token, integration.webhook_secret)
+        finally:
+            db.close()
+        entries = self._missing if credentials is None else self._entries
+        with self._lock:
+            entries[(bot_id, platform)] = (credentials, time.monotonic() + self.ttl)
+            entries.move_to_end((bot_id, platform))
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        return credentials
+
+    def invalidate(self, bot_id: int):
+        with self._lock:
+            for entries in (self._entries, self._missing):
+                for key in [key for key in entries if key[0] == bot_id]:
+                    del entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._missing.clear()
+
+    def __len__(self):
+        return len(self._entries) + len(self._missing)
+
+
+integration_cache = IntegrationCache()
@@ -3,10 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from database import SessionLocal, engine, Base
 import models
 import schemas
+from routers.admin import router as admin_router
 from routers.auth import router as auth_router
 from routers.bots import router as bots_router
 from routers.scripts import router as scripts_router
-from routers.social_media import router as social_media_router
+from routers.webhooks import router as webhooks_router
+from training_scheduler import scheduler
+from pipeline import pipeline
+from message_writer import message_writer
+from outbound import outbound
 
 app = FastAPI(title="AI Chatbot API")
 
@@ -23,11 +28,26 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(bots_router)
 app.include_router(scripts_router)
-app.include_router(social_media_router)
+app.include_router(webhooks_router)
+app.include_router(admin_router)
 
 @app.on_event("startup")
 async def startup():
     models.Base.metadata.create_all(bind=engine)
+    # Fork the training workers before the other services start threads
+    scheduler.start()
+    pipeline.start()
+    outbound.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Finish queued webhook messages before the process exits
+    await pipeline.drain()
+    # Send the replies they produced
+    await outbound.drain()
+    # Then commit the messages still buffered for write-behind
+    message_writer.close()
+    scheduler.shutdown()
 
 @app.get("/")
 async def root():
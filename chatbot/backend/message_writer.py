@@ -0,0 +1,225 @@
+from datetime import datetime
+from typing import List
+import os
+import time
+import threading
+import logging
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+import models
+
+# A buffered batch is written once it is this old...
+MESSAGE_FLUSH_INTERVAL_MS = float(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "50"))
+# ...or has this many rows, whichever comes first
+MESSAGE_FLUSH_ROWS = int(os.getenv("MESSAGE_FLUSH_ROWS", "500"))
+# 'batch': writers wait until their rows are committed with the rest of the batch (group commit)
+# 'async': writers return at once; rows buffered at a crash are lost
+# 'sync':  every write is committed on its own, as before batching
+MESSAGE_DURABILITY = os.getenv("MESSAGE_DURABILITY", "batch")
+
+
+def message_row(conversation_id: int, content: str, is_from_user: bool, platform_message_id: str = None) -> dict:
+    # Every row has every key: a bulk insert takes its columns from the first row
+    return {
+        "conversation_id": conversation_id,
+        "content": content,
+        "is_from_user": is_from_user,
+        "timestamp": datetime.utcnow(),
+        "platform_message_id": platform_message_id
+    }
+
+
+def _insert_statement(db):
+    """INSERT into messages that skips rows whose platform message id is already stored"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(models.Message)
+    return dialect_insert(models.Message).on_conflict_do_nothing()
+
+
+def claim_messages(db, rows: List[dict]) -> set:
+    """Insert inbound rows and commit them now; return the platform message ids that were new.
+
+    A redelivery finds its id stored, even while another worker is still
+    answering the first delivery, so only one of them gets the id.
+    """
+    if not rows:
+        return set()
+    if db.get_bind().dialect.name in ("postgresql", "sqlite"):
+        claimed = set(db.scalars(_insert_statement(db).returning(models.Message.platform_message_id), rows))
+    else:
+        # No ON CONFLICT: rely on the unique index and treat a violation as "already there"
+        claimed = set()
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.add(models.Message(**row))
+                claimed.add(row["platform_message_id"])
+            except IntegrityError:
+                pass
+    db.commit()
+    return claimed
+
+
+def release_messages(db, conversation_id: int, platform_message_ids: List[str]):
+    """Delete claimed inbound rows and commit, so redeliveries of those messages are claimed again"""
+    if not platform_message_ids:
+        return
+    db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id,
+        models.Message.is_from_user.is_(True),
+        models.Message.platform_message_id.in_(platform_message_ids)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+class _Batch:
+    def __init__(self):
+        self.rows = []
+        self.done = threading.Event()
+        self.error = None
+        self.started = None  # when the first row arrived
+
+
+class MessageWriter:
+    """Write-behind buffer that turns Message inserts from many requests into bulk inserts.
+
+    Rows are collected across threads and written by a background thread as
+    one INSERT and one commit per batch, every flush_interval_ms or
+    flush_rows rows. Rows are written in the order they were added.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: float = MESSAGE_FLUSH_INTERVAL_MS,
+        flush_rows: int = MESSAGE_FLUSH_ROWS,
+        durability: str = MESSAGE_DURABILITY
+    ):
+        if durability not in ("batch", "async", "sync"):
+            raise ValueError(f"Unknown message durability '{durability}'")
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_rows = flush_rows
+        self.durability = durability
+        self._cond = threading.Condition()
+        self._batch = _Batch()
+        self._thread = None
+        self._closed = False
+        self.rows_written = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def write(self, rows: List[dict]):
+        """Insert Message rows according to the durability setting.
+
+        With 'batch' and 'sync' durability this returns once the rows are
+        committed and raises if they could not be; with 'async' it returns
+        at once.
+        """
+        if not rows:
+            return
+        if self.durability == "sync":
+            self._insert(rows)
+            return
+        with self._cond:
+            # close() sets _closed under this lock, so rows buffered before then are in the
+            # batch it flushes, and later ones go straight to the database
+            closed = self._closed
+            if not closed:
+                batch = self._batch
+                first = not batch.rows
+                if first:
+                    # The flush deadline counts from the batch's first row
+                    batch.started = time.monotonic()
+                batch.rows.extend(rows)
+                self._ensure_started()
+                if first or len(batch.rows) >= self.flush_rows:
+                    self._cond.notify_all()
+        if closed:
+            self._insert(rows)
+            return
+        if self.durability == "batch":
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+
+    def flush(self):
+        """Write everything buffered so far"""
+        with self._cond:
+            batch, self._batch = self._batch, _Batch()
+        self._write_batch(batch)
+
+    def close(self):
+        """Flush buffered rows and stop the background thread; later writes go straight to the database"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "durability": self.durability,
+                "buffered": len(self._batch.rows),
+                "rows_written": self.rows_written,
+                "flushes": self.flushes,
+                "mean_batch_rows": self.rows_written / self.flushes if self.flushes else 0.0,
+                "errors": self.errors
+            }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="message-writer", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    rows = len(self._batch.rows)
+                    if rows >= self.flush_rows:
+                        break
+                    if rows:
+                        remaining = self._batch.started + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        # Nothing buffered: sleep until write() adds rows
+                        self._cond.wait()
+                if self._closed:
+                    return
+                batch, self._batch = self._batch, _Batch()
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: _Batch):
+        if batch.rows:
+            try:
+                self._insert(batch.rows)
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                batch.error = e
+                logging.error(f"Writing {len(batch.rows)} messages failed: {str(e)}")
+        batch.done.set()
+
+    def _insert(self, rows: List[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(_insert_statement(db), rows)
+            db.commit()
+        finally:
+            db.close()
+        with self._cond:
+            self.rows_written += len(rows)
+            self.flushes += 1
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,114 @@
+"""Bring a database created by an earlier release up to date with models.py.
+
+create_all (run at startup) creates missing tables, such as bot_integrations,
+script_signatures, script_lsh_bands and training_jobs, but never changes
+tables that already exist. This adds their new columns and indexes. Run it
+once from the backend directory, before starting the new release:
+
+    python migrate.py
+    python migrate.py --dry-run
+
+Every step is skipped when the database already has it, so it is safe to
+run again.
+"""
+from typing import List
+import argparse
+import sys
+import logging
+from sqlalchemy import func, inspect, select, text
+from database import Base, engine
+import models
+
+# Columns added to tables that existed before, as (table, column, DDL type and default)
+COLUMNS = [
+    ("bots", "model_version", "INTEGER DEFAULT 0"),
+    ("bots", "response_threshold", "FLOAT DEFAULT 0.3"),
+    ("scripts", "duplicate_of", "INTEGER REFERENCES scripts(id)"),
+    ("messages", "platform_message_id", "VARCHAR(200)"),
+]
+# Tables whose indexes (as declared in models.py) may be missing
+INDEXED_TABLES = ("scripts", "conversations", "messages")
+
+
+def merge_duplicate_conversations(conn) -> int:
+    """Move messages of repeated (platform, user_id, bot_id) conversations into the oldest one.
+
+    The unique conversation index cannot be created while duplicates exist;
+    they come from concurrent first messages before it did. Returns the
+    number of conversations removed.
+    """
+    conversations = models.Conversation.__table__
+    messages = models.Message.__table__
+    key = (conversations.c.platform, conversations.c.user_id, conversations.c.bot_id)
+    groups = conn.execute(
+        select(*key, func.min(conversations.c.id)).group_by(*key).having(func.count() > 1)
+    ).all()
+    removed = 0
+    for platform, user_id, bot_id, keep_id in groups:
+        duplicate_ids = conn.execute(
+            select(conversations.c.id).where(
+                conversations.c.platform == platform,
+                conversations.c.user_id == user_id,
+                conversations.c.bot_id == bot_id,
+                conversations.c.id != keep_id
+            )
+        ).scalars().all()
+        conn.execute(
+            messages.update().where(messages.c.conversation_id.in_(duplicate_ids)).values(conversation_id=keep_id)
+        )
+        conn.execute(conversations.delete().where(conversations.c.id.in_(duplicate_ids)))
+        removed += len(duplicate_ids)
+    return removed
+
+
+def upgrade(bind=engine, dry_run: bool = False) -> List[str]:
+    """Apply the missing steps in one transaction and return what they were"""
+    steps = []
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                steps.append(f"CREATE TABLE {table.name}")
+        if not dry_run:
+            Base.metadata.create_all(bind=conn)
+        for table, column, ddl in COLUMNS:
+            if table not in existing_tables:
+                continue
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                steps.append(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+                if not dry_run:
+                    conn.execute(text(steps[-1]))
+        for table in INDEXED_TABLES:
+            if table not in existing_tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table)}
+            for index in sorted(Base.metadata.tables[table].indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    continue
+                if index.name == "ux_conversations_platform_user_bot" and not dry_run:
+                    removed = merge_duplicate_conversations(conn)
+                    if removed:
+                        steps.append(f"merged {removed} duplicate conversations")
+                steps.append(f"CREATE {'UNIQUE ' if index.unique else ''}INDEX {index.name} ON {table}")
+                if not dry_run:
+                    index.create(bind=conn)
+    return steps
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="list the missing steps without applying them")
+    args = parser.parse_args()
+
+    steps = upgrade(dry_run=args.dry_run)
+    for step in steps:
+        logging.info(f"{'Would apply' if args.dry_run else 'Applied'}: {step}")
+    if not steps:
+        logging.info("Database schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
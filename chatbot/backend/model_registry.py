@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from datetime import datetime
+import os
+import sys
+import time
+import threading
+import logging
+
+# Upper bound on the estimated memory held by cached models in this process
+MODEL_REGISTRY_MAX_BYTES = int(os.getenv("MODEL_REGISTRY_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def _is_mapped(array) -> bool:
+    """Whether an array is (a view of) a memory-mapped file, i.e. shared rather than private memory"""
+    base = array
+    while base is not None:
+        if hasattr(base, "filename"):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+def _private_nbytes(array) -> int:
+    """Bytes of an array held privately by this process; memory-mapped files count as shared"""
+    return 0 if _is_mapped(array) else array.nbytes
+
+
+def _add_arrays(footprint: dict, name: str, arrays):
+    """Count arrays towards footprint[name], or towards "mapped" for memory-mapped ones"""
+    for array in arrays:
+        if array is None:
+            continue
+        footprint["mapped" if _is_mapped(array) else name] += array.nbytes
+
+
+def _object_nbytes(obj) -> int:
+    """Approximate bytes held by a JSON-like object: dicts, lists and tuples of strings and numbers"""
+    nbytes = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        nbytes += sum(_object_nbytes(key) + _object_nbytes(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        nbytes += sum(_object_nbytes(item) for item in obj)
+    return nbytes
+
+
+def model_footprint(trainer) -> dict:
+    """Bytes held by a fitted trainer, per component.
+
+    Components count this process's private memory only; arrays mapped
+    from an artifact are reported separately under "mapped", since the page
+    cache shares them between workers.
+    """
+    footprint = {
+        "matrix": 0, "index": 0, "vectorizer": 0, "vocabulary": 0, "texts": 0, "script_ids": 0, "profile": 0, "mapped": 0
+    }
+    for matrix in (getattr(trainer, "trained_data", None), getattr(trainer, "term_counts", None)):
+        if matrix is not None:
+            _add_arrays(footprint, "matrix", (matrix.data, matrix.indices, matrix.indptr))
+    index = getattr(trainer, "_index", None)
+    if index is not None:
+        _add_arrays(footprint, "index", index.arrays().values())
+    vectorizer = trainer.vectorizer
+    # Hashed columns, document frequencies and IDF of incremental models, or the IDF vector
+    arrays = getattr(vectorizer, "arrays", None)
+    _add_arrays(footprint, "vectorizer", arrays() if arrays is not None else (getattr(vectorizer, "idf_", None),))
+    # Python containers are private; mapped stand-ins (see artifacts) expose their backing arrays
+    vocabulary = getattr(vectorizer, "vocabulary_", None)
+    if isinstance(vocabulary, dict):
+        footprint["vocabulary"] = sys.getsizeof(vocabulary) + sum(
+            sys.getsizeof(term) + sys.getsizeof(column) for term, column in vocabulary.items()
+        )
+    elif vocabulary is not None:
+        _add_arrays(footprint, "vocabulary", vocabulary.arrays())
+    texts = getattr(trainer, "raw_texts", None)
+    if isinstance(texts, list):
+        footprint["texts"] = sys.getsizeof(texts) + sum(sys.getsizeof(text) for text in texts)
+    elif texts is not None:
+        _add_arrays(footprint, "texts", texts.arrays())
+    script_ids = getattr(trainer, "script_ids", None)
+    if isinstance(script_ids, list):
+        footprint["script_ids"] = sys.getsizeof(script_ids) + sum(sys.getsizeof(i) for i in script_ids)
+    elif script_ids is not None:
+        _add_arrays(footprint, "script_ids", (script_ids,))
+    # Word counts (kept by incremental models once trained or updated) and the personality profile
+    for profile in (getattr(trainer, "word_counts", None), getattr(trainer, "personality_profile", None)):
+        if profile is not None:
+            footprint["profile"] += _object_nbytes(profile)
+    return footprint
+
+
+def estimate_model_bytes(trainer) -> int:
+    """Private memory footprint of a fitted trainer: matrices, vocabulary and texts"""
+    footprint = model_footprint(trainer)
+    return sum(nbytes for name, nbytes in footprint.items() if name != "mapped")
+
+
+class _Entry:
+    __slots__ = ("version", "trainer", "footprint", "nbytes", "loaded_at", "last_used")
+
+    def __init__(self, version: int, trainer):
+        self.version = version
+        self.trainer = trainer
+        self.footprint = model_footprint(trainer)
+        self.nbytes = sum(nbytes for name, nbytes in self.footprint.items() if name != "mapped")
+        self.loaded_at = self.last_used = time.time()
+
+
+class ModelRegistry:
+    """Process-wide LRU cache of fitted trainers keyed by bot id.
+
+    Each entry is tagged with the bot's model version; a lookup with a
+    different version is treated as a miss so retrained bots are never
+    served from a stale model. When the estimated private memory of the
+    cached models exceeds max_bytes, the least recently used bots are
+    dropped; they are reloaded from their on-disk artifacts on next use.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_REGISTRY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # bot_id -> _Entry, least recently used first
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, bot_id: int, version: int):
+        """Return the cached trainer for bot_id at version, or None"""
+        with self._lock:
+            entry = self._entries.get(bot_id)
+            if entry is None:
+                return None
+            if entry.version != version:
+                self._remove(bot_id)
+                return None
+            self._entries.move_to_end(bot_id)
+            entry.last_used = time.time()
+            return entry.trainer
+
+    def put(self, bot_id: int, version: int, trainer):
+        """Cache a fitted trainer and evict least recently used bots over budget"""
+        entry = _Entry(version, trainer)
+        with self._lock:
+            self._remove(bot_id)
+            self._entries[bot_id] = entry
+            self._total_bytes += entry.nbytes
+            self._evict()
+
+    def invalidate(self, bot_id: int):
+        """Drop any cached model for bot_id"""
+        with self._lock:
+            self._remove(bot_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def resident(self) -> list:
+        """Cached models with their footprints, most recently used first"""
+        with self._lock:
+            entries = list(reversed(self._entries.items()))
+        return [
+            {
+                "bot_id": bot_id,
+                "model_version": entry.version,
+                "bytes": entry.nbytes,
+                "footprint": dict(entry.footprint),
+                "loaded_at": datetime.fromtimestamp(entry.loaded_at),
+                "last_used": datetime.fromtimestamp(entry.last_used)
+            }
+            for bot_id, entry in entries
+        ]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, bot_id):
+        return bot_id in self._entries
+
+    def _remove(self, bot_id: int):
+        entry = self._entries.pop(bot_id, None)
+        if entry is not None:
+            self._total_bytes -= entry.nbytes
+
+    def _evict(self):
+        # The most recently added model is always kept, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            bot_id, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
+            logging.info(f"Evicted model for bot {bot_id} (version {entry.version}, {entry.nbytes} bytes)")
+
+
+registry = ModelRegistry()
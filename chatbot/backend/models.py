@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, Float, String, Text, LargeBinary, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -18,16 +18,68 @@ class Bot(Base):
     description = Column(Text)
     personality = Column(String(100))  # e.g., 'friendly', 'professional'
     owner_id = Column(Integer, ForeignKey("users.id"))
+    model_version = Column(Integer, default=0)  # bumped whenever the trained model changes
+    response_threshold = Column(Float, default=0.3)  # minimum similarity for answering with a script
     scripts = relationship("Script", back_populates="bot")
     conversations = relationship("Conversation", back_populates="bot")
+    integrations = relationship("BotIntegration", back_populates="bot")
+
+class BotIntegration(Base):
+    """A bot's account and credentials on one messaging platform"""
+    __tablename__ = "bot_integrations"
+    id = Column(Integer, primary_key=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"))
+    platform = Column(String(20))
+    account_id = Column(String(100), nullable=True)  # WhatsApp phone number id, Instagram account id
+    access_token = Column(String(500), nullable=True)  # API token replies are sent with
+    webhook_secret = Column(String(200), nullable=True)  # app secret, secret token or public key webhooks are verified with
+    bot = relationship("Bot", back_populates="integrations")
+    __table_args__ = (Index("ux_bot_integrations_bot_platform", "bot_id", "platform", unique=True),)
 
 class Script(Base):
     __tablename__ = "scripts"
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
     bot_id = Column(Integer, ForeignKey("bots.id"))
+    # Set when the script near-duplicates another one; such scripts are kept but not trained on
+    duplicate_of = Column(Integer, ForeignKey("scripts.id"), nullable=True, index=True)
     bot = relationship("Bot", back_populates="scripts")
 
+class ScriptSignature(Base):
+    """MinHash signature of a script, for near-duplicate detection"""
+    __tablename__ = "script_signatures"
+    script_id = Column(Integer, ForeignKey("scripts.id"), primary_key=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"), index=True)
+    signature = Column(LargeBinary)
+
+class ScriptBand(Base):
+    """LSH bucket of one band of a script's signature"""
+    __tablename__ = "script_lsh_bands"
+    id = Column(Integer, primary_key=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"))
+    band = Column(SmallInteger)
+    bucket = Column(BigInteger)
+    script_id = Column(Integer, ForeignKey("scripts.id"), index=True)
+    __table_args__ = (Index("ix_script_lsh_bands_lookup", "bot_id", "band", "bucket"),)
+
+class TrainingJob(Base):
+    """Status of a background training job, shared by every backend process"""
+    __tablename__ = "training_jobs"
+    id = Column(String(32), primary_key=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"), index=True)
+    status = Column(String(20))  # 'queued', 'running', 'done' or 'failed'
+    incremental = Column(Boolean)
+    warm = Column(Boolean, default=False)  # only publishes the current version; trains no new scripts
+    requests = Column(Integer, default=1)
+    queued_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+    duration_seconds = Column(Float, nullable=True)
+    corpus_size = Column(Integer, nullable=True)
+    model_version = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    revision = Column(Integer, default=0)  # a write older than the stored row is ignored
+
 class Conversation(Base):
     __tablename__ = "conversations"
     id = Column(Integer, primary_key=True, index=True)
@@ -36,6 +88,7 @@ class Conversation(Base):
     bot_id = Column(Integer, ForeignKey("bots.id"))
     bot = relationship("Bot", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation")
+    __table_args__ = (Index("ux_conversations_platform_user_bot", "platform", "user_id", "bot_id", unique=True),)
 
 class Message(Base):
     __tablename__ = "messages"
@@ -44,4 +97,9 @@ class Message(Base):
     is_from_user = Column(Boolean)
     timestamp = Column(DateTime, default=datetime.utcnow)
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    platform_message_id = Column(String(200), nullable=True)  # the platform's id for an inbound message
+    conversation = relationship("Conversation", back_populates="messages")
+    # A redelivered platform message can't be stored twice
+    __table_args__ = (
+        Index("ux_messages_conversation_platform_message", "conversation_id", "platform_message_id", unique=True),
+    )
\ No newline at end of file
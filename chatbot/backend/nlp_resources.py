@@ -0,0 +1,16 @@
+from functools import lru_cache
+import os
+
+# Vendored NLP data, read from disk on first use and never downloaded
+NLP_DATA_DIR = os.getenv(
+    "NLP_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "nlp_data")
+)
+
+
+@lru_cache(maxsize=None)
+def get_stopwords(language: str = "english") -> frozenset:
+    """Stop words for language, loaded once per process from the vendored NLTK list"""
+    path = os.path.join(NLP_DATA_DIR, "stopwords", language)
+    with open(path, encoding="utf-8") as f:
+        return frozenset(word.strip() for word in f if word.strip())
@@ -0,0 +1,342 @@
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+import asyncio
+import os
+import random
+import time
+import logging
+import httpx
+from integrations import integration_cache
+
+# Replies waiting to be sent; delivering blocks beyond this, which backs up the message pipeline
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000"))
+# Concurrent sends, sharing one pooled keep-alive HTTP client
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "32"))
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "100"))
+OUTBOUND_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_TIMEOUT_SECONDS", "10"))
+# Retries after 429s, 5xx responses and failures to connect, with jittered exponential backoff
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+OUTBOUND_BACKOFF_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_SECONDS", "0.5"))
+OUTBOUND_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_MAX_SECONDS", "30"))
+# Per-bot rate limit buckets kept per process, least recently used dropped first
+OUTBOUND_BOT_BUCKETS = int(os.getenv("OUTBOUND_BOT_BUCKETS", "10000"))
+# On shutdown, queued replies are sent for at most this long
+OUTBOUND_DRAIN_SECONDS = float(os.getenv("OUTBOUND_DRAIN_SECONDS", "10"))
+
+# Platform API base URLs, overridable for staging and for tests
+API_URLS = {
+    "whatsapp": os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v17.0"),
+    "telegram": os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"),
+    "instagram": os.getenv("INSTAGRAM_API_URL", "https://graph.facebook.com/v17.0"),
+    "discord": os.getenv("DISCORD_API_URL", "https://discord.com/api/v10"),
+}
+
+
+class RateLimit(NamedTuple):
+    """Token bucket settings: sustained requests per second and burst size"""
+    rate: float
+    burst: int
+
+
+# Send quotas. Per bot they follow each API's limit for one account: WhatsApp
+# Cloud API 80 messages/s per phone number, Telegram 30 messages/s per bot
+# token, Instagram 100 sends/s per account, Discord 50 requests/s per
+# application. Per platform they cap what this process sends in total.
+RATE_LIMITS = {
+    "whatsapp": {"platform": RateLimit(1000, 1000), "bot": RateLimit(80, 80)},
+    "telegram": {"platform": RateLimit(1000, 1000), "bot": RateLimit(30, 30)},
+    "instagram": {"platform": RateLimit(1000, 1000), "bot": RateLimit(100, 100)},
+    "discord": {"platform": RateLimit(1000, 1000), "bot": RateLimit(50, 50)},
+}
+
+
+# Failures that happen before the request is sent, so retrying cannot deliver a reply twice.
+# A read timeout or dropped connection may come after the platform accepted the message.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class SendQueueFull(Exception):
+    """The outbound queue cannot take more replies right now"""
+
+
+class TokenBucket:
+    """Asyncio token bucket; pause() holds every caller back, e.g. for a 429's Retry-After"""
+
+    def __init__(self, limit: RateLimit):
+        self.rate = limit.rate
+        self.burst = limit.burst
+        self._tokens = float(limit.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class OutboundMessage(NamedTuple):
+    platform: str
+    bot_id: int
+    user_id: str
+    text: str
+    reply_to: Optional[str] = None  # platform handle for answering this message, e.g. a Discord interaction
+    on_failure: Optional[Callable[[], None]] = None  # blocking call made (on a thread) when the reply is not sent
+
+
+def build_request(message: OutboundMessage, credentials, base_url: str):
+    """(method, url, headers, json) sending message on its platform, or None without usable credentials"""
+    platform = message.platform
+    if platform == "discord":
+        # Completes the deferred interaction response; the interaction token authorizes it
+        if not message.reply_to:
+            return None
+        return "PATCH", f"{base_url}/webhooks/{message.reply_to}/messages/@original", {}, {"content": message.text}
+    if credentials is None or not credentials.access_token:
+        return None
+    if platform == "telegram":
+        return "POST", f"{base_url}/bot{credentials.access_token}/sendMessage", {}, {
+            "chat_id": message.user_id, "text": message.text
+        }
+    if not credentials.account_id:
+        return None
+    headers = {"Authorization": f"Bearer {credentials.access_token}"}
+    if platform == "whatsapp":
+        return "POST", f"{base_url}/{credentials.account_id}/messages", headers, {
+            "messaging_product": "whatsapp", "to": message.user_id, "type": "text", "text": {"body": message.text}
+        }
+    if platform == "instagram":
+        return "POST", f"{base_url}/{credentials.account_id}/messages", headers, {
+            "recipient": {"id": message.user_id}, "message": {"text": message.text}
+        }
+    return None
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds the platform asks us to wait, from the Retry-After header or the JSON body"""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    if isinstance(body, dict):
+        # Discord: {"retry_after": 1.5}, Telegram: {"parameters": {"retry_after": 3}}
+        value = body.get("retry_after") or (body.get("parameters") or {}).get("retry_after")
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+class OutboundSender:
+    """Bounded queue of replies sent to the platform APIs by a pool of worker coroutines.
+
+    All sends share one httpx.AsyncClient, so connections are pooled and
+    kept alive per API host. Each send takes a token from its platform's
+    bucket and from its bot's bucket for that platform. A 429 pauses the
+    bot's bucket for the Retry-After the platform asked for; 429s, 5xx
+    responses and failures to connect are retried with full-jitter
+    exponential backoff. Other 4xx responses are not retried, nor are errors
+    after the request may have reached the platform, such as read timeouts.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = OUTBOUND_QUEUE_SIZE,
+        workers: int = OUTBOUND_WORKERS,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+        backoff: float = OUTBOUND_BACKOFF_SECONDS,
+        backoff_max: float = OUTBOUND_BACKOFF_MAX_SECONDS,
+        api_urls: Dict[str, str] = None,
+        rate_limits: dict = None,
+        integrations=integration_cache,
+        max_bot_buckets: int = OUTBOUND_BOT_BUCKETS
+    ):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.api_urls = api_urls or API_URLS
+        self.rate_limits = rate_limits or RATE_LIMITS
+        self.integrations = integrations
+        self.max_bot_buckets = max_bot_buckets
+        self._queue = None
+        self._client = None
+        self._tasks = []
+        self._buckets = {}  # platform -> TokenBucket
+        self._bot_buckets = OrderedDict()  # (platform, bot_id) -> TokenBucket, least recently used first
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.skipped = 0
+        self._send_seconds = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Open the HTTP client and start the workers on the running event loop"""
+        if self.started:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._client = httpx.AsyncClient(
+            timeout=OUTBOUND_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=OUTBOUND_MAX_CONNECTIONS, max_keepalive_connections=OUTBOUND_MAX_CONNECTIONS)
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def send(self, message: OutboundMessage):
+        """Queue a reply, waiting while the queue is full"""
+        self.start()
+        await self._queue.put(message)
+
+    def send_nowait(self, message: OutboundMessage):
+        """Queue a reply without waiting; raises SendQueueFull when the queue is full"""
+        self.start()
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            raise SendQueueFull("Outbound queue is at capacity")
+
+    async def drain(self, timeout: float = OUTBOUND_DRAIN_SECONDS):
+        """Send the queued replies (up to timeout), then stop the workers and close the client"""
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Outbound drain timed out with {self._queue.qsize()} replies unsent")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._client.aclose()
+
+    def metrics(self) -> dict:
+        attempted = self.sent + self.failed
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "capacity": self.maxsize,
+            "workers": self.workers,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "skipped": self.skipped,
+            "mean_send_ms": self._send_seconds / attempted * 1000 if attempted else 0.0
+        }
+
+    def _bucket(self, platform: str, bot_id: int = None) -> TokenBucket:
+        if bot_id is None:
+            bucket = self._buckets.get(platform)
+            if bucket is None:
+                bucket = self._buckets[platform] = TokenBucket(self.rate_limits[platform]["platform"])
+            return bucket
+        key = (platform, bot_id)
+        bucket = self._bot_buckets.get(key)
+        if bucket is None:
+            bucket = self._bot_buckets[key] = TokenBucket(self.rate_limits[platform]["bot"])
+            # A bot idle long enough to be dropped has a full bucket again anyway
+            while len(self._bot_buckets) > self.max_bot_buckets:
+                self._bot_buckets.popitem(last=False)
+        else:
+            self._bot_buckets.move_to_end(key)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                if not await self._send(message):
+                    await self._failed(message)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Sending {message.platform} reply for bot {message.bot_id} failed: {str(e)}")
+                await self._failed(message)
+            finally:
+                self._queue.task_done()
+
+    async def _failed(self, message: OutboundMessage):
+        if message.on_failure is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, message.on_failure)
+
+    async def _credentials(self, message: OutboundMessage):
+        found, credentials = self.integrations.cached(message.bot_id, message.platform)
+        if found:
+            return credentials
+        # A cache miss reads the database, which must not block the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.integrations.get, message.bot_id, message.platform)
+
+    async def _send(self, message: OutboundMessage) -> bool:
+        """Send message with retries; False when it failed (replies that cannot be sent are skipped)"""
+        if message.platform not in self.rate_limits:
+            self.skipped += 1
+            return True
+        credentials = None if message.platform == "discord" else await self._credentials(message)
+        request = build_request(message, credentials, self.api_urls[message.platform])
+        if request is None:
+            self.skipped += 1
+            logging.warning(f"Bot {message.bot_id} has no {message.platform} credentials; reply not sent")
+            return True
+        method, url, headers, body = request
+        platform_bucket = self._bucket(message.platform)
+        bot_bucket = self._bucket(message.platform, message.bot_id)
+        start = time.monotonic()
+        try:
+            for attempt in range(self.max_retries + 1):
+                await platform_bucket.acquire()
+                await bot_bucket.acquire()
+                wait = None
+                try:
+                    response = await self._client.request(method, url, headers=headers, json=body)
+                except RETRYABLE_ERRORS as e:
+                    error = str(e) or type(e).__name__
+                except httpx.TransportError as e:
+                    error = str(e) or type(e).__name__
+                    break
+                else:
+                    if response.is_success:
+                        self.sent += 1
+                        return True
+                    error = f"HTTP {response.status_code}"
+                    if response.status_code == 429:
+                        self.rate_limited += 1
+                        wait = retry_after(response)
+                        if wait is not None:
+                            bot_bucket.pause(wait)
+                    elif response.status_code < 500:
+                        break
+                if attempt == self.max_retries:
+                    break
+                self.retried += 1
+                # Full jitter spreads retries of many replies that failed together
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                await asyncio.sleep(max(backoff, wait or 0))
+            self.failed += 1
+            logging.error(f"Sending {message.platform} reply for bot {message.bot_id} failed: {error}")
+            return False
+        finally:
+            self._send_seconds += time.monotonic() - start
+
+
+outbound = OutboundSender()
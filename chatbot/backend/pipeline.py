@@ -0,0 +1,376 @@
+from collections import deque
+from functools import partial
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+import logging
+from database import SessionLocal
+from conversations import get_or_create_conversation_id
+from idempotency import idempotency
+from message_writer import claim_messages, message_row, message_writer, release_messages
+from outbound import OutboundMessage, outbound
+import models
+
+# Parsed messages waiting for a worker; webhooks are refused with 503 beyond this
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "10000"))
+# Messages processed concurrently (database work and inference run on this many threads)
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+# Queued messages of one conversation are answered together, up to this many per pass
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "64"))
+# Messages for a bot whose model is not loaded yet are retried this often while it is trained,
+# without holding a worker, and fail once they have waited PIPELINE_MODEL_WAIT_SECONDS
+PIPELINE_MODEL_RETRY_SECONDS = float(os.getenv("PIPELINE_MODEL_RETRY_SECONDS", "2"))
+PIPELINE_MODEL_WAIT_SECONDS = float(os.getenv("PIPELINE_MODEL_WAIT_SECONDS", "60"))
+# On shutdown, queued messages are processed for at most this long before workers stop
+PIPELINE_DRAIN_SECONDS = float(os.getenv("PIPELINE_DRAIN_SECONDS", "30"))
+
+
+class QueueFull(Exception):
+    """The pipeline cannot take more messages right now"""
+
+
+class RetryLater(Exception):
+    """The batch cannot be answered yet; its conversation is handed out again after delay seconds"""
+
+    def __init__(self, delay: float):
+        super().__init__(f"Retrying in {delay:g}s")
+        self.delay = delay
+
+
+class InboundMessage:
+    """A message received from a platform, ready to be answered"""
+
+    def __init__(self, platform: str, bot_id: int, user_id: str, text: str, message_id: str = None, reply_to: str = None):
+        self.platform = platform
+        self.bot_id = bot_id
+        self.user_id = user_id
+        self.text = text
+        self.message_id = message_id  # the platform's id for the message, when it has one
+        self.reply_to = reply_to  # what the platform needs to answer this message, beyond the user id
+        self.received_at = time.monotonic()
+
+    @property
+    def conversation_key(self) -> tuple:
+        """Messages with the same key belong to one Conversation and are answered in order"""
+        return (self.platform, self.user_id, self.bot_id)
+
+
+def release_claims(db, conversation_id: int, messages: List[InboundMessage]):
+    """Let redeliveries of messages that will get no reply through again.
+
+    Their stored rows and the webhook's in-memory keys are dropped, so the
+    platform's next delivery of them is answered instead of being skipped
+    as a duplicate.
+    """
+    messages = [message for message in messages if message.message_id]
+    if not messages:
+        return
+    idempotency.release((message.platform, message.bot_id, message.message_id) for message in messages)
+    release_messages(db, conversation_id, [message.message_id for message in messages])
+
+
+def release_unsent(message: InboundMessage):
+    """release_claims for a message whose reply could not be sent"""
+    db = SessionLocal()
+    try:
+        conversation_id = get_or_create_conversation_id(db, message.platform, message.user_id, message.bot_id)
+        release_claims(db, conversation_id, [message])
+    except Exception as e:
+        logging.error(f"Releasing {message.platform} message {message.message_id} failed: {str(e)}")
+    finally:
+        db.close()
+
+
+async def deliver(message: InboundMessage, reply: str):
+    """Queue reply to be sent back on the platform the message came from; waits while the send queue is full"""
+    await outbound.send(OutboundMessage(
+        message.platform, message.bot_id, message.user_id, reply, message.reply_to,
+        on_failure=partial(release_unsent, message) if message.message_id else None
+    ))
+
+
+class InboundBatch:
+    """Queued messages of one conversation, answered together in arrival order"""
+
+    def __init__(self, messages: List[InboundMessage]):
+        self.messages = list(messages)
+
+    @property
+    def conversation_key(self) -> tuple:
+        return self.messages[0].conversation_key
+
+    def __len__(self):
+        return len(self.messages)
+
+
+def process_batch(batch: InboundBatch) -> List[str]:
+    """Answer a conversation's messages in one pass and store them with their replies.
+
+    The conversation is resolved once, messages with a platform id are
+    claimed by storing them, all new messages are scored in one inference
+    pass, and the replies go to the message writer as a single bulk insert.
+    Claims are released when the batch fails, so redeliveries are answered.
+    A bot whose model is still being trained raises RetryLater instead,
+    until the batch has waited PIPELINE_MODEL_WAIT_SECONDS.
+    """
+    from training import ModelNotReady, respond_many
+    first = batch.messages[0]
+    db = SessionLocal()
+    try:
+        bot = db.query(models.Bot).filter(models.Bot.id == first.bot_id).first()
+        if not bot:
+            raise ValueError(f"Bot {first.bot_id} not found")
+
+        # Cached for returning users; created atomically on first contact
+        conversation_id = get_or_create_conversation_id(db, first.platform, first.user_id, bot.id)
+
+        # Messages with a platform id are stored before they are answered: a redelivery the
+        # webhook's in-memory check missed (another process, a restart) finds its id taken
+        # and is skipped, even while the first delivery is still being answered
+        messages = batch.messages
+        claimed = claim_messages(db, [
+            message_row(conversation_id, message.text, True, message.message_id)
+            for message in messages if message.message_id
+        ])
+        messages = [message for message in messages if not message.message_id or message.message_id in claimed]
+        if not messages:
+            return [None] * len(batch)
+
+        # Messages without a platform id are written with their replies
+        incoming = [
+            None if message.message_id else message_row(conversation_id, message.text, True)
+            for message in messages
+        ]
+        try:
+            # Responses from the cache, or the cached model for the misses; a cold bot is trained by the scheduler
+            replies = respond_many(bot, db, [message.text for message in messages])
+        except ModelNotReady:
+            if time.monotonic() - first.received_at >= PIPELINE_MODEL_WAIT_SECONDS:
+                release_claims(db, conversation_id, messages)
+                message_writer.write([row for row in incoming if row is not None])
+                raise
+            # The retry claims them again; the webhook's keys stay taken meanwhile
+            release_messages(db, conversation_id, [message.message_id for message in messages if message.message_id])
+            raise RetryLater(PIPELINE_MODEL_RETRY_SECONDS)
+        except Exception:
+            release_claims(db, conversation_id, messages)
+            message_writer.write([row for row in incoming if row is not None])
+            raise
+        # Give the connection back before waiting for the batch to commit
+        db.close()
+        # Replies in message order, each after its message if that was not stored above
+        rows = []
+        for row, reply in zip(incoming, replies):
+            if row is not None:
+                rows.append(row)
+            rows.append(message_row(conversation_id, reply, False))
+        try:
+            message_writer.write(rows)
+        except Exception:
+            release_claims(db, conversation_id, messages)
+            raise
+        # Skipped redeliveries get no reply
+        answered = dict(zip(map(id, messages), replies))
+        return [answered.get(id(message)) for message in batch.messages]
+    finally:
+        db.close()
+
+
+class MessagePipeline:
+    """Bounded intake of inbound messages, answered in order per conversation.
+
+    Webhooks only parse and submit, so platforms get their acknowledgement
+    without waiting for the database or the model. Messages are queued per
+    conversation key (platform, user_id, bot_id), and a conversation is
+    handed to at most one worker at a time, so its messages are processed
+    strictly in arrival order. Messages of a conversation that queue up
+    behind each other, or arrive in one delivery, are handled as one batch
+    of up to batch_size. Conversations with queued messages wait in a
+    round-robin ready queue that all workers take from, so a slow
+    conversation holds up only itself. Each worker coroutine runs the
+    blocking handler on a thread, then delivers the replies. A handler that
+    raises RetryLater gets the batch back after the delay, and the
+    conversation keeps its place meanwhile, with no worker held. drain()
+    stops intake and finishes the queued messages before shutting down.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = PIPELINE_QUEUE_SIZE,
+        workers: int = PIPELINE_WORKERS,
+        handler=process_batch,
+        deliver=deliver,
+        batch_size: int = PIPELINE_BATCH_SIZE
+    ):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.handler = handler
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self._pending = {}  # conversation key -> deque of its queued batches
+        self._ready = None  # keys with queued messages and no worker, in turn order
+        self._idle = None  # set while nothing is queued or in flight
+        self._depth = 0
+        self._tasks = []
+        self._executor = None
+        self._closed = False
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.batches = 0
+        self._wait_seconds = 0.0
+        self._process_seconds = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        if self.started:
+            return
+        self._closed = False
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        # Conversations left queued by a drain that timed out get their turn again
+        for key, queue in list(self._pending.items()):
+            if queue:
+                self._ready.put_nowait(key)
+            else:
+                del self._pending[key]
+        self._depth = sum(len(batch) for queue in self._pending.values() for batch in queue)
+        if not self._depth:
+            self._idle.set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, message: InboundMessage):
+        """Queue a message without waiting; raises QueueFull when it cannot be taken"""
+        self.submit_many([message])
+
+    def submit_many(self, messages: List[InboundMessage]):
+        """Queue the messages of one delivery without waiting, all or none.
+
+        Raises QueueFull, taking none of them, when they do not all fit.
+        """
+        if self._closed:
+            self.rejected += len(messages)
+            raise QueueFull("Message pipeline is shutting down")
+        self.start()
+        if self._depth + len(messages) > self.maxsize:
+            self.rejected += len(messages)
+            raise QueueFull("Message pipeline is at capacity")
+        for message in messages:
+            self._enqueue(message)
+        self._idle.clear()
+        self.max_depth = max(self.max_depth, self._depth)
+
+    async def drain(self, timeout: float = PIPELINE_DRAIN_SECONDS):
+        """Stop taking messages, finish the queued ones (up to timeout) and stop the workers.
+
+        Messages still queued after a timeout are kept, and a later start() processes them.
+        """
+        self._closed = True
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Message pipeline drain timed out with {self._depth} messages queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        done = self.processed + self.failed
+        return {
+            "depth": self._depth,
+            "capacity": self.maxsize,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "conversations": len(self._pending),
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "deferred": self.deferred,
+            "batches": self.batches,
+            "mean_batch_size": done / self.batches if self.batches else 0.0,
+            "mean_wait_ms": self._wait_seconds / done * 1000 if done else 0.0,
+            "mean_process_ms": self._process_seconds / self.batches * 1000 if self.batches else 0.0,
+            "accepting": not self._closed
+        }
+
+    def _enqueue(self, message: InboundMessage):
+        key = message.conversation_key
+        queue = self._pending.get(key)
+        if queue is None:
+            # Not queued and not being processed: the conversation needs a turn
+            queue = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        if queue and len(queue[-1]) < self.batch_size:
+            # Queued batches are not in flight yet, so the last one can still grow
+            queue[-1].messages.append(message)
+        else:
+            queue.append(InboundBatch([message]))
+        self._depth += 1
+        self.enqueued += 1
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            batch = queue.popleft()
+            size = len(batch)
+            self._depth -= size
+            self.in_flight += size
+            start = time.monotonic()
+            retry_in = None
+            try:
+                replies = await loop.run_in_executor(self._executor, self.handler, batch)
+                for message, reply in zip(batch.messages, replies or ()):
+                    if reply is not None:
+                        await self._deliver(message, reply)
+                self.processed += size
+            except RetryLater as e:
+                retry_in = e.delay
+            except Exception as e:
+                self.failed += size
+                logging.error(f"Processing {size} {key[0]} messages for bot {key[2]} failed: {str(e)}")
+            finally:
+                self.batches += 1
+                self._process_seconds += time.monotonic() - start
+                self.in_flight -= size
+                if retry_in is not None:
+                    # First in line again, and the conversation's turn comes back after the delay
+                    self.deferred += size
+                    queue.appendleft(batch)
+                    self._depth += size
+                    loop.call_later(retry_in, self._ready.put_nowait, key)
+                else:
+                    self._wait_seconds += sum(start - message.received_at for message in batch.messages)
+                    if queue:
+                        # Back of the line, so busy conversations take turns with the others
+                        self._ready.put_nowait(key)
+                    else:
+                        del self._pending[key]
+                if not self._depth and not self.in_flight:
+                    self._idle.set()
+
+    async def _deliver(self, message: InboundMessage, reply: str):
+        result = self.deliver(message, reply)
+        if asyncio.iscoroutine(result):
+            await result
+
+
+pipeline = MessagePipeline()
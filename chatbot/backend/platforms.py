@@ -0,0 +1,212 @@
+from typing import List, Optional, Union
+import msgspec
+from pipeline import InboundMessage
+
+# Webhook payloads are decoded straight from the request bytes into these
+# structs. Only the fields the bot uses are declared; msgspec skips the rest
+# without building dicts for them.
+
+
+class InvalidPayload(ValueError):
+    """The webhook body is not valid JSON of the platform's shape"""
+
+
+# WhatsApp: the flat {"messages": [...]} shape, or the Cloud API envelope
+# {"entry": [{"changes": [{"value": {"messages": [...]}}]}]}
+class WhatsAppText(msgspec.Struct):
+    body: str = ""
+
+
+class WhatsAppMessage(msgspec.Struct):
+    sender: str = msgspec.field(name="from", default="")
+    id: str = ""
+    text: Optional[WhatsAppText] = None
+
+
+class WhatsAppValue(msgspec.Struct):
+    messages: List[WhatsAppMessage] = []
+
+
+class WhatsAppChange(msgspec.Struct):
+    value: Optional[WhatsAppValue] = None
+
+
+class WhatsAppEntry(msgspec.Struct):
+    changes: List[WhatsAppChange] = []
+
+
+class WhatsAppPayload(msgspec.Struct):
+    messages: List[WhatsAppMessage] = []
+    entry: List[WhatsAppEntry] = []
+
+
+# Telegram: one Update per request
+class TelegramChat(msgspec.Struct):
+    id: int
+
+
+class TelegramMessage(msgspec.Struct):
+    chat: TelegramChat
+    message_id: int = 0
+    text: Optional[str] = None
+
+
+class TelegramUpdate(msgspec.Struct):
+    update_id: int = 0
+    message: Optional[TelegramMessage] = None
+
+
+# Instagram messaging webhooks
+class InstagramUser(msgspec.Struct):
+    id: str
+
+
+class InstagramMessageBody(msgspec.Struct):
+    mid: str = ""
+    text: Optional[str] = None
+    is_echo: bool = False
+
+
+class InstagramMessaging(msgspec.Struct):
+    sender: InstagramUser
+    message: Optional[InstagramMessageBody] = None
+
+
+class InstagramEntry(msgspec.Struct):
+    messaging: List[InstagramMessaging] = []
+
+
+class InstagramPayload(msgspec.Struct):
+    entry: List[InstagramEntry] = []
+
+
+# Discord interactions: PING (type 1) or an application command (type 2)
+DISCORD_PING = 1
+DISCORD_APPLICATION_COMMAND = 2
+
+
+class DiscordUser(msgspec.Struct):
+    id: str
+
+
+class DiscordMember(msgspec.Struct):
+    user: Optional[DiscordUser] = None
+
+
+class DiscordOption(msgspec.Struct):
+    name: str = ""
+    value: Union[str, int, float, bool, None] = None
+
+
+class DiscordCommand(msgspec.Struct):
+    name: str = ""
+    options: List[DiscordOption] = []
+
+
+class DiscordInteraction(msgspec.Struct):
+    type: int
+    id: str = ""
+    application_id: str = ""
+    token: str = ""
+    data: Optional[DiscordCommand] = None
+    member: Optional[DiscordMember] = None
+    user: Optional[DiscordUser] = None
+
+
+class PlatformAdapter:
+    """Turns one platform's webhook body into InboundMessages and the reply the platform expects"""
+
+    platform = None
+    payload_type = None
+
+    def __init__(self):
+        self._decoder = msgspec.json.Decoder(self.payload_type)
+
+    def decode(self, body: bytes):
+        try:
+            return self._decoder.decode(body)
+        except msgspec.DecodeError as e:
+            raise InvalidPayload(f"Invalid {self.platform} payload: {str(e)}")
+
+    def messages(self, payload, bot_id: int) -> List[InboundMessage]:
+        raise NotImplementedError
+
+    def acknowledgement(self, payload, queued: int) -> dict:
+        return {"status": "queued" if queued else "ignored"}
+
+
+class WhatsAppAdapter(PlatformAdapter):
+    platform = "whatsapp"
+    payload_type = WhatsAppPayload
+
+    def messages(self, payload: WhatsAppPayload, bot_id: int) -> List[InboundMessage]:
+        found = list(payload.messages)
+        for entry in payload.entry:
+            for change in entry.changes:
+                if change.value is not None:
+                    found.extend(change.value.messages)
+        # Status updates and media carry no text to answer
+        return [
+            InboundMessage(self.platform, bot_id, m.sender, m.text.body, message_id=m.id or None)
+            for m in found if m.sender and m.text is not None and m.text.body
+        ]
+
+
+class TelegramAdapter(PlatformAdapter):
+    platform = "telegram"
+    payload_type = TelegramUpdate
+
+    def messages(self, payload: TelegramUpdate, bot_id: int) -> List[InboundMessage]:
+        message = payload.message
+        if message is None or not message.text:
+            return []
+        # Replies go to the chat, so the chat is the conversation's user
+        return [InboundMessage(
+            self.platform, bot_id, str(message.chat.id), message.text,
+            message_id=f"{message.chat.id}:{message.message_id}"
+        )]
+
+
+class InstagramAdapter(PlatformAdapter):
+    platform = "instagram"
+    payload_type = InstagramPayload
+
+    def messages(self, payload: InstagramPayload, bot_id: int) -> List[InboundMessage]:
+        return [
+            InboundMessage(self.platform, bot_id, event.sender.id, event.message.text, message_id=event.message.mid or None)
+            for entry in payload.entry
+            for event in entry.messaging
+            # Echoes are the bot's own messages
+            if event.message is not None and event.message.text and not event.message.is_echo
+        ]
+
+
+class DiscordAdapter(PlatformAdapter):
+    platform = "discord"
+    payload_type = DiscordInteraction
+
+    def messages(self, payload: DiscordInteraction, bot_id: int) -> List[InboundMessage]:
+        if payload.type != DISCORD_APPLICATION_COMMAND or payload.data is None:
+            return []
+        user = payload.member.user if payload.member is not None and payload.member.user else payload.user
+        text = " ".join(str(o.value) for o in payload.data.options if isinstance(o.value, str) and o.value)
+        if user is None or not text:
+            return []
+        return [InboundMessage(
+            self.platform, bot_id, user.id, text, message_id=payload.id or None,
+            # The follow-up completing the deferred response is addressed by application and interaction token
+            reply_to=f"{payload.application_id}/{payload.token}" if payload.application_id and payload.token else None
+        )]
+
+    def acknowledgement(self, payload: DiscordInteraction, queued: int) -> dict:
+        if payload.type == DISCORD_PING:
+            return {"type": 1}  # PONG
+        # DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE: the answer follows once the pipeline has it
+        return {"type": 5} if queued else {"type": 4, "data": {"content": "Please send a question."}}
+
+
+ADAPTERS = {adapter.platform: adapter for adapter in (WhatsAppAdapter(), TelegramAdapter(), InstagramAdapter(), DiscordAdapter())}
+
+
+def get_adapter(platform: str) -> Optional[PlatformAdapter]:
+    return ADAPTERS.get(platform)
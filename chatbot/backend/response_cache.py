@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import os
+import time
+import threading
+from tokenizer import tokenize
+
+# Cached responses per bot, least recently used evicted first
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Bots with cached responses per process, least recently used dropped first with their entries
+RESPONSE_CACHE_BOTS = int(os.getenv("RESPONSE_CACHE_BOTS", "1000"))
+# Seconds a cached response is served before the query is scored again
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+
+def normalize_query(query: str) -> str:
+    """Queries with the same tokens get the same features, and so the same response"""
+    return " ".join(tokenize(query))
+
+
+class _BotCache:
+    def __init__(self):
+        self.entries = OrderedDict()  # (query, threshold) -> (response, expires_at)
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+
+class ResponseCache:
+    """Per-bot LRU cache of generated responses with a TTL.
+
+    Entries are keyed by the normalized query and threshold and belong to
+    one model version of the bot; looking up a different version drops the
+    bot's entries, so a retrained bot never answers from its old model.
+    At most max_bots bots are cached; the least recently used one is
+    dropped whole, so bots that stop getting traffic (or are deleted) do
+    not keep their entries forever.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_bots: int = RESPONSE_CACHE_BOTS
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bots = max_bots
+        self._bots = OrderedDict()  # bot_id -> _BotCache, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, bot_id: int, version: int, query: str, threshold: float):
+        """Return the cached response, or None on a miss"""
+        key = (normalize_query(query), threshold)
+        with self._lock:
+            cache = self._bot(bot_id, version)
+            entry = cache.entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del cache.entries[key]
+                cache.misses += 1
+                return None
+            cache.entries.move_to_end(key)
+            cache.hits += 1
+            return entry[0]
+
+    def put(self, bot_id: int, version: int, query: str, threshold: float, response: str):
+        if self.max_entries <= 0:
+            return
+        key = (normalize_query(query), threshold)
+        with self._lock:
+            cache = self._bot(bot_id, version)
+            cache.entries[key] = (response, time.monotonic() + self.ttl)
+            cache.entries.move_to_end(key)
+            while len(cache.entries) > self.max_entries:
+                cache.entries.popitem(last=False)
+
+    def invalidate(self, bot_id: int):
+        """Drop the bot's cached responses, keeping its counters"""
+        with self._lock:
+            cache = self._bots.get(bot_id)
+            if cache is not None:
+                cache.entries.clear()
+                cache.version = None
+
+    def clear(self):
+        with self._lock:
+            self._bots.clear()
+
+    def __len__(self):
+        return len(self._bots)
+
+    def stats(self, bot_id: int) -> dict:
+        with self._lock:
+            cache = self._bots.get(bot_id) or _BotCache()
+            lookups = cache.hits + cache.misses
+            return {
+                "bot_id": bot_id,
+                "model_version": cache.version,
+                "entries": len(cache.entries),
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "hit_rate": cache.hits / lookups if lookups else 0.0
+            }
+
+    def _bot(self, bot_id: int, version: int) -> _BotCache:
+        cache = self._bots.get(bot_id)
+        if cache is None:
+            cache = self._bots[bot_id] = _BotCache()
+            while len(self._bots) > self.max_bots:
+                self._bots.popitem(last=False)
+        else:
+            self._bots.move_to_end(bot_id)
+        if cache.version != version:
+            cache.entries.clear()
+            cache.version = version
+        return cache
+
+
+response_cache = ResponseCache()
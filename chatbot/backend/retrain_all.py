@@ -0,0 +1,118 @@
+"""Retrain every bot (or the given ones) across a process pool.
+
+Run from the backend directory, e.g. for a nightly full rebuild:
+
+    python retrain_all.py --workers 8
+    python retrain_all.py --bot-id 3 --bot-id 7 --incremental
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+import argparse
+import os
+import sys
+import time
+import logging
+from database import SessionLocal
+from model_registry import registry
+import models
+
+
+def _init_worker():
+    from training_scheduler import _init_worker as init_training_worker
+    import tokenizer
+    init_training_worker()
+    # Parallelism comes from the pool; a nested tokenizer pool per bot would oversubscribe the CPUs
+    tokenizer.TOKENIZER_WORKERS = 1
+
+
+def retrain_one(bot_id: int, incremental: bool = False) -> dict:
+    """Train one bot in a worker process, returning its result with the elapsed time"""
+    from training_scheduler import run_training_job
+    start = time.perf_counter()
+    try:
+        result = run_training_job(bot_id, incremental)
+    finally:
+        # The model is published as an artifact; keeping it here only grows the worker
+        registry.clear()
+    result["duration_seconds"] = time.perf_counter() - start
+    return result
+
+
+def list_bot_ids(db, bot_ids: List[int] = None) -> List[int]:
+    """Ids of the bots (among bot_ids, if given) that have scripts to train on.
+
+    A bot without scripts would only fail, and a failed job invalidates the
+    bot's model, which needlessly drops its cached responses on every run.
+    """
+    has_scripts = db.query(models.Script.id).filter(
+        models.Script.bot_id == models.Bot.id, models.Script.duplicate_of.is_(None)
+    ).exists()
+    query = db.query(models.Bot.id).filter(has_scripts)
+    if bot_ids:
+        query = query.filter(models.Bot.id.in_(bot_ids))
+    return [bot_id for (bot_id,) in query.order_by(models.Bot.id)]
+
+
+def retrain_all(bot_ids: List[int], workers: int, incremental: bool = False, executor=None, run_job=retrain_one, out=sys.stdout) -> dict:
+    """Retrain bot_ids on up to workers processes, printing one line per bot and a summary"""
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    start = time.perf_counter()
+    trained, failed, documents = 0, 0, 0
+    with executor:
+        futures = {executor.submit(run_job, bot_id, incremental): bot_id for bot_id in bot_ids}
+        for future in as_completed(futures):
+            bot_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"bot {bot_id}: failed: {e}", file=out)
+                continue
+            trained += 1
+            documents += result["corpus_size"]
+            seconds = result["duration_seconds"]
+            print(
+                f"bot {bot_id}: v{result['model_version']} {result['corpus_size']} docs "
+                f"in {seconds:.2f}s ({result['corpus_size'] / max(seconds, 1e-9):.0f} docs/s)",
+                file=out
+            )
+    elapsed = time.perf_counter() - start
+    summary = {
+        "bots": len(bot_ids),
+        "trained": trained,
+        "failed": failed,
+        "documents": documents,
+        "seconds": elapsed
+    }
+    print(
+        f"{trained}/{len(bot_ids)} bots trained, {failed} failed, {documents} docs in {elapsed:.2f}s "
+        f"({trained / max(elapsed, 1e-9):.1f} bots/s, {documents / max(elapsed, 1e-9):.0f} docs/s)",
+        file=out
+    )
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot-id", type=int, action="append", dest="bot_ids", help="retrain only this bot (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="training processes (default: CPU count)")
+    parser.add_argument("--incremental", action="store_true", help="update incremental models in place where possible")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        bot_ids = list_bot_ids(db, args.bot_ids)
+    finally:
+        db.close()
+    skipped = sorted(set(args.bot_ids or ()) - set(bot_ids))
+    if skipped:
+        logging.info(f"Skipping bots without scripts or not found: {', '.join(map(str, skipped))}")
+    logging.info(f"Retraining {len(bot_ids)} bots on {args.workers} workers")
+    summary = retrain_all(bot_ids, args.workers, incremental=args.incremental)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
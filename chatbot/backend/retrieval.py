@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Slack for floating point error when deciding that a document can no longer reach the top-k
+_PRUNE_EPSILON = 1e-9
+
+
+class InvertedIndex:
+    """Top-k cosine retrieval over L2-normalized TF-IDF rows.
+
+    The document matrix is stored as term -> postings (document ids and
+    weights), so a query only touches documents that share a term with it.
+    Terms are scored in decreasing order of their best possible contribution
+    (MaxScore): once the remaining terms together cannot lift an unseen
+    document above the current k-th best score, they only update existing
+    candidates, and candidates that cannot reach the top-k are dropped.
+    """
+
+    def __init__(self, postings_indptr, postings_docs, postings_weights, max_weights, n_docs: int):
+        self.postings_indptr = postings_indptr
+        self.postings_docs = postings_docs
+        self.postings_weights = postings_weights
+        self.max_weights = max_weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_matrix(cls, matrix: csr_matrix) -> "InvertedIndex":
+        csc = matrix.tocsc()
+        csc.sort_indices()
+        lengths = np.diff(csc.indptr)
+        max_weights = np.zeros(csc.shape[1], dtype=csc.data.dtype)
+        nonempty = lengths > 0
+        if nonempty.any():
+            max_weights[nonempty] = np.maximum.reduceat(csc.data, csc.indptr[:-1][nonempty])
+        return cls(csc.indptr, csc.indices, csc.data, max_weights, matrix.shape[0])
+
+    def arrays(self) -> dict:
+        return {
+            "postings_indptr": self.postings_indptr,
+            "postings_docs": self.postings_docs,
+            "postings_weights": self.postings_weights,
+            "max_weights": self.max_weights
+        }
+
+    def term_matrix(self) -> csr_matrix:
+        """The postings as a (terms x documents) CSR matrix, i.e. the transposed document matrix"""
+        return csr_matrix(
+            (self.postings_weights, self.postings_docs, self.postings_indptr),
+            shape=(len(self.postings_indptr) - 1, self.n_docs),
+            copy=False
+        )
+
+    def _postings(self, term: int):
+        start, end = self.postings_indptr[term], self.postings_indptr[term + 1]
+        return self.postings_docs[start:end], self.postings_weights[start:end]
+
+    def search(self, query_vec, k: int = 1):
+        """Return (doc_ids, scores) of the k best matches, best first.
+
+        Ties are broken by the lower document id, matching np.argmax over a
+        dense similarity row. Documents sharing no term with the query are
+        never returned, so fewer than k results may come back.
+        """
+        query_vec = query_vec.tocsr()
+        terms = query_vec.indices
+        query_weights = query_vec.data
+        bounds = query_weights * self.max_weights[terms]
+        useful = bounds > 0
+        terms, query_weights, bounds = terms[useful], query_weights[useful], bounds[useful]
+        if not len(terms) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        order = np.argsort(-bounds, kind="stable")
+        terms, query_weights, bounds = terms[order], query_weights[order], bounds[order]
+        # remaining[i] is the most that terms i.. can add to any document's score
+        remaining = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        theta = 0.0
+        i = 0
+        # Essential terms: any document in their postings may still make the top-k
+        while i < len(terms):
+            docs, weights = self._postings(terms[i])
+            merged = np.concatenate([candidates, docs])
+            candidates, inverse = np.unique(merged, return_inverse=True)
+            scores = np.bincount(
+                inverse,
+                weights=np.concatenate([scores, weights * query_weights[i]]),
+                minlength=len(candidates)
+            )
+            i += 1
+            if len(candidates) >= k:
+                theta = np.partition(scores, len(scores) - k)[len(scores) - k]
+                if remaining[i] < theta - _PRUNE_EPSILON:
+                    break
+
+        # Non-essential terms: only documents already seen can still reach the top-k
+        while i < len(terms) and len(candidates):
+            alive = scores + remaining[i] >= theta - _PRUNE_EPSILON
+            candidates, scores = candidates[alive], scores[alive]
+            docs, weights = self._postings(terms[i])
+            positions = np.searchsorted(candidates, docs)
+            positions[positions == len(candidates)] = 0
+            hits = candidates[positions] == docs
+            np.add.at(scores, positions[hits], weights[hits] * query_weights[i])
+            i += 1
+            if len(scores) >= k:
+                theta = np.partition(scores, len(scores) - k)[len(scores) - k]
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            # Keep every candidate tied with the k-th score so ties resolve by doc id
+            top = np.flatnonzero(scores >= scores[top].min())
+            candidates, scores = candidates[top], scores[top]
+        ranked = np.lexsort((candidates, -scores))[:k]
+        return candidates[ranked], scores[ranked]
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException
+from auth import get_current_active_user
+from idempotency import idempotency
+from message_writer import message_writer
+from outbound import outbound
+from model_registry import registry
+from pipeline import pipeline
+import models
+import schemas
+
+router = APIRouter(
+    prefix="/api/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+@router.get("/models", response_model=schemas.ModelResidency)
+def read_resident_models(current_user: models.User = Depends(get_current_active_user)):
+    """List the bot models resident in this process with their memory footprint"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view model residency")
+    
+    return {
+        "max_bytes": registry.max_bytes,
+        "total_bytes": registry.total_bytes,
+        "models": registry.resident()
+    }
+
+@router.get("/pipeline", response_model=schemas.PipelineMetrics)
+def read_pipeline_metrics(current_user: models.User = Depends(get_current_active_user)):
+    """Queue depth and throughput counters of this process's webhook message pipeline"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view pipeline metrics")
+    
+    return pipeline.metrics()
+
+@router.get("/message-writer", response_model=schemas.MessageWriterStats)
+def read_message_writer_stats(current_user: models.User = Depends(get_current_active_user)):
+    """Batching counters of this process's write-behind Message buffer"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view message writer stats")
+    
+    return message_writer.stats()
+
+@router.get("/outbound", response_model=schemas.OutboundMetrics)
+def read_outbound_metrics(current_user: models.User = Depends(get_current_active_user)):
+    """Send queue depth, retry and rate limit counters of this process's outbound replies"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view outbound metrics")
+    
+    return outbound.metrics()
+
+@router.get("/idempotency", response_model=schemas.IdempotencyStats)
+def read_idempotency_stats(current_user: models.User = Depends(get_current_active_user)):
+    """Redelivered webhook messages dropped by this process"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to view idempotency stats")
+    
+    return idempotency.stats()
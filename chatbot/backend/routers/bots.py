@@ -3,7 +3,11 @@ from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
 from auth import get_current_active_user
-from training import train_bot
+from training import FALLBACK_RESPONSE, MODEL_RETRY_AFTER_SECONDS, ModelNotReady, bot_threshold, get_trainer
+from training_scheduler import scheduler
+from response_cache import response_cache
+from integrations import integration_cache
+from platforms import ADAPTERS
 import models
 import schemas
 import logging
@@ -25,6 +29,7 @@ def create_bot(
         name=bot.name,
         description=bot.description,
         personality=bot.personality,
+        response_threshold=bot.response_threshold,
         owner_id=current_user.id
     )
     db.add(db_bot)
@@ -83,13 +88,13 @@ def update_bot(
     db.refresh(db_bot)
     return db_bot
 
-@router.post("/{bot_id}/train", response_model=dict)
+@router.post("/{bot_id}/train", response_model=schemas.TrainingJob, status_code=status.HTTP_202_ACCEPTED)
 def train_bot_endpoint(
     bot_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Train a bot using its assigned scripts"""
+    """Queue training of a bot using its assigned scripts"""
     bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
     if not bot:
         raise HTTPException(status_code=404, detail="Bot not found")
@@ -97,15 +102,150 @@ def train_bot_endpoint(
         raise HTTPException(status_code=403, detail="Not authorized to train this bot")
     
     try:
-        personality_profile = train_bot(bot_id, db)
-        return {
-            "status": "success",
-            "bot_id": bot_id,
-            "personality_profile": personality_profile
-        }
+        job = scheduler.submit(bot_id)
     except Exception as e:
-        logging.error(f"Training failed for bot {bot_id}: {str(e)}")
+        logging.error(f"Queueing training failed for bot {bot_id}: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Training failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+    return job.as_dict()
+
+@router.get("/{bot_id}/train/{job_id}", response_model=schemas.TrainingJob)
+def read_training_job(
+    bot_id: int,
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the status of a training job"""
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if current_user.role != "admin" and bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this bot")
+    
+    job = scheduler.get(job_id)
+    if not job or job.bot_id != bot_id:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job.as_dict()
+
+@router.post("/{bot_id}/respond/batch", response_model=schemas.BatchResponse)
+def respond_batch(
+    bot_id: int,
+    batch: schemas.BatchQuery,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Generate responses for a batch of queries in one pass"""
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if current_user.role != "admin" and bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this bot")
+    
+    try:
+        trainer = get_trainer(bot, db)
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(MODEL_RETRY_AFTER_SECONDS)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    threshold = bot_threshold(bot) if batch.threshold is None else batch.threshold
+    results = trainer.generate_responses(batch.queries, threshold=threshold)
+    return {
+        "bot_id": bot_id,
+        "responses": [
+            {"query": query, "response": response, "score": score, "matched": matched}
+            for query, (response, score, matched) in zip(batch.queries, results)
+        ]
+    }
+
+@router.post("/{bot_id}/respond/candidates", response_model=schemas.CandidateResponse)
+def respond_candidates(
+    bot_id: int,
+    request: schemas.CandidateQuery,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the top-k scripts for a query with their scores, for tuning the bot's threshold"""
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if current_user.role != "admin" and bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this bot")
+    
+    try:
+        trainer = get_trainer(bot, db)
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(MODEL_RETRY_AFTER_SECONDS)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    threshold = bot_threshold(bot) if request.threshold is None else request.threshold
+    candidates = trainer.generate_candidates(request.query, k=request.k)
+    matched = bool(candidates) and candidates[0][2] >= threshold
+    return {
+        "bot_id": bot_id,
+        "query": request.query,
+        "threshold": threshold,
+        "response": candidates[0][1] if matched else FALLBACK_RESPONSE,
+        "matched": matched,
+        "candidates": [
+            {"script_id": script_id, "text": text, "score": score, "above_threshold": score >= threshold}
+            for script_id, text, score in candidates
+        ]
+    }
+
+@router.get("/{bot_id}/response-cache", response_model=schemas.ResponseCacheStats)
+def read_response_cache_stats(
+    bot_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get hit/miss counters of this process's response cache for a bot"""
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if current_user.role != "admin" and bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this bot")
+    
+    return response_cache.stats(bot_id)
+
+@router.put("/{bot_id}/integrations/{platform}", response_model=schemas.Integration)
+def update_integration(
+    bot_id: int,
+    platform: str,
+    integration: schemas.IntegrationUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Set the account and credentials the bot replies with on a platform"""
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    if current_user.role != "admin" and bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to update this bot")
+    if platform not in ADAPTERS:
+        raise HTTPException(status_code=400, detail="Unsupported platform")
+    
+    db_integration = db.query(models.BotIntegration).filter(
+        models.BotIntegration.bot_id == bot_id,
+        models.BotIntegration.platform == platform
+    ).first()
+    if not db_integration:
+        db_integration = models.BotIntegration(bot_id=bot_id, platform=platform)
+    for field, value in integration.dict(exclude_unset=True).items():
+        setattr(db_integration, field, value)
+    db.add(db_integration)
+    db.commit()
+    integration_cache.invalidate(bot_id)
+    
+    # Tokens and secrets are write-only
+    return {
+        "bot_id": bot_id,
+        "platform": platform,
+        "account_id": db_integration.account_id,
+        "has_access_token": bool(db_integration.access_token),
+        "has_webhook_secret": bool(db_integration.webhook_secret)
+    }
@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import shutil
 import os
 import models
 import schemas
 from database import get_db
 from auth import get_current_active_user
-from training import train_bot
+from training_scheduler import scheduler
 import logging
 
 router = APIRouter(
@@ -16,44 +16,96 @@ router = APIRouter(
     dependencies=[Depends(get_current_active_user)]
 )
 
-@router.post("/upload", response_model=schemas.Script)
+@router.post("/upload", response_model=schemas.ScriptChange, status_code=status.HTTP_202_ACCEPTED)
 async def upload_script(
+    response: Response,
     file: UploadFile = File(...),
     bot_id: int = Form(...),
+    on_duplicate: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Upload a training script for a bot"""
+    """Upload a training script for a bot.
+
+    An upload that near-duplicates one of the bot's scripts is rejected,
+    merged (it replaces the old copy) or flagged (stored but not trained on)
+    according to on_duplicate, which defaults to DEDUP_MODE.
+
+    Answers 202 with the id of the retrain it queued, or 201 when nothing
+    needs retraining.
+    """
+    # Imported here so importing the routers does not load numpy
+    import dedup
     # Verify bot exists and user has access
     bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
     if not bot:
         raise HTTPException(status_code=404, detail="Bot not found")
     if current_user.role != "admin" and bot.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to upload scripts for this bot")
+    mode = on_duplicate or dedup.DEDUP_MODE
+    if mode not in dedup.DEDUP_MODES:
+        raise HTTPException(status_code=400, detail=f"on_duplicate must be one of {', '.join(dedup.DEDUP_MODES)}")
 
     try:
         # Read file content
         contents = await file.read()
         content_str = contents.decode("utf-8")
 
+        signature = dedup.minhash(content_str)
+        # Check, insert and index in one transaction under the bot's lock,
+        # so a concurrent upload of the same text sees this one
+        dedup.lock_bot(db, bot_id)
+        # Scripts uploaded before dedup existed are indexed on the bot's next upload
+        backfilled = dedup.backfill_if_unindexed(db, bot_id)
+        if backfilled:
+            logging.info(f"Indexed {backfilled} existing scripts of bot {bot_id} for deduplication")
+        duplicate = dedup.find_duplicate(db, bot_id, signature) if signature is not None else None
+        if duplicate is not None:
+            duplicate_id, similarity = duplicate
+            response.headers["X-Duplicate-Of"] = str(duplicate_id)
+            if mode == "reject":
+                # Nothing is added yet; committing keeps any backfilled index entries
+                db.commit()
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Script duplicates script {duplicate_id} ({similarity:.0%} similar)",
+                    headers={"X-Duplicate-Of": str(duplicate_id)}
+                )
+
         # Create script record
         db_script = models.Script(
             content=content_str,
-            bot_id=bot_id
+            bot_id=bot_id,
+            duplicate_of=duplicate[0] if duplicate is not None and mode == "flag" else None
         )
         db.add(db_script)
+        db.flush()
+
+        if duplicate is None:
+            dedup.index_script(db, db_script, signature)
+        elif mode == "merge":
+            old = db.query(models.Script).filter(models.Script.id == duplicate[0]).first()
+            dedup.supersede(db, old, db_script, signature)
         db.commit()
         db.refresh(db_script)
 
-        # Trigger training
-        try:
-            train_bot(bot_id, db)
-        except Exception as e:
-            logging.warning(f"Training failed after script upload: {str(e)}")
+        # Queue training; incremental models only process the new script.
+        # Flagged duplicates are not trained on, so they need no retrain.
+        job_id = None
+        if db_script.duplicate_of is None:
+            try:
+                job_id = scheduler.submit(bot_id, incremental=True).id
+            except Exception as e:
+                logging.warning(f"Queueing training failed after script upload: {str(e)}")
+        if job_id is None:
+            response.status_code = status.HTTP_201_CREATED
 
-        return db_script
+        return schemas.ScriptChange(**schemas.Script.from_orm(db_script).dict(), training_job_id=job_id)
 
+    except HTTPException:
+        raise
     except Exception as e:
+        db.rollback()
         logging.error(f"Script upload failed: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -83,13 +135,19 @@ def read_scripts(
     ).offset(skip).limit(limit).all()
     return scripts
 
-@router.delete("/{script_id}", response_model=schemas.Script)
+@router.delete("/{script_id}", response_model=schemas.ScriptChange, status_code=status.HTTP_202_ACCEPTED)
 def delete_script(
     script_id: int,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Delete a training script"""
+    """Delete a training script.
+
+    Answers 202 with the id of the retrain it queued, or 200 when nothing
+    needs retraining.
+    """
+    import dedup
     script = db.query(models.Script).filter(models.Script.id == script_id).first()
     if not script:
         raise HTTPException(status_code=404, detail="Script not found")
@@ -99,13 +157,20 @@ def delete_script(
     if current_user.role != "admin" and bot.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this script")
 
+    # A flagged duplicate of this script takes its place in training
+    dedup.lock_bot(db, script.bot_id)
+    dedup.release_duplicates(db, script)
     db.delete(script)
     db.commit()
 
-    # Retrain bot after script deletion
-    try:
-        train_bot(script.bot_id, db)
-    except Exception as e:
-        logging.warning(f"Training failed after script deletion: {str(e)}")
+    # Queue retraining after script deletion; flagged duplicates were never trained on
+    job_id = None
+    if script.duplicate_of is None:
+        try:
+            job_id = scheduler.submit(script.bot_id, incremental=True).id
+        except Exception as e:
+            logging.warning(f"Queueing training failed after script deletion: {str(e)}")
+    if job_id is None:
+        response.status_code = status.HTTP_200_OK
 
-    return script
\ No newline at end of file
+    return schemas.ScriptChange(**schemas.Script.from_orm(script).dict(), training_job_id=job_id)
\ No newline at end of file
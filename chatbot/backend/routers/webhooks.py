@@ -0,0 +1,100 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import os
+import random
+import logging
+from integrations import integration_cache
+from pipeline import QueueFull, pipeline
+from platforms import InvalidPayload, get_adapter
+from idempotency import idempotency
+from signatures import verify_signature
+
+# Webhook bodies are logged for this fraction of requests (0 disables)...
+WEBHOOK_LOG_SAMPLE_RATE = float(os.getenv("WEBHOOK_LOG_SAMPLE_RATE", "0.01"))
+# ...cut to this many bytes
+WEBHOOK_LOG_BODY_BYTES = int(os.getenv("WEBHOOK_LOG_BODY_BYTES", "512"))
+# 'required': webhooks for bots without a webhook secret on the platform are refused
+# 'optional': they are accepted unsigned, for local development
+WEBHOOK_SIGNATURES = os.getenv("WEBHOOK_SIGNATURES", "required")
+
+# Platforms authenticate with per-bot signing secrets, not user tokens
+router = APIRouter(
+    prefix="/api/social",
+    tags=["webhooks"]
+)
+
+def log_body(platform: str, bot_id: int, body: bytes):
+    """Log a sample of webhook bodies, truncated, instead of every body in full"""
+    if WEBHOOK_LOG_SAMPLE_RATE <= 0 or random.random() >= WEBHOOK_LOG_SAMPLE_RATE:
+        return
+    shown = body[:WEBHOOK_LOG_BODY_BYTES].decode("utf-8", errors="replace")
+    more = f"... ({len(body)} bytes)" if len(body) > WEBHOOK_LOG_BODY_BYTES else ""
+    logging.info(f"Incoming {platform} webhook for bot {bot_id}: {shown}{more}")
+
+async def verify_webhook(request: Request, body: bytes, platform: str, bot_id: int):
+    """Check the request was signed with the bot's webhook secret for the platform.
+
+    The secret comes from integration_cache, so a verified webhook costs an
+    HMAC over the body and no database round trip.
+    """
+    found, credentials = integration_cache.cached(bot_id, platform)
+    if not found:
+        credentials = await run_in_threadpool(integration_cache.get, bot_id, platform)
+    if credentials is None:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    
+    if credentials.webhook_secret:
+        if not verify_signature(platform, credentials.webhook_secret, body, request.headers):
+            raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    elif WEBHOOK_SIGNATURES == "required":
+        raise HTTPException(status_code=401, detail="No webhook secret configured for this bot")
+    
+    log_body(platform, bot_id, body)
+
+@router.post("/{platform}/webhook/{bot_id}")
+async def handle_webhook(
+    platform: str,
+    bot_id: int,
+    request: Request
+):
+    """Handle incoming messages from social platforms"""
+    try:
+        adapter = get_adapter(platform)
+        if adapter is None:
+            raise HTTPException(status_code=400, detail="Unsupported platform")
+
+        # The body is read once and decoded straight into the platform's payload structs
+        body = await request.body()
+        await verify_webhook(request, body, platform, bot_id)
+        try:
+            payload = adapter.decode(body)
+        except InvalidPayload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        parsed = adapter.messages(payload, bot_id)
+
+        # Platforms redeliver when we are slow to answer; messages already accepted are dropped here
+        keys = [(platform, bot_id, message.message_id) for message in parsed if message.message_id]
+        new_keys = {key for key, new in zip(keys, idempotency.claim(keys)) if new}
+        messages = [
+            message for message in parsed
+            if not message.message_id or (platform, bot_id, message.message_id) in new_keys
+        ]
+
+        # Acknowledge now; storing the messages and replying happen on the pipeline workers
+        # Messages from the same sender are answered as one batch, in order
+        try:
+            pipeline.submit_many(messages)
+        except QueueFull as e:
+            # Not accepted, so the platform's retry must not count as a redelivery
+            idempotency.release(new_keys)
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+        # A redelivery gets the same acknowledgement as the original delivery
+        return JSONResponse(content=adapter.acknowledgement(payload, len(parsed)))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Webhook handling failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
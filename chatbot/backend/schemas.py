@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel, EmailStr
+from typing import Dict, List, Optional
+from pydantic import BaseModel, EmailStr, confloat, conint, conlist
 from datetime import datetime
 
 # Shared properties
@@ -32,6 +32,7 @@ class BotBase(BaseModel):
     name: str
     description: Optional[str] = None
     personality: Optional[str] = "neutral"
+    response_threshold: Optional[confloat(ge=0, le=1)] = 0.3
 
 class BotCreate(BotBase):
     pass
@@ -40,6 +41,7 @@ class BotUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     personality: Optional[str] = None
+    response_threshold: Optional[confloat(ge=0, le=1)] = None
 
 class Bot(BotBase):
     id: int
@@ -57,9 +59,14 @@ class ScriptCreate(ScriptBase):
 class Script(ScriptBase):
     id: int
     bot_id: int
+    duplicate_of: Optional[int] = None
     class Config:
         orm_mode = True
 
+class ScriptChange(Script):
+    # Retrain queued by the upload or deletion, polled at GET /api/bots/{bot_id}/train/{job_id}
+    training_job_id: Optional[str] = None
+
 # Message schemas
 class MessageBase(BaseModel):
     content: str
@@ -102,4 +109,133 @@ class TrainingResult(BaseModel):
     bot_id: int
     status: str
     personality_profile: dict
-    trained_at: datetime = datetime.now()
\ No newline at end of file
+    trained_at: datetime = datetime.now()
+
+# Background training job status
+class TrainingJob(BaseModel):
+    job_id: str
+    bot_id: int
+    status: str  # 'queued', 'running', 'done' or 'failed'
+    incremental: bool
+    requests: int
+    queued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    corpus_size: Optional[int] = None
+    model_version: Optional[int] = None
+    error: Optional[str] = None
+
+# Batch inference
+class BatchQuery(BaseModel):
+    queries: conlist(str, min_items=1, max_items=1000)
+    threshold: Optional[confloat(ge=0, le=1)] = None
+
+class QueryResponse(BaseModel):
+    query: str
+    response: str
+    score: float
+    matched: bool
+
+class BatchResponse(BaseModel):
+    bot_id: int
+    responses: List[QueryResponse]
+
+# Ranked candidates for one query
+class CandidateQuery(BaseModel):
+    query: str
+    k: conint(ge=1, le=50) = 5
+    threshold: Optional[confloat(ge=0, le=1)] = None
+
+class Candidate(BaseModel):
+    script_id: int
+    text: str
+    score: float
+    above_threshold: bool
+
+class CandidateResponse(BaseModel):
+    bot_id: int
+    query: str
+    threshold: float
+    response: str
+    matched: bool
+    candidates: List[Candidate]
+
+# Response cache counters
+class ResponseCacheStats(BaseModel):
+    bot_id: int
+    model_version: Optional[int] = None
+    entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+# Model residency (admin)
+class ResidentModel(BaseModel):
+    bot_id: int
+    model_version: int
+    bytes: int
+    footprint: Dict[str, int]
+    loaded_at: datetime
+    last_used: datetime
+
+class ModelResidency(BaseModel):
+    max_bytes: int
+    total_bytes: int
+    models: List[ResidentModel]
+
+# Webhook message pipeline (admin)
+class PipelineMetrics(BaseModel):
+    depth: int
+    capacity: int
+    max_depth: int
+    in_flight: int
+    conversations: int
+    workers: int
+    enqueued: int
+    processed: int
+    failed: int
+    rejected: int
+    deferred: int
+    batches: int
+    mean_batch_size: float
+    mean_wait_ms: float
+    mean_process_ms: float
+    accepting: bool
+
+class OutboundMetrics(BaseModel):
+    queued: int
+    capacity: int
+    workers: int
+    sent: int
+    failed: int
+    retried: int
+    rate_limited: int
+    skipped: int
+    mean_send_ms: float
+
+class IntegrationUpdate(BaseModel):
+    account_id: Optional[str] = None
+    access_token: Optional[str] = None
+    webhook_secret: Optional[str] = None
+
+class Integration(BaseModel):
+    bot_id: int
+    platform: str
+    account_id: Optional[str] = None
+    has_access_token: bool
+    has_webhook_secret: bool
+
+class IdempotencyStats(BaseModel):
+    entries: int
+    checked: int
+    duplicates: int
+    duplicate_rate: float
+
+class MessageWriterStats(BaseModel):
+    durability: str
+    buffered: int
+    rows_written: int
+    flushes: int
+    mean_batch_rows: float
+    errors: int
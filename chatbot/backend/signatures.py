@@ -0,0 +1,47 @@
+from typing import Mapping
+import hashlib
+import hmac
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+
+def hmac_sha256(secret: str, body: bytes) -> str:
+    """Hex HMAC-SHA256 of the raw body, as Meta signs WhatsApp and Instagram webhooks"""
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _equal(expected: str, received: str) -> bool:
+    # compare_digest on bytes: constant time, and no TypeError for non-ASCII header values
+    return hmac.compare_digest(expected.encode("utf-8"), received.encode("utf-8"))
+
+
+def _verify_ed25519(public_key: str, message: bytes, signature: str) -> bool:
+    try:
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key)).verify(bytes.fromhex(signature), message)
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+
+def verify_signature(platform: str, secret: str, body: bytes, headers: Mapping[str, str]) -> bool:
+    """Whether a webhook body was sent by the platform, given the bot's secret for it.
+
+    - WhatsApp, Instagram: X-Hub-Signature-256 (or X-Signature) is
+      "sha256=" + HMAC-SHA256 of the body under the app secret.
+    - Telegram: X-Telegram-Bot-Api-Secret-Token equals the secret_token
+      registered with setWebhook; Telegram does not sign bodies.
+    - Discord: X-Signature-Ed25519 signs X-Signature-Timestamp + body; the
+      secret is the application's hex public key.
+    """
+    if platform in ("whatsapp", "instagram"):
+        received = headers.get("x-hub-signature-256") or headers.get("x-signature") or ""
+        if received.startswith("sha256="):
+            received = received[len("sha256="):]
+        return _equal(hmac_sha256(secret, body), received)
+    if platform == "telegram":
+        return _equal(secret, headers.get("x-telegram-bot-api-secret-token", ""))
+    if platform == "discord":
+        signature = headers.get("x-signature-ed25519", "")
+        timestamp = headers.get("x-signature-timestamp", "")
+        return bool(signature) and _verify_ed25519(secret, timestamp.encode("utf-8") + body, signature)
+    return False
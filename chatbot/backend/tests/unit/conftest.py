@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base
+from conversations import conversation_cache
+import models
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    # Cached conversation ids belong to the previous test's database
+    conversation_cache.clear()
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def sessions(tmp_path):
+    """Session factory on a database file, for tests whose threads each need their own connection"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    conversation_cache.clear()
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        engine.dispose()
+
+@pytest.fixture
+def bot(db):
+    owner = models.User(username="owner", email="owner@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    db_bot = models.Bot(name="faq-bot", description="FAQ bot", owner_id=owner.id)
+    db.add(db_bot)
+    db.commit()
+    for content in [
+        "Our opening hours are nine to five on weekdays",
+        "The price of the basic plan is ten dollars per month",
+        "You can reset your password from the account settings page",
+    ]:
+        db.add(models.Script(content=content, bot_id=db_bot.id))
+    db.commit()
+    return db_bot
+
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path, monkeypatch):
+    import artifacts
+    monkeypatch.setattr(artifacts, "MODEL_ARTIFACT_DIR", str(tmp_path / "model_artifacts"))
+    return tmp_path / "model_artifacts"
+
+@pytest.fixture
+def webhook_client(db, monkeypatch):
+    """Client for the webhook routes, looking bots and their secrets up in the test database"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import integrations
+    from routers.webhooks import router
+    monkeypatch.setattr(integrations, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+    integrations.integration_cache.clear()
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as client:
+        yield client
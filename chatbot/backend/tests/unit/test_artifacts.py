@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+import pytest
+from sqlalchemy.orm import sessionmaker
+from artifacts import ARTIFACT_FORMAT, save_artifact, load_artifact, artifact_path, MappedTexts, MappedVocabulary
+from model_registry import _private_nbytes
+from training import ChatbotTrainer, fit_bot_model, get_trainer, train_bot, registry
+import models
+
+def test_round_trip_is_memory_mapped(db, bot):
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    save_artifact(trainer, 1)
+
+    loaded = ChatbotTrainer(bot.id)
+    assert load_artifact(loaded, 1)
+    assert _private_nbytes(loaded.trained_data.data) == 0
+    assert _private_nbytes(loaded.trained_data.indices) == 0
+    assert isinstance(loaded.raw_texts, MappedTexts)
+    assert list(loaded.raw_texts) == trainer.raw_texts
+    for query in ["price of the plan", "reset my password", "opening hours"]:
+        assert loaded.generate_response(query) == trainer.generate_response(query)
+
+def test_missing_version_is_not_loaded(db, bot):
+    assert not load_artifact(ChatbotTrainer(bot.id), 7)
+
+def test_cold_start_loads_artifact_instead_of_training(db, bot, monkeypatch):
+    train_bot(bot.id, db)
+    assert os.path.isdir(artifact_path(bot.id, 1))
+    registry.clear()
+
+    def fail_train(self, db):
+        raise AssertionError("should load the saved artifact")
+    monkeypatch.setattr(ChatbotTrainer, "train", fail_train)
+    trainer = get_trainer(bot, db)
+    assert "price" in trainer.generate_response("how much is the basic plan price")
+
+def test_old_versions_are_pruned(db, bot):
+    for _ in range(4):
+        train_bot(bot.id, db)
+    versions = sorted(name for name in os.listdir(os.path.dirname(artifact_path(bot.id, 1))) if name.startswith("v"))
+    assert versions == ["v3", "v4"]
+
+def test_existing_version_directory_is_replaced(db, bot):
+    stale = artifact_path(bot.id, 1)
+    os.makedirs(stale)
+    with open(os.path.join(stale, "meta.json"), "w") as f:
+        json.dump({"format": ARTIFACT_FORMAT, "bot_id": bot.id, "version": 0}, f)
+    assert not load_artifact(ChatbotTrainer(bot.id), 1)
+
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    save_artifact(trainer, 1)
+    loaded = ChatbotTrainer(bot.id)
+    assert load_artifact(loaded, 1)
+    assert list(loaded.raw_texts) == trainer.raw_texts
+
+def test_artifacts_in_other_formats_are_ignored(db, bot):
+    trainer = ChatbotTrainer(bot.id, incremental=False)
+    trainer.train(db)
+    path = save_artifact(trainer, 1)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(dict(meta, format=1), f)
+    assert not load_artifact(ChatbotTrainer(bot.id), 1)
+
+def test_model_version_is_allocated_in_the_database(db, bot):
+    assert bot.model_version == 0
+    # Another worker trained the bot; this session still holds the old row
+    other = sessionmaker(bind=db.get_bind())()
+    other.query(models.Bot).filter(models.Bot.id == bot.id).update({"model_version": 5})
+    other.commit()
+    other.close()
+
+    _, version = fit_bot_model(bot.id, db)
+    assert version == bot.model_version == 6
+    assert os.path.isdir(artifact_path(bot.id, 6))
+
+def test_failed_commit_publishes_nothing(db, bot, monkeypatch):
+    registry.clear()
+    def fail_commit():
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(db, "commit", fail_commit)
+    with pytest.raises(RuntimeError):
+        fit_bot_model(bot.id, db)
+    assert not os.path.exists(artifact_path(bot.id, 1))
+    assert bot.id not in registry
+
+def test_vocabulary_is_mapped_and_matches_fitted_dict(db, bot):
+    trainer = ChatbotTrainer(bot.id, incremental=False)
+    trainer.train(db)
+    save_artifact(trainer, 1)
+    loaded = ChatbotTrainer(bot.id, incremental=False)
+    load_artifact(loaded, 1)
+
+    vocabulary = loaded.vectorizer.vocabulary_
+    assert isinstance(vocabulary, MappedVocabulary)
+    assert dict(vocabulary) == trainer.vectorizer.vocabulary_
+    assert "not a term" not in vocabulary
+    queries = ["price of the basic plan", "unknown words only", "reset password settings"]
+    assert (loaded.vectorizer.transform(queries) != trainer.vectorizer.transform(queries)).nnz == 0
+
+def test_cold_bot_is_trained_once_by_the_scheduler(db, bot, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    import training_scheduler
+    from training import ModelNotReady, warm_bot_model
+
+    def run_job(bot_id, incremental, warm):
+        trainer, version = warm_bot_model(bot_id, db)
+        return {"model_version": version, "corpus_size": len(trainer.raw_texts), "personality_profile": {}}
+    scheduler = training_scheduler.TrainingScheduler(executor=ThreadPoolExecutor(1), run_job=run_job)
+    monkeypatch.setattr(training_scheduler, "scheduler", scheduler)
+    registry.clear()
+    calls = []
+    original = ChatbotTrainer.train
+    def counting_train(self, db):
+        calls.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return original(self, db)
+    monkeypatch.setattr(ChatbotTrainer, "train", counting_train)
+
+    # Requests are not held up by training
+    jobs = []
+    for _ in range(3):
+        with pytest.raises(ModelNotReady) as missed:
+            get_trainer(bot, db)
+        jobs.append(missed.value.job)
+    assert len({job.id for job in jobs}) == 1
+    assert jobs[0].wait(5) and jobs[0].status == "done"
+    assert jobs[0].model_version == bot.model_version == 0
+
+    # Each worker has its own registry; the others map the published artifact
+    registry.invalidate(bot.id)
+    trainer = get_trainer(bot, db, wait=5)
+    assert isinstance(trainer.raw_texts, MappedTexts)
+    assert len(calls) == 1 and calls[0] != threading.current_thread().name
+    scheduler.shutdown()
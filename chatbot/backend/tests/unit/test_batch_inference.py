@@ -0,0 +1,100 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from auth import get_current_active_user
+from database import get_db
+from routers.bots import router
+from training import ChatbotTrainer, FALLBACK_RESPONSE, registry, train_bot
+import models
+
+QUERIES = [
+    "what are your opening hours",
+    "price of the basic plan",
+    "how do I reset my password",
+    "completely unrelated weather question",
+    "",
+]
+
+def test_batch_matches_single_query_path(db, bot):
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    results = trainer.generate_responses(QUERIES * 60)
+    assert len(results) == len(QUERIES) * 60
+    for query, (response, score, matched) in zip(QUERIES * 60, results):
+        assert response == trainer.generate_response(query)
+        assert matched == (response != FALLBACK_RESPONSE)
+
+def test_batch_endpoint(db, bot):
+    train_bot(bot.id, db)
+    registry.clear()
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    client = TestClient(app)
+
+    response = client.post(f"/api/bots/{bot.id}/respond/batch", json={"queries": QUERIES[:2], "threshold": 0.1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["bot_id"] == bot.id
+    assert [r["matched"] for r in body["responses"]] == [True, True]
+    assert "opening hours" in body["responses"][0]["response"]
+    assert body["responses"][0]["score"] > 0.1
+
+    assert client.post(f"/api/bots/{bot.id}/respond/batch", json={"queries": []}).status_code == 422
+    assert client.post(f"/api/bots/{bot.id}/respond/batch", json={"queries": ["hi"], "threshold": 1.5}).status_code == 422
+    assert client.post("/api/bots/999/respond/batch", json={"queries": ["hi"]}).status_code == 404
+
+def test_cold_bot_is_answered_with_retry_after(db, bot, monkeypatch):
+    import training_scheduler
+    submitted = []
+    class Job:
+        def wait(self, timeout):
+            return False
+    class Scheduler:
+        def submit(self, bot_id, incremental=False, warm=False):
+            submitted.append((bot_id, warm))
+            return Job()
+    monkeypatch.setattr(training_scheduler, "scheduler", Scheduler())
+    registry.clear()
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    client = TestClient(app)
+
+    response = client.post(f"/api/bots/{bot.id}/respond/batch", json={"queries": QUERIES[:1]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert submitted == [(bot.id, True)]
+
+def test_candidates_are_ranked_with_script_ids(db, bot):
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    query = "what is the price of the basic plan per month"
+    candidates = trainer.generate_candidates(query, k=3)
+    scores = [score for _, _, score in candidates]
+    assert scores == sorted(scores, reverse=True)
+    script_id, text, score = candidates[0]
+    assert text == trainer.generate_response(query)
+    assert db.get(models.Script, script_id).content == text
+
+def test_candidates_endpoint_uses_the_bot_threshold(db, bot):
+    train_bot(bot.id, db)
+    registry.clear()
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    client = TestClient(app)
+
+    query = {"query": "price of the basic plan", "k": 2}
+    body = client.post(f"/api/bots/{bot.id}/respond/candidates", json=query).json()
+    assert body["threshold"] == 0.3 and body["matched"]
+    best = body["candidates"][0]
+    assert best["above_threshold"] and body["response"] == best["text"]
+
+    assert client.put(f"/api/bots/{bot.id}", json={"response_threshold": 0.99}).json()["response_threshold"] == 0.99
+    body = client.post(f"/api/bots/{bot.id}/respond/candidates", json=query).json()
+    assert not body["matched"] and body["response"] == FALLBACK_RESPONSE
+    assert body["candidates"][0]["score"] == best["score"]
+    assert client.put(f"/api/bots/{bot.id}", json={"response_threshold": 2}).status_code == 422
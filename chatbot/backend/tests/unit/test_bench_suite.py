@@ -0,0 +1,34 @@
+import os
+import pytest
+from benchmarks.bench_suite import compare, peak_rss_mb, reset_peak_rss, run_size
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"results": {"tfidf/1000": {
+        "mode": "tfidf", "docs": 1000, "train_seconds": 1.0, "respond_queries_per_second": 1000.0,
+        "rss_before_train_mb": 50.0, "peak_rss_mb": 100.0
+    }}}
+    results = {"results": {
+        "tfidf/1000": {
+            "mode": "tfidf", "docs": 1000, "train_seconds": 1.5, "respond_queries_per_second": 900.0,
+            "rss_before_train_mb": 90.0, "peak_rss_mb": 80.0
+        },
+        "incremental/1000": {"mode": "incremental", "docs": 1000, "train_seconds": 9.0}
+    }}
+    regressions = compare(results, baseline, tolerance=0.25)
+    assert [(run, metric) for run, metric, *_ in regressions] == [("tfidf/1000", "train_seconds")]
+    assert compare(results, baseline, tolerance=0.6) == []
+
+@pytest.mark.parametrize("mode", ["tfidf", "incremental"])
+def test_run_size_reports_every_metric(mode):
+    metrics = run_size(200, 20, seed=1, mode=mode)
+    assert metrics["mode"] == mode and metrics["docs"] == 200
+    assert metrics["train_seconds"] > 0 and metrics["peak_rss_mb"] > 0
+    assert metrics["respond_p50_us"] <= metrics["respond_p99_us"]
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="peak RSS can only be reset on Linux")
+def test_peak_rss_is_reset_after_the_corpus_is_built():
+    corpus = bytearray(200 * 1024 * 1024)
+    del corpus
+    assert peak_rss_mb() >= 200
+    reset_peak_rss()
+    assert peak_rss_mb() < 200
@@ -0,0 +1,63 @@
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from database import Base
+import models
+from conversations import ConversationCache, conversation_cache, get_or_create_conversation_id
+
+def test_returning_users_are_served_from_the_cache(db, bot):
+    first = get_or_create_conversation_id(db, "whatsapp", "15550001", bot.id)
+    other = get_or_create_conversation_id(db, "telegram", "15550001", bot.id)
+    assert first != other and db.query(models.Conversation).count() == 2
+
+    misses = conversation_cache.misses
+    assert get_or_create_conversation_id(None, "whatsapp", "15550001", bot.id) == first
+    assert conversation_cache.misses == misses
+
+    # An existing conversation is found when the cache has been lost, e.g. after a restart
+    conversation_cache.clear()
+    assert get_or_create_conversation_id(db, "whatsapp", "15550001", bot.id) == first
+    assert db.query(models.Conversation).count() == 2
+
+def test_concurrent_first_messages_share_one_conversation(tmp_path):
+    # A file database, so every thread has its own connection as it would in production
+    engine = create_engine(f"sqlite:///{tmp_path / 'conversations.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    ids, errors, start = [], [], threading.Barrier(4)
+    def first_message():
+        local = session()
+        try:
+            start.wait(5)
+            ids.append(get_or_create_conversation_id(local, "whatsapp", "15550002", 1))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            local.close()
+    for _ in range(2):
+        conversation_cache.clear()
+        threads = [threading.Thread(target=first_message) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+    assert errors == [] and len(ids) == 8 and len(set(ids)) == 1
+    with session() as db:
+        assert db.query(models.Conversation).count() == 1
+
+def test_unique_index_rejects_duplicate_conversations(db, bot):
+    db.add(models.Conversation(platform="whatsapp", user_id="1", bot_id=bot.id))
+    db.commit()
+    db.add(models.Conversation(platform="whatsapp", user_id="1", bot_id=bot.id))
+    with pytest.raises(IntegrityError):
+        db.commit()
+
+def test_cache_evicts_least_recently_used():
+    cache = ConversationCache(max_entries=2)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    cache.get(("a",))
+    cache.put(("c",), 3)
+    assert cache.get(("b",)) is None and cache.get(("a",)) == 1 and len(cache) == 2
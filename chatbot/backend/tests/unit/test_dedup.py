@@ -0,0 +1,104 @@
+import io
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from auth import get_current_active_user
+from database import get_db
+from routers.scripts import router
+import dedup
+import models
+import routers.scripts
+from training import ChatbotTrainer
+
+FAQ = (
+    "To reset your password open the account settings page, choose security, "
+    "press the reset password button and follow the link we email to you within five minutes"
+)
+EDITED = FAQ.replace("five minutes", "five mins")
+
+class FakeScheduler:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, bot_id, incremental=False):
+        self.submitted.append(bot_id)
+        return type("Job", (), {"id": "job"})()
+
+@pytest.fixture
+def client(db, bot, monkeypatch):
+    monkeypatch.setattr(routers.scripts, "scheduler", FakeScheduler())
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    return TestClient(app)
+
+def upload(client, bot, text, mode=None):
+    data = {"bot_id": str(bot.id)}
+    if mode:
+        data["on_duplicate"] = mode
+    return client.post("/api/scripts/upload", data=data, files={"file": ("faq.txt", io.BytesIO(text.encode()))})
+
+def test_signatures_estimate_similarity():
+    a, b = dedup.minhash(FAQ), dedup.minhash(EDITED)
+    assert dedup.similarity(a, a) == 1.0
+    assert dedup.similarity(a, b) > 0.7
+    assert dedup.similarity(a, dedup.minhash("Our opening hours are nine to five on weekdays")) < 0.1
+    assert dedup.minhash("?!") is None
+
+def test_upload_rejects_flags_or_merges_duplicates(db, bot, client):
+    response = upload(client, bot, FAQ)
+    original = response.json()
+    assert response.status_code == 202 and original["training_job_id"] == "job"
+    assert original["duplicate_of"] is None
+
+    rejected = upload(client, bot, FAQ, mode="reject")
+    assert rejected.status_code == 409
+    assert rejected.headers["X-Duplicate-Of"] == str(original["id"])
+
+    response = upload(client, bot, FAQ, mode="flag")
+    flagged = response.json()
+    # Flagged duplicates are not trained on, so no retrain is queued
+    assert response.status_code == 201 and flagged["training_job_id"] is None
+    assert flagged["duplicate_of"] == original["id"]
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    assert flagged["id"] not in trainer.script_ids and original["id"] in trainer.script_ids
+
+    merged = upload(client, bot, EDITED, mode="merge").json()
+    assert merged["duplicate_of"] is None
+    db.expire_all()
+    assert db.get(models.Script, original["id"]).duplicate_of == merged["id"]
+    assert db.get(models.Script, flagged["id"]).duplicate_of == merged["id"]
+    trainer.train(db)
+    assert merged["id"] in trainer.script_ids and original["id"] not in trainer.script_ids
+    assert upload(client, bot, FAQ, mode="bogus").status_code == 400
+
+def test_upload_is_stored_and_indexed_in_one_transaction(db, bot, client, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("index unavailable")
+    monkeypatch.setattr(dedup, "index_script", fail)
+    assert upload(client, bot, FAQ).status_code == 500
+    # No unindexed script is left behind for a later upload to miss
+    assert db.query(models.Script).filter(models.Script.content == FAQ).count() == 0
+
+def test_deleting_a_script_promotes_its_duplicate(db, bot, client):
+    original = upload(client, bot, FAQ).json()
+    flagged = upload(client, bot, FAQ).json()
+    assert client.delete(f"/api/scripts/{flagged['id']}").status_code == 200
+    flagged = upload(client, bot, FAQ).json()
+    response = client.delete(f"/api/scripts/{original['id']}")
+    assert response.status_code == 202 and response.json()["training_job_id"] == "job"
+    db.expire_all()
+    assert db.get(models.Script, flagged["id"]).duplicate_of is None
+    assert dedup.find_duplicate(db, bot.id, dedup.minhash(FAQ))[0] == flagged["id"]
+
+def test_scripts_uploaded_before_dedup_are_indexed_on_the_next_upload(client, db, bot):
+    existing = "The price of the basic plan is ten dollars per month"
+    assert dedup.find_duplicate(db, bot.id, dedup.minhash(existing)) is None
+
+    response = upload(client, bot, existing, mode="reject")
+    assert response.status_code == 409
+    db.expire_all()
+    assert db.query(models.ScriptSignature).filter(models.ScriptSignature.bot_id == bot.id).count() == 3
+    assert dedup.backfill_if_unindexed(db, bot.id) == 0
@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from sqlalchemy.orm import sessionmaker
+import message_writer
+import models
+import pipeline as pipeline_module
+import routers.webhooks
+import training
+from idempotency import IdempotencyStore, idempotency
+from message_writer import MessageWriter, message_row
+from training import train_bot
+from pipeline import InboundBatch, InboundMessage, MessagePipeline, process_batch
+
+def test_claim_release_ttl_and_bound():
+    store = IdempotencyStore(max_entries=2, ttl=0.05)
+    assert store.claim([("whatsapp", 1, "a"), ("whatsapp", 1, "a"), ("whatsapp", 2, "a")]) == [True, False, True]
+    store.release([("whatsapp", 2, "a")])
+    assert store.claim([("whatsapp", 2, "a")]) == [True]
+    assert store.stats()["duplicate_rate"] == 0.25
+    store.claim([("whatsapp", 1, "b")])
+    assert store.stats()["entries"] == 2
+    time.sleep(0.06)
+    assert store.claim([("whatsapp", 1, "b")]) == [True]
+
+def test_webhook_redeliveries_are_acknowledged_but_not_queued(bot, webhook_client, monkeypatch):
+    idempotency.clear()
+    received = []
+    release = threading.Event()
+    def handler(batch):
+        received.extend(batch.messages)
+        release.wait(5)
+    test_pipeline = MessagePipeline(maxsize=2, workers=1, handler=handler)
+    monkeypatch.setattr(routers.webhooks, "pipeline", test_pipeline)
+    monkeypatch.setattr(routers.webhooks, "WEBHOOK_SIGNATURES", "optional")
+    url = f"/api/social/whatsapp/webhook/{bot.id}"
+    delivery = lambda *ids: {"messages": [{"from": "1555", "id": i, "text": {"body": f"msg {i}"}} for i in ids]}
+    assert webhook_client.post(url, json=delivery("wamid.1")).json() == {"status": "queued"}
+    assert webhook_client.post(url, json=delivery("wamid.1")).json() == {"status": "queued"}
+    webhook_client.post(url, json=delivery("wamid.2"))
+    # Refused for capacity: the ids are released, so the platform's retry is not taken for a duplicate
+    assert webhook_client.post(url, json=delivery("wamid.3", "wamid.4")).status_code == 503
+    release.set()
+    time.sleep(0.2)
+    assert webhook_client.post(url, json=delivery("wamid.3", "wamid.4")).status_code == 200
+    for _ in range(100):
+        if len(received) == 4:
+            break
+        time.sleep(0.02)
+    assert [m.message_id for m in received] == ["wamid.1", "wamid.2", "wamid.3", "wamid.4"]
+    assert idempotency.stats()["duplicates"] == 1
+
+def test_stored_platform_ids_are_skipped_and_never_inserted_twice(db, bot, monkeypatch):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    monkeypatch.setattr(pipeline_module, "SessionLocal", session)
+    monkeypatch.setattr(message_writer, "SessionLocal", session)
+    train_bot(bot.id, db)
+    first = InboundMessage("whatsapp", bot.id, "1555", "what are your opening hours", message_id="wamid.1")
+    assert process_batch(InboundBatch([first]))[0] is not None
+
+    # After a restart the in-memory store is empty; the stored row still marks the redelivery
+    again = InboundMessage("whatsapp", bot.id, "1555", "what are your opening hours", message_id="wamid.1")
+    other = InboundMessage("whatsapp", bot.id, "1555", "price of the basic plan", message_id="wamid.2")
+    replies = process_batch(InboundBatch([again, other]))
+    assert replies[0] is None and "basic plan" in replies[1]
+    assert db.query(models.Message).count() == 4
+
+    # Racing writers: the unique column drops the second copy
+    conversation_id = db.query(models.Conversation.id).scalar()
+    writer = MessageWriter(durability="sync")
+    writer.write([message_row(conversation_id, "copy", True, "wamid.9"), message_row(conversation_id, "copy", True, "wamid.9")])
+    assert db.query(models.Message).filter(models.Message.platform_message_id == "wamid.9").count() == 1
+
+def test_redelivery_during_inference_is_not_answered_twice(sessions, monkeypatch):
+    monkeypatch.setattr(pipeline_module, "SessionLocal", sessions)
+    monkeypatch.setattr(message_writer, "SessionLocal", sessions)
+    db = sessions()
+    bot = models.Bot(name="faq-bot")
+    db.add(bot)
+    db.commit()
+    # Buffered replies: the first delivery's reply is not committed while the copy arrives
+    monkeypatch.setattr(message_writer, "message_writer", MessageWriter(flush_interval_ms=200))
+    monkeypatch.setattr(pipeline_module, "message_writer", message_writer.message_writer)
+    answered = []
+    def respond_many(bot, db, queries, wait=0):
+        answered.extend(queries)
+        time.sleep(0.1)
+        return ["reply"] * len(queries)
+    monkeypatch.setattr(training, "respond_many", respond_many)
+    deliveries = [
+        InboundBatch([InboundMessage("whatsapp", bot.id, "1555", "hours?", message_id="wamid.1")])
+        for _ in range(2)
+    ]
+    with ThreadPoolExecutor(2) as pool:
+        replies = list(pool.map(process_batch, deliveries))
+    message_writer.message_writer.close()
+    assert sorted(replies, key=lambda reply: reply[0] is None) == [["reply"], [None]]
+    assert answered == ["hours?"]
+    assert [(m.content, m.is_from_user) for m in db.query(models.Message).order_by(models.Message.id)] == [
+        ("hours?", True), ("reply", False)
+    ]
+    db.close()
+
+def test_messages_that_fail_are_answered_when_redelivered(sessions, monkeypatch):
+    monkeypatch.setattr(pipeline_module, "SessionLocal", sessions)
+    monkeypatch.setattr(message_writer, "SessionLocal", sessions)
+    db = sessions()
+    bot = models.Bot(name="faq-bot")
+    db.add(bot)
+    db.commit()
+    idempotency.clear()
+    outcomes = [RuntimeError("inference failed"), ["reply"]]
+    def respond_many(bot, db, queries, wait=0):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    monkeypatch.setattr(training, "respond_many", respond_many)
+    key = ("whatsapp", bot.id, "wamid.1")
+    delivery = lambda: InboundBatch([InboundMessage("whatsapp", bot.id, "1555", "hours?", message_id="wamid.1")])
+
+    assert idempotency.claim([key]) == [True]
+    try:
+        process_batch(delivery())
+    except RuntimeError:
+        pass
+    # The claim is released: neither the stored row nor the in-memory key turns the retry away
+    assert db.query(models.Message).count() == 0
+    assert idempotency.claim([key]) == [True]
+    assert process_batch(delivery()) == ["reply"]
+    message_writer.message_writer.flush()
+    assert [(m.content, m.is_from_user) for m in db.query(models.Message).order_by(models.Message.id)] == [
+        ("hours?", True), ("reply", False)
+    ]
+
+    # A reply that could not be sent releases its message the same way
+    pipeline_module.release_unsent(delivery().messages[0])
+    assert db.query(models.Message).filter(models.Message.is_from_user.is_(True)).count() == 0
+    assert idempotency.claim([key]) == [True]
+    db.close()
@@ -0,0 +1,109 @@
+import numpy as np
+import models
+import training
+from training import ChatbotTrainer, train_bot, get_trainer, registry
+
+def full_fit(db, bot_id):
+    trainer = ChatbotTrainer(bot_id, incremental=True)
+    trainer.train(db)
+    return trainer
+
+def assert_same_model(updated, expected):
+    assert updated.script_ids == expected.script_ids
+    assert list(updated.raw_texts) == list(expected.raw_texts)
+    assert np.array_equal(updated.vectorizer.columns, expected.vectorizer.columns)
+    assert np.array_equal(updated.vectorizer.df, expected.vectorizer.df)
+    assert abs(updated.trained_data - expected.trained_data).max() < 1e-12
+    assert updated.personality_profile == expected.personality_profile
+
+def test_added_script_matches_full_retrain(db, bot):
+    trainer = full_fit(db, bot.id)
+    db.add(models.Script(content="Delivery takes three to five business days", bot_id=bot.id))
+    db.commit()
+
+    updated = trainer.incremental_update(db)
+    assert_same_model(updated, full_fit(db, bot.id))
+    assert len(trainer.script_ids) == 3
+    assert "Delivery" in updated.generate_response("how many business days does delivery take")
+
+def test_deleted_script_matches_full_retrain(db, bot):
+    trainer = full_fit(db, bot.id)
+    script = db.query(models.Script).filter(models.Script.bot_id == bot.id).first()
+    db.delete(script)
+    db.commit()
+
+    assert_same_model(trainer.incremental_update(db), full_fit(db, bot.id))
+
+def test_columns_cover_only_the_corpus_vocabulary(db, bot):
+    trainer = full_fit(db, bot.id)
+    vectorizer = trainer.vectorizer
+    assert len(vectorizer.columns) == trainer.trained_data.shape[1] < vectorizer.n_features
+    assert len(trainer.index.max_weights) == len(vectorizer.columns)
+
+def test_query_weights_match_the_full_hashed_space(db, bot):
+    trainer = full_fit(db, bot.id)
+    vectorizer = trainer.vectorizer
+    query = "what are your opening hours for unicorn grooming"
+    # TF-IDF over every hashed feature, features outside the corpus having df = 0
+    df = np.zeros(vectorizer.n_features)
+    df[vectorizer.columns] = vectorizer.df
+    idf = np.log((1 + vectorizer.n_docs) / (1 + df)) + 1
+    query_vec = vectorizer.count([query]).toarray()[0] * idf
+    documents = trainer.term_counts.toarray() * idf
+    expected = documents @ query_vec / np.linalg.norm(documents, axis=1) / np.linalg.norm(query_vec)
+
+    scores = (trainer.trained_data @ vectorizer.transform([query]).T).toarray().ravel()
+    assert np.allclose(scores, expected, atol=1e-6)
+
+def test_model_loaded_from_an_artifact_is_updated_without_decoding_its_texts(db, bot):
+    from artifacts import MappedTexts, load_artifact, save_artifact
+    save_artifact(full_fit(db, bot.id), 1)
+    trainer = ChatbotTrainer(bot.id)
+    load_artifact(trainer, 1)
+    # Read from the artifact by the update only
+    assert trainer.word_counts is None
+    first, *_ = db.query(models.Script).filter(models.Script.bot_id == bot.id).order_by(models.Script.id)
+    db.delete(first)
+    db.add(models.Script(content="Gift cards never expire", bot_id=bot.id))
+    db.commit()
+
+    updated = trainer.incremental_update(db)
+    assert isinstance(updated.raw_texts, MappedTexts)
+    expected = full_fit(db, bot.id)
+    assert_same_model(updated, expected)
+    assert updated.word_counts == expected.word_counts
+    save_artifact(updated, 2)
+    reloaded = ChatbotTrainer(bot.id)
+    load_artifact(reloaded, 2)
+    assert list(reloaded.raw_texts) == list(updated.raw_texts)
+
+def test_train_bot_updates_artifact_model_in_place(db, bot, monkeypatch):
+    monkeypatch.setattr(training, "INCREMENTAL_TRAINING", True)
+    train_bot(bot.id, db)
+    registry.clear()
+    db.add(models.Script(content="Refunds are processed within a week", bot_id=bot.id))
+    db.commit()
+
+    tokenized = []
+    original = training.tokenize_many
+    def spy(texts):
+        tokenized.extend(texts)
+        return original(texts)
+    monkeypatch.setattr(training, "tokenize_many", spy)
+    train_bot(bot.id, db, incremental=True)
+
+    assert tokenized == ["Refunds are processed within a week"]
+    trainer = get_trainer(bot, db)
+    assert trainer.incremental
+    assert "Refunds" in trainer.generate_response("when are refunds processed")
+
+def test_streamed_training_is_independent_of_chunk_size(db, bot, monkeypatch):
+    expected = ChatbotTrainer(bot.id, incremental=False)
+    expected.train(db)
+    monkeypatch.setattr(training, "TRAINING_CHUNK_SIZE", 1)
+    trainer = ChatbotTrainer(bot.id, incremental=False)
+    trainer.train(db)
+    assert trainer.script_ids == expected.script_ids
+    assert trainer.raw_texts == expected.raw_texts
+    assert abs(trainer.trained_data - expected.trained_data).max() < 1e-12
+    assert trainer.personality_profile == expected.personality_profile
@@ -0,0 +1,116 @@
+import threading
+import time
+import pytest
+from sqlalchemy.orm import sessionmaker
+import message_writer
+import models
+from message_writer import MessageWriter, message_row
+
+@pytest.fixture
+def conversation(db, bot, monkeypatch):
+    monkeypatch.setattr(message_writer, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+    conversation = models.Conversation(platform="whatsapp", user_id="15550001", bot_id=bot.id)
+    db.add(conversation)
+    db.commit()
+    return conversation
+
+def stored(db):
+    db.expire_all()
+    return [m.content for m in db.query(models.Message).order_by(models.Message.id)]
+
+def test_batch_durability_groups_concurrent_writers_into_one_commit(db, conversation):
+    writer = MessageWriter(flush_interval_ms=100, flush_rows=1000, durability="batch")
+    threads = [
+        threading.Thread(target=writer.write, args=([message_row(conversation.id, f"m{i}", True)],))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    # Every writer returned only after its row was committed
+    assert sorted(stored(db)) == [f"m{i}" for i in range(8)]
+    assert writer.stats()["flushes"] == 1 and writer.stats()["rows_written"] == 8
+    writer.close()
+
+def test_async_durability_flushes_on_row_count_and_on_close(db, conversation):
+    writer = MessageWriter(flush_interval_ms=60000, flush_rows=4, durability="async")
+    writer.write([message_row(conversation.id, f"m{i}", True) for i in range(2)])
+    assert stored(db) == [] and writer.stats()["buffered"] == 2
+    writer.write([message_row(conversation.id, f"m{i}", True) for i in range(2, 4)])
+    for _ in range(100):
+        if writer.stats()["flushes"]:
+            break
+        time.sleep(0.01)
+    assert stored(db) == ["m0", "m1", "m2", "m3"]
+
+    writer.write([message_row(conversation.id, "last", False)])
+    writer.close()
+    assert stored(db)[-1] == "last" and writer.stats()["buffered"] == 0
+    # After close, writes go straight to the database
+    writer.write([message_row(conversation.id, "after", False)])
+    assert stored(db)[-1] == "after"
+
+def test_flush_deadline_counts_from_the_first_row(db, conversation):
+    writer = MessageWriter(flush_interval_ms=300, durability="async")
+    writer.write([message_row(conversation.id, "first", True)])
+    writer.flush()
+    # The writer has been idle for most of an interval when the next row arrives
+    time.sleep(0.2)
+    writer.write([message_row(conversation.id, "second", True)])
+    time.sleep(0.15)
+    assert writer.stats()["buffered"] == 1
+    for _ in range(100):
+        if not writer.stats()["buffered"]:
+            break
+        time.sleep(0.01)
+    assert stored(db) == ["first", "second"]
+    writer.close()
+
+class GatedCondition:
+    """The writer's condition, except that the thread named "racer" waits for gate before taking it"""
+
+    def __init__(self, cond, gate):
+        self.cond = cond
+        self.gate = gate
+
+    def __enter__(self):
+        if threading.current_thread().name == "racer":
+            self.gate.wait(5)
+        return self.cond.__enter__()
+
+    def __exit__(self, *exc):
+        return self.cond.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self.cond, name)
+
+def test_write_racing_close_is_committed(db, conversation):
+    writer = MessageWriter(flush_interval_ms=1, durability="batch")
+    writer.write([message_row(conversation.id, "before", True)])
+    gate = threading.Event()
+    writer._cond = GatedCondition(writer._cond, gate)
+    racer = threading.Thread(
+        target=writer.write, args=([message_row(conversation.id, "racing", True)],), name="racer", daemon=True
+    )
+    racer.start()
+    time.sleep(0.05)
+    # close() flushes and stops the writer thread while the racer is about to buffer its row
+    writer.close()
+    gate.set()
+    racer.join(2)
+    assert not racer.is_alive()
+    assert stored(db) == ["before", "racing"]
+
+def test_failed_batch_raises_in_the_waiting_writer(db, conversation):
+    writer = MessageWriter(flush_interval_ms=10, durability="batch")
+    with pytest.raises(Exception):
+        writer.write([message_row(conversation.id, "bad", "not a boolean")])
+    assert writer.stats()["errors"] == 1
+    writer.write([message_row(conversation.id, "ok", True)])
+    assert stored(db) == ["ok"]
+    writer.close()
+
+def test_unknown_durability_is_rejected():
+    with pytest.raises(ValueError):
+        MessageWriter(durability="eventually")
@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+import models
+from migrate import upgrade
+
+# Tables as created by the release before model versions, integrations and idempotent messages
+OLD_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) UNIQUE, email VARCHAR(100) UNIQUE,"
+    " hashed_password VARCHAR(100), role VARCHAR(20))",
+    "CREATE TABLE bots (id INTEGER PRIMARY KEY, name VARCHAR(50) UNIQUE, description TEXT,"
+    " personality VARCHAR(100), owner_id INTEGER REFERENCES users(id))",
+    "CREATE TABLE scripts (id INTEGER PRIMARY KEY, content TEXT, bot_id INTEGER REFERENCES bots(id))",
+    "CREATE TABLE conversations (id INTEGER PRIMARY KEY, platform VARCHAR(20), user_id VARCHAR(100),"
+    " bot_id INTEGER REFERENCES bots(id))",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, content TEXT, is_from_user BOOLEAN, timestamp DATETIME,"
+    " conversation_id INTEGER REFERENCES conversations(id))",
+    "INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'owner', 'owner@example.com', 'x')",
+    "INSERT INTO bots (id, name, owner_id) VALUES (1, 'faq-bot', 1)",
+    "INSERT INTO scripts (id, content, bot_id) VALUES (1, 'Our opening hours are nine to five', 1)",
+    # Created twice by concurrent first messages
+    "INSERT INTO conversations (id, platform, user_id, bot_id) VALUES (1, 'telegram', 'u1', 1), (2, 'telegram', 'u1', 1)",
+    "INSERT INTO messages (id, content, is_from_user, conversation_id) VALUES (1, 'hi', 1, 1), (2, 'hello', 1, 2)",
+]
+
+def test_upgrades_a_database_from_the_previous_release(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in OLD_SCHEMA:
+            conn.execute(text(statement))
+
+    planned = upgrade(engine, dry_run=True)
+    assert "ALTER TABLE bots ADD COLUMN model_version INTEGER DEFAULT 0" in planned
+    assert "CREATE TABLE training_jobs" in planned
+    assert "bot_integrations" not in inspect(engine).get_table_names()
+
+    applied = upgrade(engine)
+    assert "merged 1 duplicate conversations" in applied
+    inspector = inspect(engine)
+    assert {"bot_integrations", "training_jobs", "script_signatures"} <= set(inspector.get_table_names())
+    assert "platform_message_id" in {c["name"] for c in inspector.get_columns("messages")}
+    assert "ux_messages_conversation_platform_message" in {i["name"] for i in inspector.get_indexes("messages")}
+    with Session(engine) as session:
+        bot = session.get(models.Bot, 1)
+        assert bot.model_version == 0 and bot.response_threshold == 0.3
+        assert [m.conversation_id for m in session.query(models.Message).order_by(models.Message.id)] == [1, 1]
+        session.add(models.Script(content="Refunds take a week", bot_id=1, duplicate_of=1))
+        session.commit()
+
+    assert upgrade(engine) == []
+    engine.dispose()
@@ -0,0 +1,78 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from model_registry import ModelRegistry
+from training import get_trainer, train_bot, invalidate_model, registry
+import models
+
+class FakeVectorizer:
+    vocabulary_ = {}
+
+class FakeTrainer:
+    def __init__(self, rows):
+        self.vectorizer = FakeVectorizer()
+        self.trained_data = csr_matrix(np.ones((rows, 10)))
+        self.raw_texts = []
+
+def test_version_mismatch_is_a_miss():
+    reg = ModelRegistry()
+    trainer = FakeTrainer(1)
+    reg.put(1, 3, trainer)
+    assert reg.get(1, 3) is trainer
+    assert reg.get(1, 4) is None
+    assert 1 not in reg
+
+def test_lru_eviction_over_budget():
+    reg = ModelRegistry(max_bytes=3000)
+    reg.put(1, 0, FakeTrainer(10))
+    reg.put(2, 0, FakeTrainer(10))
+    reg.get(1, 0)
+    reg.put(3, 0, FakeTrainer(10))
+    assert 1 in reg and 3 in reg
+    assert 2 not in reg
+    assert reg.total_bytes <= 3000
+
+def test_train_bot_refreshes_registry(db, bot):
+    registry.clear()
+    train_bot(bot.id, db)
+    trainer = get_trainer(bot, db)
+    assert get_trainer(bot, db) is trainer
+
+    train_bot(bot.id, db)
+    assert bot.model_version == 2
+    retrained = get_trainer(bot, db)
+    assert retrained is not trainer
+    assert "opening hours" in retrained.generate_response("what are your opening hours")
+
+    invalidate_model(bot.id, db)
+    assert bot.id not in registry
+
+def test_footprint_and_admin_residency_listing(db, bot):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from auth import get_current_active_user
+    from routers.admin import router
+
+    train_bot(bot.id, db)
+    registry.clear()
+    trainer = get_trainer(bot, db)
+    assert trainer.trained_data.dtype == np.float32
+    assert trainer.index.postings_weights.dtype == np.float32
+
+    app = FastAPI()
+    app.include_router(router)
+    user = db.query(models.User).first()
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    client = TestClient(app)
+    assert client.get("/api/admin/models").status_code == 403
+
+    user.role = "admin"
+    body = client.get("/api/admin/models").json()
+    assert body["total_bytes"] == registry.total_bytes
+    [resident] = body["models"]
+    assert resident["bot_id"] == bot.id
+    footprint = resident["footprint"]
+    # Served from the mapped artifact, so nothing large is private to this worker
+    assert footprint["mapped"] > 0
+    assert footprint["matrix"] == footprint["index"] == footprint["vocabulary"] == footprint["texts"] == 0
+    assert footprint["profile"] > 0
+    assert resident["bytes"] == sum(v for k, v in footprint.items() if k != "mapped")
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+from nlp_resources import get_stopwords
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def test_stopwords_are_vendored_and_cached():
+    words = get_stopwords('english')
+    assert len(words) == 179
+    assert {"the", "and", "don't"} <= words
+    assert get_stopwords('english') is words
+
+def test_importing_training_defers_heavy_libraries():
+    code = (
+        "import sys, training, routers.bots, routers.scripts, routers.webhooks; "
+        "print(sorted(m for m in ('numpy', 'scipy', 'sklearn', 'nltk') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from auth import get_current_active_user
+from database import get_db
+import integrations
+import models
+import outbound
+from integrations import Credentials, integration_cache
+from outbound import OutboundMessage, OutboundSender, RateLimit, SendQueueFull
+
+class StubAPI:
+    """Local HTTP server standing in for the platform APIs.
+
+    Responses are scripted per path as (status, headers, body, delay);
+    paths without a script answer 200 after default_delay.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.scripts = {}
+        self.default_delay = 0.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append((self.command, self.path, {k.lower(): v for k, v in self.headers.items()}, json.loads(body or b"null")))
+                script = stub.scripts.get(self.path)
+                status, headers, payload, delay = script.pop(0) if script else (200, {}, {"ok": True}, stub.default_delay)
+                time.sleep(delay)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_POST = do_PATCH = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class StaticIntegrations:
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def cached(self, bot_id, platform):
+        return True, self.credentials.get((bot_id, platform))
+
+@pytest.fixture
+def stub():
+    api = StubAPI()
+    yield api
+    api.close()
+
+def sender_for(stub, **kwargs):
+    credentials = {
+        (1, "whatsapp"): Credentials("phone-1", "wa-token"),
+        (1, "telegram"): Credentials(None, "tg-token"),
+        (1, "instagram"): Credentials("ig-1", "ig-token"),
+    }
+    kwargs.setdefault("backoff", 0.01)
+    return OutboundSender(
+        api_urls={platform: stub.url for platform in ("whatsapp", "telegram", "instagram", "discord")},
+        integrations=StaticIntegrations(credentials),
+        **kwargs
+    )
+
+async def test_replies_are_sent_in_each_platform_format(stub):
+    sender = sender_for(stub)
+    await sender.send(OutboundMessage("whatsapp", 1, "1555", "hi"))
+    await sender.send(OutboundMessage("telegram", 1, "42", "hi"))
+    await sender.send(OutboundMessage("instagram", 1, "9", "hi"))
+    await sender.send(OutboundMessage("discord", 1, "u1", "hi", reply_to="app/token"))
+    await sender.send(OutboundMessage("whatsapp", 2, "1555", "no credentials"))
+    await sender.drain(timeout=5)
+    sent = {path: (method, headers.get("authorization"), body) for method, path, headers, body in stub.requests}
+    assert sent == {
+        "/phone-1/messages": ("POST", "Bearer wa-token", {
+            "messaging_product": "whatsapp", "to": "1555", "type": "text", "text": {"body": "hi"}
+        }),
+        "/bottg-token/sendMessage": ("POST", None, {"chat_id": "42", "text": "hi"}),
+        "/ig-1/messages": ("POST", "Bearer ig-token", {"recipient": {"id": "9"}, "message": {"text": "hi"}}),
+        "/webhooks/app/token/messages/@original": ("PATCH", None, {"content": "hi"}),
+    }
+    assert sender.metrics()["sent"] == 4 and sender.metrics()["skipped"] == 1
+
+async def test_rate_limits_and_server_errors_are_retried(stub):
+    stub.scripts["/phone-1/messages"] = [
+        (429, {"Retry-After": "0.3"}, {}, 0),
+        (503, {}, {}, 0),
+        (200, {}, {}, 0),
+    ]
+    stub.scripts["/bottg-token/sendMessage"] = [(400, {}, {"description": "chat not found"}, 0)]
+    sender = sender_for(stub)
+    failures = []
+    start = time.monotonic()
+    await sender.send(OutboundMessage("whatsapp", 1, "1555", "hi", on_failure=lambda: failures.append("whatsapp")))
+    await sender.send(OutboundMessage("telegram", 1, "42", "hi", on_failure=lambda: failures.append("telegram")))
+    await sender.drain(timeout=5)
+    assert failures == ["telegram"]
+    assert time.monotonic() - start >= 0.3
+    assert [path for _, path, _, _ in stub.requests].count("/phone-1/messages") == 3
+    # Client errors other than 429 are not retried
+    assert [path for _, path, _, _ in stub.requests].count("/bottg-token/sendMessage") == 1
+    metrics = sender.metrics()
+    assert (metrics["sent"], metrics["failed"], metrics["retried"], metrics["rate_limited"]) == (1, 1, 2, 1)
+
+async def test_only_failures_to_connect_are_retried(stub, monkeypatch):
+    monkeypatch.setattr(outbound, "OUTBOUND_TIMEOUT_SECONDS", 0.2)
+    # The platform may have accepted a request whose response timed out, so it is not sent again
+    stub.scripts["/phone-1/messages"] = [(200, {}, {}, 0.5)]
+    sender = sender_for(stub, max_retries=2)
+    await sender.send(OutboundMessage("whatsapp", 1, "1555", "hi"))
+    await sender.drain(timeout=5)
+    assert [path for _, path, _, _ in stub.requests].count("/phone-1/messages") == 1
+    assert (sender.metrics()["failed"], sender.metrics()["retried"]) == (1, 0)
+
+    closed = sender_for(stub, max_retries=2)
+    # Nothing listens on port 9 (discard), so the connection is refused
+    closed.api_urls = dict(closed.api_urls, whatsapp="http://127.0.0.1:9")
+    await closed.send(OutboundMessage("whatsapp", 1, "1555", "hi"))
+    await closed.drain(timeout=5)
+    assert (closed.metrics()["failed"], closed.metrics()["retried"]) == (1, 2)
+
+def test_bot_buckets_are_bounded(stub):
+    sender = sender_for(stub, max_bot_buckets=2)
+    first = sender._bucket("whatsapp", 1)
+    sender._bucket("whatsapp", 2)
+    assert sender._bucket("whatsapp", 1) is first
+    sender._bucket("whatsapp", 3)
+    # Bot 2 was used least recently
+    assert set(sender._bot_buckets) == {("whatsapp", 1), ("whatsapp", 3)}
+    assert sender._bucket("whatsapp") is sender._bucket("whatsapp")
+
+async def test_bot_bucket_paces_sends_while_slow_responses_overlap(stub):
+    stub.default_delay = 0.2
+    limits = {"whatsapp": {"platform": RateLimit(1000, 1000), "bot": RateLimit(20, 1)}}
+    sender = sender_for(stub, workers=8, rate_limits=limits)
+    start = time.monotonic()
+    for i in range(8):
+        await sender.send(OutboundMessage("whatsapp", 1, "1555", str(i)))
+    await sender.drain(timeout=5)
+    elapsed = time.monotonic() - start
+    # 8 sends at 20/s take 0.35s to start; sequential 0.2s responses would take 1.6s
+    assert 0.35 <= elapsed < 1.2
+    assert sender.metrics()["sent"] == 8
+
+async def test_full_send_queue_is_reported(stub):
+    stub.default_delay = 0.3
+    sender = sender_for(stub, maxsize=1, workers=1)
+    sender.send_nowait(OutboundMessage("whatsapp", 1, "1555", "a"))
+    await asyncio.sleep(0.05)
+    sender.send_nowait(OutboundMessage("whatsapp", 1, "1555", "b"))
+    with pytest.raises(SendQueueFull):
+        sender.send_nowait(OutboundMessage("whatsapp", 1, "1555", "c"))
+    await sender.drain(timeout=5)
+    assert sender.metrics()["sent"] == 2
+
+def test_integration_endpoint_updates_cached_credentials(db, bot, monkeypatch):
+    from routers.bots import router
+    monkeypatch.setattr(integrations, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+    integration_cache.clear()
+    assert integration_cache.get(bot.id, "whatsapp") == Credentials()
+    assert integration_cache.get(999, "whatsapp") is None
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    client = TestClient(app)
+    url = f"/api/bots/{bot.id}/integrations/whatsapp"
+    body = client.put(url, json={"account_id": "phone-1", "access_token": "secret"}).json()
+    assert body == {
+        "bot_id": bot.id, "platform": "whatsapp", "account_id": "phone-1",
+        "has_access_token": True, "has_webhook_secret": False
+    }
+    assert integration_cache.get(bot.id, "whatsapp") == Credentials("phone-1", "secret")
+    client.put(url, json={"access_token": "rotated"})
+    assert integration_cache.get(bot.id, "whatsapp") == Credentials("phone-1", "rotated")
+    assert client.put(f"/api/bots/{bot.id}/integrations/myspace", json={}).status_code == 400
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import pytest
+from sqlalchemy.orm import sessionmaker
+import message_writer
+import models
+import pipeline as pipeline_module
+import routers.webhooks
+import training
+from training import train_bot
+from pipeline import InboundBatch, InboundMessage, MessagePipeline, QueueFull, RetryLater, process_batch
+
+def whatsapp(text, sender="15550001"):
+    return {"messages": [{"from": sender, "text": {"body": text}}]}
+
+async def test_submit_returns_before_processing_and_drain_finishes_the_queue():
+    release = threading.Event()
+    handled, delivered = [], []
+    def handler(batch):
+        release.wait(5)
+        handled.extend(message.text for message in batch.messages)
+        return [f"re: {message.text}" for message in batch.messages]
+    pipeline = MessagePipeline(maxsize=10, workers=2, handler=handler, deliver=lambda m, r: delivered.append(r))
+    for i in range(5):
+        pipeline.submit(InboundMessage("whatsapp", 1, f"user{i}", f"m{i}"))
+    await asyncio.sleep(0.05)
+    assert handled == [] and pipeline.metrics()["in_flight"] == 2
+
+    release.set()
+    await pipeline.drain(timeout=5)
+    assert sorted(handled) == [f"m{i}" for i in range(5)]
+    assert sorted(delivered) == [f"re: m{i}" for i in range(5)]
+    metrics = pipeline.metrics()
+    assert metrics["processed"] == 5 and metrics["depth"] == 0 and metrics["max_depth"] >= 3
+    with pytest.raises(QueueFull):
+        pipeline.submit(InboundMessage("whatsapp", 1, "u", "late"))
+
+async def test_full_queue_rejects_and_failures_are_counted():
+    release = threading.Event()
+    def handler(batch):
+        release.wait(5)
+        raise ValueError("boom")
+    pipeline = MessagePipeline(maxsize=1, workers=1, handler=handler)
+    pipeline.submit(InboundMessage("whatsapp", 1, "u", "a"))
+    await asyncio.sleep(0.05)
+    pipeline.submit(InboundMessage("whatsapp", 1, "u", "b"))
+    with pytest.raises(QueueFull):
+        pipeline.submit(InboundMessage("whatsapp", 1, "u", "c"))
+    release.set()
+    await pipeline.drain(timeout=5)
+    assert pipeline.metrics()["failed"] == 2 and pipeline.metrics()["rejected"] == 1
+
+async def test_messages_left_by_a_timed_out_drain_are_processed_after_a_restart():
+    release = threading.Event()
+    handled = []
+    def handler(batch):
+        release.wait(5)
+        handled.extend(message.text for message in batch.messages)
+        return [None] * len(batch)
+    pipeline = MessagePipeline(maxsize=10, workers=1, handler=handler, batch_size=1)
+    for text in ("a", "b", "c"):
+        pipeline.submit(InboundMessage("whatsapp", 1, "u", text))
+    await asyncio.sleep(0.05)
+    # "a" is in flight when the drain gives up; the handler's thread still finishes it
+    threading.Timer(0.1, release.set).start()
+    await pipeline.drain(timeout=0.05)
+    assert handled == ["a"] and pipeline.metrics()["depth"] == 2
+
+    pipeline.start()
+    pipeline.submit(InboundMessage("whatsapp", 1, "u", "d"))
+    await pipeline.drain(timeout=5)
+    assert handled == ["a", "b", "c", "d"]
+    assert pipeline.metrics()["depth"] == 0
+
+async def test_deferred_conversations_wait_without_holding_a_worker():
+    handled, attempts = [], []
+    def handler(batch):
+        attempts.append([message.text for message in batch.messages])
+        if batch.conversation_key[1] == "cold" and len(attempts) == 1:
+            raise RetryLater(0.2)
+        handled.extend(message.text for message in batch.messages)
+        return [None] * len(batch)
+    pipeline = MessagePipeline(maxsize=10, workers=1, handler=handler)
+    pipeline.submit(InboundMessage("whatsapp", 1, "cold", "c1"))
+    await asyncio.sleep(0.05)
+    # The only worker is free for other conversations; the deferred one keeps its order
+    pipeline.submit(InboundMessage("whatsapp", 1, "cold", "c2"))
+    pipeline.submit(InboundMessage("whatsapp", 1, "warm", "w1"))
+    await asyncio.sleep(0.05)
+    assert handled == ["w1"] and pipeline.metrics()["deferred"] == 1
+    await pipeline.drain(timeout=5)
+    assert handled == ["w1", "c1", "c2"] and attempts[-1] == ["c1", "c2"]
+    assert pipeline.metrics()["processed"] == 3 and pipeline.metrics()["failed"] == 0
+
+def test_messages_for_a_model_in_training_are_retried_until_the_wait_runs_out(db, bot, monkeypatch):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    monkeypatch.setattr(pipeline_module, "SessionLocal", session)
+    monkeypatch.setattr(message_writer, "SessionLocal", session)
+    def respond_many(bot, db, queries):
+        raise training.ModelNotReady(bot.id, None)
+    monkeypatch.setattr(training, "respond_many", respond_many)
+    batch = InboundBatch([InboundMessage("whatsapp", bot.id, "1555", "hours?", message_id="wamid.1")])
+    with pytest.raises(RetryLater):
+        process_batch(batch)
+    # Not claimed meanwhile, so the retry can claim it
+    assert db.query(models.Message).count() == 0
+
+    monkeypatch.setattr(pipeline_module, "PIPELINE_MODEL_WAIT_SECONDS", 0)
+    with pytest.raises(training.ModelNotReady):
+        process_batch(batch)
+    assert db.query(models.Message).count() == 0
+
+async def test_each_conversation_is_in_order_and_a_slow_one_blocks_only_itself():
+    slow = threading.Event()
+    handled = []
+    def handler(batch):
+        for message in batch.messages:
+            if message.user_id == "slow":
+                slow.wait(5)
+            handled.append((message.user_id, message.text))
+    pipeline = MessagePipeline(maxsize=100, workers=3, handler=handler, batch_size=1)
+    for i in range(3):
+        pipeline.submit(InboundMessage("whatsapp", 1, "slow", str(i)))
+    for i in range(10):
+        for user in ("a", "b"):
+            pipeline.submit(InboundMessage("whatsapp", 1, user, str(i)))
+    await asyncio.sleep(0.2)
+    assert not any(user == "slow" for user, _ in handled)
+    assert len(handled) == 20
+    assert pipeline.metrics()["in_flight"] == 1
+
+    slow.set()
+    await pipeline.drain(timeout=5)
+    for user in ("slow", "a", "b"):
+        texts = [text for u, text in handled if u == user]
+        assert texts == sorted(texts, key=int) and len(texts) == (3 if user == "slow" else 10)
+    assert pipeline.metrics()["conversations"] == 0
+
+def test_process_batch_stores_messages_and_replies_in_order(db, bot, monkeypatch):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    monkeypatch.setattr(pipeline_module, "SessionLocal", session)
+    monkeypatch.setattr(message_writer, "SessionLocal", session)
+    train_bot(bot.id, db)
+    texts = ["what are your opening hours", "price of the basic plan", "what are your opening hours"]
+    replies = process_batch(InboundBatch([InboundMessage("whatsapp", bot.id, "15550001", text) for text in texts]))
+    assert "opening hours" in replies[0] and "basic plan" in replies[1] and replies[2] == replies[0]
+    conversation = db.query(models.Conversation).one()
+    assert (conversation.platform, conversation.user_id, conversation.bot_id) == ("whatsapp", "15550001", bot.id)
+    assert [(m.is_from_user, m.content) for m in db.query(models.Message).order_by(models.Message.id)] == [
+        (True, texts[0]), (False, replies[0]), (True, texts[1]), (False, replies[1]), (True, texts[2]), (False, replies[2])
+    ]
+
+async def test_messages_queued_behind_each_other_are_batched_per_conversation():
+    release = threading.Event()
+    batches = []
+    def handler(batch):
+        release.wait(5)
+        batches.append([(m.user_id, m.text) for m in batch.messages])
+    pipeline = MessagePipeline(maxsize=100, workers=1, handler=handler, batch_size=3)
+    pipeline.submit(InboundMessage("whatsapp", 1, "a", "0"))
+    await asyncio.sleep(0.05)
+    pipeline.submit_many([InboundMessage("whatsapp", 1, user, str(i)) for i in range(1, 5) for user in ("a", "b")])
+    with pytest.raises(QueueFull):
+        pipeline.submit_many([InboundMessage("whatsapp", 1, "c", str(i)) for i in range(100)])
+    release.set()
+    await pipeline.drain(timeout=5)
+    assert batches == [
+        [("a", "0")],
+        [("b", "1"), ("b", "2"), ("b", "3")],
+        [("a", "1"), ("a", "2"), ("a", "3")],
+        [("b", "4")],
+        [("a", "4")],
+    ]
+    metrics = pipeline.metrics()
+    assert metrics["processed"] == 9 and metrics["batches"] == 5 and metrics["rejected"] == 100
+
+def test_webhook_acknowledges_and_queues(bot, webhook_client, monkeypatch):
+    received = []
+    test_pipeline = MessagePipeline(maxsize=1, workers=1, handler=lambda b: received.extend(b.messages) or threading.Event().wait(0.5))
+    monkeypatch.setattr(routers.webhooks, "pipeline", test_pipeline)
+    monkeypatch.setattr(routers.webhooks, "WEBHOOK_SIGNATURES", "optional")
+    url = f"/api/social/whatsapp/webhook/{bot.id}"
+    assert webhook_client.post(url, json=whatsapp("hi")).json() == {"status": "queued"}
+    assert webhook_client.post(url, json={"statuses": []}).json() == {"status": "ignored"}
+    webhook_client.post(url, json=whatsapp("second"))
+    full = webhook_client.post(url, json=whatsapp("third"))
+    assert full.status_code == 503 and full.headers["Retry-After"] == "1"
+    assert webhook_client.post("/api/social/whatsapp/webhook/999", json=whatsapp("hi")).status_code == 404
+    assert webhook_client.post(url, content=b"{oops").status_code == 400
+    two = {"messages": [{"from": "1", "text": {"body": "a"}}, {"from": "2", "text": {"body": "b"}}]}
+    assert webhook_client.post(url, json=two).status_code == 503
+    assert webhook_client.post(f"/api/social/myspace/webhook/{bot.id}", json=whatsapp("hi")).status_code == 400
+    assert received[0].text == "hi" and received[0].user_id == "15550001"
@@ -0,0 +1,48 @@
+import json
+import pytest
+from platforms import InvalidPayload, get_adapter
+
+def decode(platform, payload):
+    adapter = get_adapter(platform)
+    decoded = adapter.decode(json.dumps(payload).encode())
+    return adapter, decoded, adapter.messages(decoded, 7)
+
+def test_whatsapp_flat_and_cloud_api_shapes():
+    _, _, messages = decode("whatsapp", {
+        "messages": [
+            {"from": "1555", "id": "wamid.1", "text": {"body": "hi"}, "type": "text"},
+            {"from": "1555", "id": "wamid.2", "type": "image", "image": {"id": "x"}},
+        ],
+        "entry": [{"changes": [{"value": {"messages": [{"from": "1666", "text": {"body": "hello"}}]}}]}],
+    })
+    assert [(m.platform, m.bot_id, m.user_id, m.text, m.message_id) for m in messages] == [
+        ("whatsapp", 7, "1555", "hi", "wamid.1"), ("whatsapp", 7, "1666", "hello", None)
+    ]
+    adapter, status, messages = decode("whatsapp", {"statuses": [{"id": "wamid.1"}]})
+    assert messages == [] and adapter.acknowledgement(status, 0) == {"status": "ignored"}
+
+def test_telegram_instagram_and_discord():
+    _, _, messages = decode("telegram", {"update_id": 1, "message": {"message_id": 5, "chat": {"id": 42}, "text": "hi"}})
+    assert [(m.user_id, m.text, m.message_id) for m in messages] == [("42", "hi", "42:5")]
+
+    _, _, messages = decode("instagram", {"object": "instagram", "entry": [{"messaging": [
+        {"sender": {"id": "9"}, "message": {"mid": "m1", "text": "price?"}},
+        {"sender": {"id": "7"}, "message": {"mid": "m2", "text": "ours", "is_echo": True}},
+    ]}]})
+    assert [(m.user_id, m.text, m.message_id) for m in messages] == [("9", "price?", "m1")]
+
+    adapter, ping, messages = decode("discord", {"type": 1, "id": "1"})
+    assert messages == [] and adapter.acknowledgement(ping, 0) == {"type": 1}
+    adapter, command, messages = decode("discord", {
+        "type": 2, "id": "i1", "member": {"user": {"id": "u1"}},
+        "data": {"name": "ask", "options": [{"name": "question", "value": "opening hours"}]}
+    })
+    assert [(m.user_id, m.text) for m in messages] == [("u1", "opening hours")]
+    assert adapter.acknowledgement(command, 1) == {"type": 5}
+
+def test_malformed_bodies_are_rejected():
+    with pytest.raises(InvalidPayload):
+        get_adapter("whatsapp").decode(b"{not json")
+    with pytest.raises(InvalidPayload):
+        get_adapter("telegram").decode(b'{"message": {"chat": {"id": "not a number"}}}')
+    assert get_adapter("myspace") is None
@@ -0,0 +1,70 @@
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from auth import get_current_active_user
+from database import get_db
+from response_cache import ResponseCache, response_cache
+from routers.bots import router
+from training import FALLBACK_RESPONSE, respond, respond_many, train_bot, registry
+import models
+
+def test_normalized_queries_share_an_entry_per_version():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put(1, 1, "Opening hours?", 0.3, "nine to five")
+    assert cache.get(1, 1, "opening   HOURS", 0.3) == "nine to five"
+    assert cache.get(1, 1, "opening hours", 0.5) is None
+    assert cache.get(1, 2, "opening hours", 0.3) is None
+    assert cache.get(1, 1, "opening hours", 0.3) is None
+    assert cache.stats(1)["hits"] == 1 and cache.stats(1)["misses"] == 3
+
+def test_lru_and_ttl_eviction():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    cache.put(1, 1, "a", 0.3, "A")
+    cache.put(1, 1, "b", 0.3, "B")
+    assert cache.get(1, 1, "a", 0.3) == "A"
+    cache.put(1, 1, "c", 0.3, "C")
+    assert cache.get(1, 1, "b", 0.3) is None
+    assert cache.stats(1)["entries"] == 2
+    time.sleep(0.06)
+    assert cache.get(1, 1, "a", 0.3) is None
+
+def test_least_recently_used_bots_are_dropped():
+    cache = ResponseCache(max_entries=10, ttl=60, max_bots=2)
+    cache.put(1, 1, "a", 0.3, "A")
+    cache.put(2, 1, "a", 0.3, "B")
+    assert cache.get(1, 1, "a", 0.3) == "A"
+    cache.put(3, 1, "a", 0.3, "C")
+    assert len(cache) == 2
+    assert cache.stats(2)["entries"] == 0 and cache.get(1, 1, "a", 0.3) == "A"
+
+def test_respond_serves_repeats_from_cache_until_retrained(db, bot):
+    registry.clear()
+    response_cache.clear()
+    train_bot(bot.id, db)
+    first = respond(bot, db, "what are your opening hours")
+    registry.clear()
+    assert respond(bot, db, "What are your opening hours?") == first
+    assert bot.id not in registry
+
+    db.add(models.Script(content="Our opening hours on Saturday are ten to two", bot_id=bot.id))
+    db.commit()
+    train_bot(bot.id, db)
+    assert response_cache.stats(bot.id)["entries"] == 0
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_active_user] = lambda: db.query(models.User).first()
+    stats = TestClient(app).get(f"/api/bots/{bot.id}/response-cache").json()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_respond_many_scores_only_cache_misses(db, bot):
+    registry.clear()
+    response_cache.clear()
+    train_bot(bot.id, db)
+    cached = respond(bot, db, "what are your opening hours")
+    replies = respond_many(bot, db, ["Opening hours?", "what are your opening hours", "basic plan price", "basic plan price", "weather"])
+    assert replies[1] == cached and "basic plan" in replies[2] and replies[3] == replies[2]
+    assert replies[4] == FALLBACK_RESPONSE
+    # The repeated query is a hit; every distinct miss was scored once and cached
+    assert response_cache.stats(bot.id)["hits"] == 1 and response_cache.stats(bot.id)["entries"] == 4
@@ -0,0 +1,31 @@
+import os
+import io
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+from artifacts import artifact_path
+from retrain_all import list_bot_ids, retrain_all
+
+def test_retrains_every_bot_and_reports_failures(db, bot, monkeypatch):
+    empty = models.Bot(name="empty-bot", description="No scripts", owner_id=bot.owner_id)
+    db.add(empty)
+    db.commit()
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+
+    # Bots without scripts are not retrained, so their model version is not bumped
+    assert list_bot_ids(db) == [bot.id]
+    assert list_bot_ids(db, [empty.id]) == []
+    out = io.StringIO()
+    summary = retrain_all(list_bot_ids(db) + [-1], workers=1, executor=ThreadPoolExecutor(1), out=out)
+
+    assert summary["bots"] == 2
+    assert summary["trained"] == 1 and summary["failed"] == 1
+    assert summary["documents"] == 3
+    db.expire_all()
+    assert bot.model_version == 1
+    assert not empty.model_version
+    assert os.path.isdir(artifact_path(bot.id, 1))
+    lines = out.getvalue().splitlines()
+    assert any(line.startswith(f"bot {bot.id}: v1 3 docs") for line in lines)
+    assert any(line.startswith("bot -1: failed: No training data") for line in lines)
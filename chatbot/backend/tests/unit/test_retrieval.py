@@ -0,0 +1,59 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from retrieval import InvertedIndex
+from training import ChatbotTrainer
+
+def synthetic_corpus(n_docs, seed=0):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"term{i}" for i in range(400)]
+    # Zipf-like term popularity so some postings are long and most are short
+    popularity = 1.0 / np.arange(1, len(vocabulary) + 1)
+    popularity /= popularity.sum()
+    return [
+        " ".join(rng.choice(vocabulary, size=rng.integers(3, 30), p=popularity))
+        for _ in range(n_docs)
+    ]
+
+def brute_force(query_vec, matrix, k):
+    similarities = cosine_similarity(query_vec, matrix).ravel()
+    order = np.lexsort((np.arange(len(similarities)), -similarities))[:k]
+    return order, similarities[order]
+
+def test_top_k_matches_brute_force():
+    corpus = synthetic_corpus(2000)
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), max_features=5000)
+    matrix = vectorizer.fit_transform(corpus)
+    index = InvertedIndex.from_matrix(matrix)
+
+    for query in synthetic_corpus(200, seed=1):
+        query_vec = vectorizer.transform([query])
+        for k in (1, 5, 20):
+            doc_ids, scores = index.search(query_vec, k=k)
+            expected_ids, expected_scores = brute_force(query_vec, matrix, k)
+            positive = expected_scores > 0
+            assert np.allclose(scores, expected_scores[positive], atol=1e-9)
+            # Indices may only differ where scores tie
+            for doc_id, expected_id, score in zip(doc_ids, expected_ids, scores):
+                if doc_id != expected_id:
+                    assert np.isclose(cosine_similarity(query_vec, matrix[doc_id])[0, 0], score)
+
+def test_query_without_known_terms_returns_nothing():
+    vectorizer = TfidfVectorizer()
+    index = InvertedIndex.from_matrix(vectorizer.fit_transform(["alpha beta", "gamma"]))
+    doc_ids, scores = index.search(vectorizer.transform(["delta"]), k=3)
+    assert len(doc_ids) == 0 and len(scores) == 0
+
+def test_generate_response_matches_brute_force_path(db, bot):
+    trainer = ChatbotTrainer(bot.id)
+    trainer.train(db)
+    for query in ["what are the opening hours", "price of the plan", "password reset", "weather"]:
+        query_vec = trainer.vectorizer.transform([trainer.preprocess_text(query)])
+        # Rows are already normalized; query terms outside the corpus count towards the norm only
+        similarities = (query_vec @ trainer.trained_data.T).toarray()
+        best = np.argmax(similarities)
+        if similarities[0, best] < 0.3:
+            expected = "I'm not sure how to respond to that. Could you rephrase?"
+        else:
+            expected = trainer.raw_texts[best]
+        assert trainer.generate_response(query) == expected
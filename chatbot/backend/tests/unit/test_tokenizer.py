@@ -0,0 +1,34 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+import tokenizer
+from tokenizer import Analyzer, tokenize, tokenize_chunks, tokenize_many
+
+STOP_WORDS = ["i", "a", "the", "can", "not", "is", "to"]
+
+def test_tokenize_matches_previous_pipeline():
+    assert tokenize("Hello, World!  How's it going?") == ["hello", "world", "hows", "it", "going"]
+    assert tokenize("I cannot wait, gonna be great") == ["i", "can", "not", "wait", "gon", "na", "be", "great"]
+    assert tokenize("Price: $10.99\nper\tmonth") == ["price", "1099", "per", "month"]
+    assert tokenize("naïve café a_b") == ["naïve", "café", "a_b"]
+
+def test_analyzer_matches_sklearn_word_analyzer():
+    reference = TfidfVectorizer(stop_words=STOP_WORDS, ngram_range=(1, 2)).build_analyzer()
+    analyzer = Analyzer(STOP_WORDS)
+    for text in [
+        "The price is 10 dollars, a month!",
+        "I cannot reset my password to the old one",
+        "x y zz opening hours are 9 to 5",
+    ]:
+        preprocessed = " ".join(tokenize(text))
+        assert analyzer(text) == reference(preprocessed)
+        assert analyzer(tokenize(text)) == reference(preprocessed)
+
+def test_parallel_batch_matches_serial(monkeypatch):
+    monkeypatch.setattr(tokenizer, "PARALLEL_TOKENIZE_MIN_DOCS", 10)
+    texts = [f"Script number {i}: opening hours, prices and refunds!" for i in range(50)]
+    assert tokenize_many(texts, workers=2) == tokenize_many(texts, workers=1)
+
+def test_parallel_chunk_stream_matches_serial(monkeypatch):
+    monkeypatch.setattr(tokenizer, "PARALLEL_TOKENIZE_MIN_DOCS", 10)
+    texts = [f"Script number {i}: opening hours, prices and refunds!" for i in range(50)]
+    chunks = [texts[i:i + 7] for i in range(0, len(texts), 7)]
+    assert list(tokenize_chunks(chunks, workers=2)) == [tokenize_many(chunk, workers=1) for chunk in chunks]
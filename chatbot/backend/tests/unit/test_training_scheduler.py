@@ -0,0 +1,149 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import training
+from training import train_bot
+from training_scheduler import DatabaseJobStore, TrainingScheduler, run_training_job
+
+class FakeTraining:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, bot_id, incremental, warm=False):
+        self.calls.append((bot_id, incremental))
+        self.release.wait(5)
+        if bot_id < 0:
+            raise ValueError("No training data found for this bot")
+        return {"model_version": 2, "corpus_size": 42, "personality_profile": {}}
+
+def wait_for(job, status, scheduler=None):
+    # With a scheduler, wait until it reports the status for the job
+    read = (lambda: scheduler.get(job.id).status) if scheduler else (lambda: job.status)
+    deadline = time.monotonic() + 5
+    while read() != status and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read() == status
+
+def make_scheduler(run_job, max_workers=2, store=None, debounce=0.05):
+    return TrainingScheduler(
+        max_workers=max_workers,
+        debounce=debounce,
+        max_delay=1,
+        executor=ThreadPoolExecutor(max_workers),
+        run_job=run_job,
+        store=store
+    )
+
+def test_burst_of_requests_collapses_into_one_job():
+    training = FakeTraining()
+    training.release.set()
+    scheduler = make_scheduler(training)
+    jobs = [scheduler.submit(1, incremental=True) for _ in range(20)]
+    assert len({job.id for job in jobs}) == 1
+    wait_for(jobs[0], "done")
+    assert training.calls == [(1, True)]
+    assert jobs[0].requests == 20
+    assert jobs[0].corpus_size == 42
+    assert jobs[0].duration_seconds is not None
+    scheduler.shutdown()
+
+def test_changes_during_a_run_queue_one_follow_up():
+    training = FakeTraining()
+    scheduler = make_scheduler(training)
+    first = scheduler.submit(1)
+    wait_for(first, "running")
+    second = scheduler.submit(1, incremental=True)
+    third = scheduler.submit(1)
+    assert second is third and second is not first
+    assert not second.incremental
+    assert second.status == "queued"
+    training.release.set()
+    wait_for(second, "done")
+    assert training.calls == [(1, False), (1, False)]
+    scheduler.shutdown()
+
+def test_bots_are_started_in_queue_order_with_bounded_workers():
+    training = FakeTraining()
+    scheduler = make_scheduler(training, max_workers=1)
+    jobs = [scheduler.submit(bot_id) for bot_id in (3, 1, 2)]
+    wait_for(jobs[0], "running")
+    scheduler.submit(3)
+    assert [job.status for job in jobs[1:]] == ["queued", "queued"]
+    training.release.set()
+    wait_for(jobs[2], "done")
+    assert [bot_id for bot_id, _ in training.calls[:3]] == [3, 1, 2]
+    scheduler.shutdown()
+
+def test_failed_job_reports_error():
+    training = FakeTraining()
+    training.release.set()
+    scheduler = make_scheduler(training)
+    job = scheduler.submit(-1)
+    wait_for(job, "failed")
+    assert "No training data" in job.error
+    assert scheduler.get(job.id) is job
+    scheduler.shutdown()
+
+def test_job_status_is_visible_to_other_processes(sessions):
+    store = DatabaseJobStore(sessions)
+    training = FakeTraining()
+    scheduler = make_scheduler(training, store=store)
+    # Another backend process shares only the database
+    other = make_scheduler(training, store=store)
+    job = scheduler.submit(1)
+    assert other.get(job.id).status == "queued"
+    wait_for(job, "running", other)
+    training.release.set()
+    wait_for(job, "done", other)
+    seen = other.get(job.id)
+    assert seen.as_dict() == job.as_dict()
+    assert seen.wait(0)
+    assert other.get("unknown") is None
+    # An older write that arrives late does not overwrite a newer one
+    store.save(dict(job.as_dict(), status="running"), 1)
+    assert other.get(job.id).status == "done"
+    scheduler.shutdown()
+    other.shutdown()
+
+def test_retrain_queued_by_another_process_takes_the_request(sessions):
+    store = DatabaseJobStore(sessions)
+    training_calls = FakeTraining()
+    training_calls.release.set()
+    scheduler = make_scheduler(training_calls, store=store, debounce=0.5)
+    other = make_scheduler(training_calls, store=store)
+    job = scheduler.submit(1, incremental=True)
+    # Not started yet, so it will see the change this request is for
+    assert other.submit(1, incremental=True).id == job.id
+    # An incremental job does not cover a full retrain
+    full = other.submit(1)
+    assert full.id != job.id
+    wait_for(job, "done")
+    wait_for(full, "done")
+    assert sorted(training_calls.calls) == [(1, False), (1, True)]
+    scheduler.shutdown()
+    other.shutdown()
+
+def test_failed_retrain_invalidates_the_model_only_when_scripts_changed(db, bot, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+    train_bot(bot.id, db)
+    db.refresh(bot)
+    version = bot.model_version
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(training, "fit_bot_model", fail)
+    with pytest.raises(OSError):
+        run_training_job(bot.id, incremental=True)
+    db.refresh(bot)
+    assert bot.model_version == version
+
+    db.add(models.Script(content="Delivery takes three to five business days", bot_id=bot.id))
+    db.commit()
+    with pytest.raises(OSError):
+        run_training_job(bot.id, incremental=True)
+    db.refresh(bot)
+    assert bot.model_version == version + 1
@@ -0,0 +1,96 @@
+import json
+import pytest
+from sqlalchemy import event
+import models
+import routers.webhooks
+from pipeline import MessagePipeline
+from signatures import hmac_sha256, verify_signature
+
+@pytest.fixture
+def received(db, bot, monkeypatch):
+    messages = []
+    monkeypatch.setattr(routers.webhooks, "pipeline", MessagePipeline(handler=lambda b: messages.extend(b.messages)))
+    db.add(models.BotIntegration(bot_id=bot.id, platform="whatsapp", webhook_secret="app-secret"))
+    db.add(models.BotIntegration(bot_id=bot.id, platform="telegram", webhook_secret="tg-secret"))
+    db.commit()
+    return messages
+
+def whatsapp_body(text="hi"):
+    return json.dumps({"messages": [{"from": "1555", "text": {"body": text}}]}).encode()
+
+def test_signed_webhooks_need_no_user_token(bot, webhook_client, received):
+    url = f"/api/social/whatsapp/webhook/{bot.id}"
+    body = whatsapp_body()
+    signed = {"X-Hub-Signature-256": "sha256=" + hmac_sha256("app-secret", body)}
+    assert webhook_client.post(url, content=body, headers=signed).json() == {"status": "queued"}
+    assert webhook_client.post(url, content=body, headers={"X-Signature": hmac_sha256("app-secret", body)}).status_code == 200
+    assert webhook_client.post(url, content=whatsapp_body("tampered"), headers=signed).status_code == 401
+    assert webhook_client.post(url, content=body, headers={"X-Hub-Signature-256": "sha256=nope"}).status_code == 401
+    assert webhook_client.post(url, content=body).status_code == 401
+
+    telegram = f"/api/social/telegram/webhook/{bot.id}"
+    update = json.dumps({"message": {"message_id": 1, "chat": {"id": 42}, "text": "hi"}}).encode()
+    assert webhook_client.post(telegram, content=update, headers={"X-Telegram-Bot-Api-Secret-Token": "tg-secret"}).status_code == 200
+    assert webhook_client.post(telegram, content=update, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}).status_code == 401
+
+def test_bots_without_a_secret_are_refused_unless_signatures_are_optional(bot, webhook_client, received, monkeypatch):
+    url = f"/api/social/instagram/webhook/{bot.id}"
+    body = json.dumps({"entry": [{"messaging": [{"sender": {"id": "9"}, "message": {"text": "hi"}}]}]}).encode()
+    assert webhook_client.post(url, content=body).status_code == 401
+    monkeypatch.setattr(routers.webhooks, "WEBHOOK_SIGNATURES", "optional")
+    assert webhook_client.post(url, content=body).status_code == 200
+    assert webhook_client.post("/api/social/instagram/webhook/999", content=body).status_code == 404
+
+def test_verified_webhooks_do_not_query_the_database(db, bot, webhook_client, received):
+    url = f"/api/social/whatsapp/webhook/{bot.id}"
+    body = whatsapp_body()
+    headers = {"X-Hub-Signature-256": "sha256=" + hmac_sha256("app-secret", body)}
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        # Only the first request reads the bot's secret
+        webhook_client.post(url, content=body, headers=headers)
+        assert len(statements) == 1
+        for _ in range(5):
+            assert webhook_client.post(url, content=body, headers=headers).status_code == 200
+        assert len(statements) == 1
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+def test_unknown_bot_ids_cannot_grow_the_credentials_cache(bot, webhook_client, received, monkeypatch):
+    import integrations
+    cache = integrations.IntegrationCache(max_entries=3)
+    monkeypatch.setattr(routers.webhooks, "integration_cache", cache)
+    url = f"/api/social/whatsapp/webhook/{bot.id}"
+    body = whatsapp_body()
+    headers = {"X-Hub-Signature-256": "sha256=" + hmac_sha256("app-secret", body)}
+    assert webhook_client.post(url, content=body, headers=headers).status_code == 200
+    for bot_id in range(1000, 1020):
+        assert webhook_client.post(f"/api/social/whatsapp/webhook/{bot_id}", content=body).status_code == 404
+    assert len(cache) == 4
+    # The real bot's credentials were not pushed out by the made-up ids
+    assert cache.cached(bot.id, "whatsapp")[0]
+
+def test_discord_signatures():
+    assert not verify_signature("discord", "00" * 32, b"{}", {})
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    key = Ed25519PrivateKey.generate()
+    public = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw).hex()
+    headers = {"x-signature-timestamp": "1700000000", "x-signature-ed25519": key.sign(b"1700000000{}").hex()}
+    assert verify_signature("discord", public, b"{}", headers)
+    assert not verify_signature("discord", public, b"{ }", headers)
+
+def test_signed_discord_interactions_are_answered(db, bot, webhook_client, received):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    key = Ed25519PrivateKey.generate()
+    public = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw).hex()
+    db.add(models.BotIntegration(bot_id=bot.id, platform="discord", webhook_secret=public))
+    db.commit()
+    url = f"/api/social/discord/webhook/{bot.id}"
+    ping = b'{"type": 1}'
+    headers = {"X-Signature-Timestamp": "1700000000", "X-Signature-Ed25519": key.sign(b"1700000000" + ping).hex()}
+    assert webhook_client.post(url, content=ping, headers=headers).json() == {"type": 1}
+    assert webhook_client.post(url, content=ping, headers={"X-Signature-Timestamp": "1700000000"}).status_code == 401
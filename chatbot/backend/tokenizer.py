@@ -0,0 +1,94 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List
+import os
+import re
+
+# Corpora at least this large are tokenized across a process pool
+PARALLEL_TOKENIZE_MIN_DOCS = int(os.getenv("PARALLEL_TOKENIZE_MIN_DOCS", "20000"))
+TOKENIZER_WORKERS = int(os.getenv("TOKENIZER_WORKERS", str(os.cpu_count() or 1)))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# NLTK's word_tokenize splits these contractions even without apostrophes
+_CONTRACTIONS = re.compile(r"\b(can)(not)\b|\b(gon|wan)(na)\b|\b(got)(ta)\b|\b(gim|lem)(me)\b")
+
+
+def _split_contraction(match) -> str:
+    return " ".join(part for part in match.groups() if part)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, strip punctuation and split into words using precompiled patterns.
+
+    Produces the same tokens as the previous lower/re.sub/word_tokenize
+    pipeline for punctuation-free text, without the NLTK tokenizer.
+    """
+    text = _PUNCTUATION.sub("", text.lower())
+    text = _CONTRACTIONS.sub(_split_contraction, text)
+    return text.split()
+
+
+def _tokenize_chunk(texts: List[str]) -> List[List[str]]:
+    return [tokenize(text) for text in texts]
+
+
+def tokenize_many(texts: List[str], workers: int = None) -> List[List[str]]:
+    """Tokenize a corpus, spreading large ones across a process pool"""
+    workers = TOKENIZER_WORKERS if workers is None else workers
+    if workers <= 1 or len(texts) < PARALLEL_TOKENIZE_MIN_DOCS:
+        return _tokenize_chunk(texts)
+    chunk_size = max(1000, len(texts) // (workers * 4))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    tokens = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_tokens in pool.map(_tokenize_chunk, chunks):
+            tokens.extend(chunk_tokens)
+    return tokens
+
+
+def tokenize_chunks(chunks: Iterable[List[str]], workers: int = None) -> Iterator[List[List[str]]]:
+    """Tokenize a stream of text chunks, yielding each chunk's token lists in order.
+
+    Chunks are tokenized in-process until PARALLEL_TOKENIZE_MIN_DOCS texts have
+    been seen; the rest go to a process pool with at most two chunks per
+    worker in flight, so only a few chunks are ever held at once.
+    """
+    workers = TOKENIZER_WORKERS if workers is None else workers
+    chunks = iter(chunks)
+    seen = 0
+    for chunk in chunks:
+        yield _tokenize_chunk(chunk)
+        seen += len(chunk)
+        if workers > 1 and seen >= PARALLEL_TOKENIZE_MIN_DOCS:
+            break
+    else:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_tokenize_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Analyzer:
+    """Vectorizer analyzer producing unigram and bigram features.
+
+    Accepts raw text or an already tokenized document, so training can
+    tokenize once and hand the tokens straight to the vectorizer. Matches
+    the features of a word analyzer with token_pattern \\w\\w+, the given
+    stop words and ngram_range=(1, 2).
+    """
+
+    def __init__(self, stop_words: Iterable[str]):
+        self.stop_words = frozenset(stop_words)
+
+    def __call__(self, doc) -> List[str]:
+        tokens = tokenize(doc) if isinstance(doc, str) else doc
+        stop_words = self.stop_words
+        words = [t for t in tokens if len(t) > 1 and t not in stop_words]
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        return features
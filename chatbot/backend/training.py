@@ -1,97 +1,448 @@
-from typing import List, Dict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from itertools import islice
+from typing import List, Dict, Iterator
+import os
+from sqlalchemy import func, select, update
 from database import SessionLocal, get_db
+from model_registry import registry
+from response_cache import response_cache
+from nlp_resources import get_stopwords
+from tokenizer import Analyzer, tokenize, tokenize_chunks, tokenize_many
 import models
 import logging
 
-# Initialize NLTK resources
-nltk.download('punkt')
-nltk.download('stopwords')
+# numpy, scipy and scikit-learn are imported where they are first used, so
+# importing this module (and every router that does) stays cheap.
+
+FALLBACK_RESPONSE = "I'm not sure how to respond to that. Could you rephrase?"
+# Minimum similarity for answering with a script, unless the bot sets its own
+DEFAULT_THRESHOLD = 0.3
+# Queries scored per sparse product in generate_responses, bounding the similarity matrix size
+BATCH_CHUNK_SIZE = 256
+# Scripts fetched from the database and tokenized per chunk while training
+TRAINING_CHUNK_SIZE = int(os.getenv("TRAINING_CHUNK_SIZE", "1000"))
+
+# Seconds clients are told to wait before retrying when a bot's model is still being trained
+MODEL_RETRY_AFTER_SECONDS = int(os.getenv("MODEL_RETRY_AFTER_SECONDS", "5"))
+
+# Train new models on a hashed vocabulary so script uploads and deletions can update them in place
+INCREMENTAL_TRAINING = os.getenv("INCREMENTAL_TRAINING", "true").lower() == "true"
 
 class ChatbotTrainer:
-    def __init__(self, bot_id: int):
+    def __init__(self, bot_id: int, incremental: bool = None):
         self.bot_id = bot_id
-        self.vectorizer = TfidfVectorizer(
-            stop_words=stopwords.words('english'),
-            ngram_range=(1, 2),
-            max_features=5000
-        )
+        self.incremental = INCREMENTAL_TRAINING if incremental is None else incremental
+        self.vectorizer = self.build_vectorizer()
         self.trained_data = None
+        self.term_counts = None  # raw counts behind trained_data, kept in incremental mode
+        self._index = None
+        self.script_ids = []
+        self.word_counts = {}  # None for models loaded from an artifact until an update needs them
         self.personality_profile = {}
+        self.artifact_dir = None
+
+    def build_vectorizer(self):
+        """Create an unfitted vectorizer for this trainer's training mode"""
+        # Unigrams and bigrams without stop words, produced by our own tokenizer
+        analyzer = Analyzer(get_stopwords('english'))
+        if self.incremental:
+            from incremental import IncrementalTfidfVectorizer
+            return IncrementalTfidfVectorizer(analyzer=analyzer)
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        # float32 weights halve the matrix; cosine scores only need a few significant digits
+        return TfidfVectorizer(analyzer=analyzer, max_features=5000, dtype=np.float32)
+
+    @property
+    def index(self) -> "InvertedIndex":
+        """Inverted index over trained_data, rebuilt whenever the matrix is replaced"""
+        if self._index is None or self._index_source is not self.trained_data:
+            from retrieval import InvertedIndex
+            self._index = InvertedIndex.from_matrix(self.trained_data)
+            self._index_source = self.trained_data
+        return self._index
+
+    def set_index(self, index: "InvertedIndex"):
+        """Use a prebuilt index (e.g. from an artifact) for the current trained_data"""
+        self._index = index
+        self._index_source = self.trained_data
 
     def preprocess_text(self, text: str) -> str:
         """Clean and normalize text for training"""
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', '', text)
-        tokens = word_tokenize(text)
-        return ' '.join(tokens)
+        return ' '.join(tokenize(text))
 
     def load_training_data(self, db):
         """Load all scripts assigned to this bot from database"""
-        scripts = db.query(models.Script).filter(models.Script.bot_id == self.bot_id).all()
-        if not scripts:
+        self.processed_texts = list(self.iter_training_data(db))
+
+    def iter_training_data(self, db) -> Iterator[List[str]]:
+        """Stream this bot's scripts from the database, yielding each one's tokens.
+
+        Scripts are fetched and tokenized a chunk at a time; only the raw texts
+        (needed to answer queries), script ids and word counts are kept, so the
+        vectorizer can consume the tokens without the corpus being held as ORM
+        objects or token lists.
+        """
+        self.script_ids = []
+        self.raw_texts = []
+        self.word_counts = {}
+        for tokens in tokenize_chunks(self._script_chunks(db)):
+            _count_words(self.word_counts, tokens)
+            yield from tokens
+        if not self.raw_texts:
             raise ValueError("No training data found for this bot")
-        
-        self.raw_texts = [script.content for script in scripts]
-        self.processed_texts = [self.preprocess_text(text) for text in self.raw_texts]
-        
         # Analyze personality traits from text
         self._analyze_personality()
 
+    def _script_chunks(self, db) -> Iterator[List[str]]:
+        rows = iter(
+            db.query(models.Script.id, models.Script.content)
+            .filter(models.Script.bot_id == self.bot_id, models.Script.duplicate_of.is_(None))
+            .order_by(models.Script.id)
+            .yield_per(TRAINING_CHUNK_SIZE)
+        )
+        while True:
+            chunk = list(islice(rows, TRAINING_CHUNK_SIZE))
+            if not chunk:
+                return
+            texts = [content for _, content in chunk]
+            self.script_ids.extend(script_id for script_id, _ in chunk)
+            self.raw_texts.extend(texts)
+            yield texts
+
     def _analyze_personality(self):
-        """Extract personality traits from training texts"""
-        word_counts = {}
-        for text in self.processed_texts:
-            for word in text.split():
-                word_counts[word] = word_counts.get(word, 0) + 1
-        
+        """Extract personality traits from word counts over the training texts"""
         # Simple personality metrics
         self.personality_profile = {
-            'word_variety': len(word_counts),
-            'avg_sentence_length': sum(len(t.split()) for t in self.processed_texts) / len(self.processed_texts),
-            'common_words': sorted(word_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+            'word_variety': len(self.word_counts),
+            'avg_sentence_length': sum(self.word_counts.values()) / len(self.raw_texts),
+            'common_words': sorted(self.word_counts.items(), key=lambda x: x[1], reverse=True)[:10]
         }
 
     def train(self, db):
         """Train the model on loaded scripts"""
-        self.load_training_data(db)
-        self.trained_data = self.vectorizer.fit_transform(self.processed_texts)
-        logging.info(f"Bot {self.bot_id} trained on {len(self.processed_texts)} documents")
+        # The vectorizer consumes the token stream in a single pass
+        documents = self.iter_training_data(db)
+        if self.incremental:
+            self.term_counts = self.vectorizer.fit_count(documents)
+            self.trained_data = self.vectorizer.weight(self.term_counts)
+        else:
+            self.trained_data = self.vectorizer.fit_transform(documents)
+        logging.info(f"Bot {self.bot_id} trained on {len(self.raw_texts)} documents")
         return self.personality_profile
 
-    def generate_response(self, query: str, threshold: float = 0.3) -> str:
+    def incremental_update(self, db) -> "ChatbotTrainer":
+        """Return a new trainer reflecting scripts added or deleted since this one was trained.
+
+        Only the changed scripts are tokenized: their term counts are added to or
+        subtracted from the document frequencies, and the kept rows' counts and
+        texts are carried over as arrays, without decoding or re-tokenizing them.
+        Every row is then re-weighted in one vectorized pass, since adding or
+        removing any document changes every IDF. This trainer is left untouched
+        so it can keep serving queries meanwhile.
+        """
+        if not self.incremental:
+            raise ValueError("Model was not trained in incremental mode")
+        import numpy as np
+        from scipy.sparse import vstack
+        from artifacts import MappedTexts, load_word_counts
+
+        # Ids only, through Core rather than the ORM: this is the one query that reads every script
+        current_ids = np.array(
+            db.connection().execute(
+                select(models.Script.id).where(
+                    models.Script.bot_id == self.bot_id, models.Script.duplicate_of.is_(None)
+                )
+            ).scalars().all(),
+            dtype=np.int64
+        )
+        if not len(current_ids):
+            raise ValueError("No training data found for this bot")
+        script_ids = np.asarray(self.script_ids, dtype=np.int64)
+        keep = np.isin(script_ids, current_ids)
+        added_ids = np.setdiff1d(current_ids, script_ids).tolist()
+
+        updated = ChatbotTrainer(self.bot_id, incremental=True)
+        updated.vectorizer = self.vectorizer.copy()
+        updated.word_counts = dict(self.word_counts if self.word_counts is not None else load_word_counts(self.artifact_dir))
+
+        removed_rows = np.flatnonzero(~keep)
+        kept_rows = np.flatnonzero(keep)
+        term_counts = self.term_counts
+        texts = MappedTexts.of(self.raw_texts)
+        if len(removed_rows):
+            updated.vectorizer.remove_counts(term_counts[removed_rows])
+            removed_texts = [tokenize(texts[i]) for i in removed_rows]
+            _count_words(updated.word_counts, removed_texts, sign=-1)
+            term_counts = term_counts[kept_rows]
+            texts = texts.take(kept_rows)
+        updated.script_ids = script_ids[kept_rows].tolist()
+
+        for start in range(0, len(added_ids), TRAINING_CHUNK_SIZE):
+            rows = db.query(models.Script.id, models.Script.content).filter(
+                models.Script.id.in_(added_ids[start:start + TRAINING_CHUNK_SIZE])
+            ).order_by(models.Script.id).all()
+            added_texts = [content for _, content in rows]
+            processed = tokenize_many(added_texts)
+            counts = updated.vectorizer.count(processed)
+            updated.vectorizer.add_counts(counts)
+            term_counts = vstack([term_counts, counts], format="csr")
+            texts = texts.extend(added_texts)
+            updated.script_ids.extend(script_id for script_id, _ in rows)
+            _count_words(updated.word_counts, processed)
+
+        updated.raw_texts = texts
+        updated.term_counts = term_counts
+        updated.trained_data = updated.vectorizer.weight(term_counts)
+        updated._analyze_personality()
+        logging.info(
+            f"Bot {self.bot_id} incrementally updated: {len(added_ids)} added, "
+            f"{len(removed_rows)} removed, {len(updated.script_ids)} documents"
+        )
+        return updated
+
+    def generate_response(self, query: str, threshold: float = DEFAULT_THRESHOLD) -> str:
         """Generate response based on trained knowledge"""
         if self.trained_data is None:
             raise ValueError("Model not trained yet")
         
-        processed_query = self.preprocess_text(query)
-        query_vec = self.vectorizer.transform([processed_query])
+        query_vec = self.vectorizer.transform([query])
         
-        similarities = cosine_similarity(query_vec, self.trained_data)
-        max_sim_idx = np.argmax(similarities)
-        max_sim = similarities[0, max_sim_idx]
+        doc_ids, scores = self.index.search(query_vec, k=1)
         
-        if max_sim < threshold:
-            return "I'm not sure how to respond to that. Could you rephrase?"
+        if not len(doc_ids) or scores[0] < threshold:
+            return FALLBACK_RESPONSE
         
         # Return the most similar training text
-        return self.raw_texts[max_sim_idx]
+        return self.raw_texts[doc_ids[0]]
 
-def train_bot(bot_id: int, db: SessionLocal):
-    """Train a specific bot and save personality profile"""
-    trainer = ChatbotTrainer(bot_id)
-    personality = trainer.train(db)
-    
-    # Update bot's personality profile in database
+    def generate_candidates(self, query: str, k: int = 5) -> List[tuple]:
+        """Return up to k (script_id, text, score) best matches for query, best first"""
+        if self.trained_data is None:
+            raise ValueError("Model not trained yet")
+        
+        query_vec = self.vectorizer.transform([query])
+        # The index selects the top k with argpartition and only sorts those
+        doc_ids, scores = self.index.search(query_vec, k=k)
+        return [
+            (int(self.script_ids[doc_id]), self.raw_texts[doc_id], float(score))
+            for doc_id, score in zip(doc_ids, scores)
+        ]
+
+    def generate_responses(self, queries: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[tuple]:
+        """Generate (response, score, matched) for many queries with one sparse product per chunk"""
+        if self.trained_data is None:
+            raise ValueError("Model not trained yet")
+        import numpy as np
+        
+        results = []
+        # The index postings are the term-major transpose of trained_data
+        documents = self.index.term_matrix()
+        for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+            chunk = queries[start:start + BATCH_CHUNK_SIZE]
+            query_matrix = self.vectorizer.transform(chunk)
+            similarities = (query_matrix @ documents).tocsr()
+            similarities.sort_indices()
+            # Sparse argmax picks the first stored maximum, i.e. the lowest document id on ties
+            best = np.asarray(similarities.argmax(axis=1)).ravel()
+            scores = similarities.max(axis=1).toarray().ravel()
+            for doc_id, score in zip(best, scores):
+                if score <= 0 or score < threshold:
+                    results.append((FALLBACK_RESPONSE, float(score), False))
+                else:
+                    results.append((self.raw_texts[doc_id], float(score), True))
+        return results
+
+def _count_words(word_counts: Dict[str, int], processed_texts: List[List[str]], sign: int = 1):
+    """Add (or with sign=-1, subtract) word occurrences of tokenized texts to word_counts"""
+    for tokens in processed_texts:
+        for word in tokens:
+            count = word_counts.get(word, 0) + sign
+            if count:
+                word_counts[word] = count
+            else:
+                word_counts.pop(word, None)
+
+def _load_trainer(bot_id: int, version: int):
+    """Return the cached or on-disk trainer for this model version, or None"""
+    from artifacts import load_artifact
+    trainer = registry.get(bot_id, version)
+    if trainer is None:
+        trainer = ChatbotTrainer(bot_id)
+        if not load_artifact(trainer, version):
+            return None
+        registry.put(bot_id, version, trainer)
+    return trainer
+
+class ModelNotReady(Exception):
+    """The bot has no model loaded or published yet; a training job has been queued for it"""
+
+    def __init__(self, bot_id: int, job):
+        super().__init__(f"The model for bot {bot_id} is being trained, please retry shortly")
+        self.bot_id = bot_id
+        self.job = job
+
+def get_trainer(bot: models.Bot, db, wait: float = 0) -> ChatbotTrainer:
+    """Return a fitted trainer for bot from the registry or its artifact.
+
+    A bot with neither is handed to the training scheduler instead of being
+    trained in the caller's thread: this waits up to wait seconds for the
+    job, then raises ModelNotReady.
+    """
+    import training_scheduler
+    trainer = _load_trainer(bot.id, bot.model_version or 0)
+    if trainer is not None:
+        return trainer
+    has_scripts = db.query(models.Script.id).filter(
+        models.Script.bot_id == bot.id, models.Script.duplicate_of.is_(None)
+    ).first()
+    if has_scripts is None:
+        raise ValueError("No training data found for this bot")
+    job = training_scheduler.scheduler.submit(bot.id, warm=True)
+    if wait > 0 and job.wait(wait):
+        # The job may have been a retrain that published a newer version
+        db.refresh(bot)
+        trainer = _load_trainer(bot.id, bot.model_version or 0)
+        if trainer is not None:
+            return trainer
+    raise ModelNotReady(bot.id, job)
+
+def bot_threshold(bot: models.Bot) -> float:
+    """The bot's configured response threshold, or the default"""
+    return DEFAULT_THRESHOLD if bot.response_threshold is None else bot.response_threshold
+
+def respond(bot: models.Bot, db, query: str, threshold: float = None, wait: float = 0) -> str:
+    """Answer query with the bot's current model, serving repeated queries from the response cache"""
+    if threshold is None:
+        threshold = bot_threshold(bot)
+    version = bot.model_version or 0
+    response = response_cache.get(bot.id, version, query, threshold)
+    if response is None:
+        response = get_trainer(bot, db, wait=wait).generate_response(query, threshold=threshold)
+        response_cache.put(bot.id, version, query, threshold, response)
+    return response
+
+def respond_many(bot: models.Bot, db, queries: List[str], threshold: float = None, wait: float = 0) -> List[str]:
+    """Answer many queries like respond(), scoring all cache misses in one generate_responses pass"""
+    if threshold is None:
+        threshold = bot_threshold(bot)
+    version = bot.model_version or 0
+    responses = [response_cache.get(bot.id, version, query, threshold) for query in queries]
+    missing = list(dict.fromkeys(query for query, response in zip(queries, responses) if response is None))
+    if missing:
+        results = get_trainer(bot, db, wait=wait).generate_responses(missing, threshold=threshold)
+        answered = {}
+        for query, (response, _, _) in zip(missing, results):
+            response_cache.put(bot.id, version, query, threshold, response)
+            answered[query] = response
+        responses = [answered[query] if response is None else response for query, response in zip(queries, responses)]
+    return responses
+
+def _publish(trainer: ChatbotTrainer, version: int) -> ChatbotTrainer:
+    """Save trainer as the bot's artifact and cache the memory-mapped copy in its place.
+
+    Serving from the mapped artifact lets this process drop its private copy
+    of the freshly trained model and share pages with the other workers.
+    Artifacts only speed up cold starts, so a failed write must not fail
+    training; the in-memory trainer is cached instead.
+    """
+    from artifacts import load_artifact, save_artifact
+    try:
+        save_artifact(trainer, version)
+        mapped = ChatbotTrainer(trainer.bot_id)
+        if load_artifact(mapped, version):
+            trainer = mapped
+    except Exception as e:
+        logging.error(f"Saving model artifact for bot {trainer.bot_id} failed: {str(e)}")
+    registry.put(trainer.bot_id, version, trainer)
+    return trainer
+
+def _next_model_version(db, bot_id: int):
+    """Claim the bot's next model version, or None if the bot does not exist.
+
+    The increment is one UPDATE ... RETURNING in the caller's transaction, so
+    concurrent trainers never get the same version; the row stays locked
+    until the caller commits.
+    """
+    return db.execute(
+        update(models.Bot)
+        .where(models.Bot.id == bot_id)
+        .values(model_version=func.coalesce(models.Bot.model_version, 0) + 1)
+        .returning(models.Bot.model_version)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+def model_matches_scripts(bot_id: int, db) -> bool:
+    """Whether the bot's published model was trained on exactly the scripts it has now"""
+    import numpy as np
     bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
-    if bot:
-        bot.personality = str(personality)
+    trainer = _load_trainer(bot_id, bot.model_version or 0) if bot else None
+    if trainer is None:
+        return False
+    current_ids = db.connection().execute(
+        select(models.Script.id).where(models.Script.bot_id == bot_id, models.Script.duplicate_of.is_(None))
+    ).scalars().all()
+    return np.array_equal(np.sort(np.asarray(trainer.script_ids, dtype=np.int64)), np.sort(np.asarray(current_ids, dtype=np.int64)))
+
+def invalidate_model(bot_id: int, db: SessionLocal):
+    """Bump the bot's model version so every process drops its cached model"""
+    if _next_model_version(db, bot_id) is not None:
         db.commit()
+    registry.invalidate(bot_id)
+    response_cache.invalidate(bot_id)
+
+def warm_bot_model(bot_id: int, db: SessionLocal):
+    """Publish the bot's current model version if no artifact has it yet; return (trainer, model_version).
+
+    Unlike fit_bot_model this never bumps the version. Workers on this node
+    that miss together train the bot once; the others map its artifact.
+    """
+    from artifacts import artifact_lock
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise ValueError("Bot not found")
+    version = bot.model_version or 0
+    trainer = _load_trainer(bot_id, version)
+    if trainer is None:
+        with artifact_lock(bot_id):
+            trainer = _load_trainer(bot_id, version)
+            if trainer is None:
+                trainer = ChatbotTrainer(bot_id)
+                trainer.train(db)
+                trainer = _publish(trainer, version)
+    return trainer, version
+
+def fit_bot_model(bot_id: int, db: SessionLocal, incremental: bool = False):
+    """Train a bot, publish the model and return (trainer, model_version).
+
+    With incremental=True the bot's current model is updated with just the
+    scripts added or deleted since it was trained, when that model supports it.
+    The model is published under its new version only after that version is
+    committed, so a failed commit leaves no artifact behind.
+    """
+    from artifacts import artifact_lock
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    trainer = None
+    if incremental and bot:
+        previous = _load_trainer(bot_id, bot.model_version or 0)
+        if previous is not None and previous.incremental:
+            trainer = previous.incremental_update(db)
+    if trainer is None:
+        trainer = ChatbotTrainer(bot_id)
+        trainer.train(db)
+    if not bot:
+        return trainer, None
     
-    return personality
\ No newline at end of file
+    # Update bot's personality profile and model version in database
+    bot.personality = str(trainer.personality_profile)
+    version = _next_model_version(db, bot_id)
+    db.commit()
+    with artifact_lock(bot_id):
+        trainer = _publish(trainer, version)
+    response_cache.invalidate(bot_id)
+    
+    return trainer, version
+
+def train_bot(bot_id: int, db: SessionLocal, incremental: bool = False):
+    """Train a specific bot and save personality profile"""
+    trainer, _ = fit_bot_model(bot_id, db, incremental=incremental)
+    return trainer.personality_profile
@@ -0,0 +1,420 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import os
+import time
+import uuid
+import threading
+import logging
+from model_registry import registry
+from response_cache import response_cache
+
+# Concurrent training processes; fitting is CPU-bound so this is sized to the machine
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# A queued job waits this long after the latest change to its bot before it starts
+TRAINING_DEBOUNCE_SECONDS = float(os.getenv("TRAINING_DEBOUNCE_SECONDS", "2"))
+# ...but never longer than this after it was first queued
+TRAINING_MAX_DELAY_SECONDS = float(os.getenv("TRAINING_MAX_DELAY_SECONDS", "30"))
+# Number of finished jobs whose status is kept in memory for the status endpoint
+TRAINING_JOB_HISTORY = int(os.getenv("TRAINING_JOB_HISTORY", "1000"))
+# How long (seconds) finished jobs stay in the training_jobs table
+TRAINING_JOB_RETENTION_SECONDS = float(os.getenv("TRAINING_JOB_RETENTION_SECONDS", "604800"))
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused in the child
+    from database import engine
+    engine.dispose(close=False)
+
+
+def run_training_job(bot_id: int, incremental: bool, warm: bool = False) -> dict:
+    """Train one bot in a worker process and report what was trained.
+
+    A warm job only publishes the bot's current model version when no
+    artifact has it, e.g. for a cold start.
+    """
+    from database import SessionLocal
+    from training import fit_bot_model, invalidate_model, model_matches_scripts, warm_bot_model
+    db = SessionLocal()
+    try:
+        if warm:
+            trainer, version = warm_bot_model(bot_id, db)
+        else:
+            try:
+                trainer, version = fit_bot_model(bot_id, db, incremental=incremental)
+            except Exception:
+                db.rollback()
+                # A model that no longer matches the bot's scripts must not keep answering;
+                # one that still does stays in service, e.g. after a transient failure
+                if not model_matches_scripts(bot_id, db):
+                    invalidate_model(bot_id, db)
+                raise
+        return {
+            "model_version": version,
+            "corpus_size": len(trainer.raw_texts),
+            "personality_profile": trainer.personality_profile
+        }
+    finally:
+        db.close()
+
+
+class TrainingJob:
+    def __init__(self, bot_id: int, incremental: bool, warm: bool = False):
+        self.id = uuid.uuid4().hex
+        self.bot_id = bot_id
+        self.incremental = incremental
+        self.warm = warm  # only publish the current version if it is missing
+        self.status = "queued"
+        self.requests = 1  # number of training requests coalesced into this job
+        self.queued_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.duration_seconds = None
+        self.corpus_size = None
+        self.model_version = None
+        self.personality_profile = None
+        self.error = None
+        self._not_before = 0.0
+        self._deadline = 0.0
+        self._started = 0.0
+        self._revision = 0  # bumped on every change written to the job store
+        self._done = threading.Event()
+
+    @classmethod
+    def from_dict(cls, record: dict) -> "TrainingJob":
+        """Rebuild a job another process reported, e.g. from the job store"""
+        job = cls(record["bot_id"], record["incremental"], record.get("warm", False))
+        job.id = record["job_id"]
+        for key in (
+            "status", "requests", "queued_at", "started_at", "finished_at",
+            "duration_seconds", "corpus_size", "model_version", "error"
+        ):
+            setattr(job, key, record[key])
+        if job.status in ("done", "failed"):
+            job._done.set()
+        return job
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until the job has finished; False on timeout"""
+        return self._done.wait(timeout)
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "bot_id": self.bot_id,
+            "status": self.status,
+            "incremental": self.incremental,
+            "warm": self.warm,
+            "requests": self.requests,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_seconds": self.duration_seconds,
+            "corpus_size": self.corpus_size,
+            "model_version": self.model_version,
+            "error": self.error
+        }
+
+
+class DatabaseJobStore:
+    """Keeps job status in the training_jobs table so every backend process can report it.
+
+    Writes carry the job's revision and a write older than the stored row is
+    dropped, so they need not reach the database in order.
+    """
+
+    _fields = (
+        "bot_id", "status", "incremental", "warm", "requests", "queued_at", "started_at",
+        "finished_at", "duration_seconds", "corpus_size", "model_version", "error"
+    )
+
+    def __init__(self, session_factory=None, retention: float = TRAINING_JOB_RETENTION_SECONDS):
+        self._session_factory = session_factory
+        self.retention = retention
+
+    def _session(self):
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def save(self, record: dict, revision: int):
+        import models
+        from sqlalchemy.exc import IntegrityError
+        values = {key: record[key] for key in self._fields}
+        values["revision"] = revision
+        db = self._session()
+        try:
+            for attempt in range(2):
+                try:
+                    updated = db.query(models.TrainingJob).filter(
+                        models.TrainingJob.id == record["job_id"],
+                        models.TrainingJob.revision < revision
+                    ).update(values, synchronize_session=False)
+                    if not updated and db.get(models.TrainingJob, record["job_id"]) is None:
+                        db.add(models.TrainingJob(id=record["job_id"], **values))
+                    if record["finished_at"] is not None:
+                        db.query(models.TrainingJob).filter(
+                            models.TrainingJob.finished_at < datetime.utcnow() - timedelta(seconds=self.retention)
+                        ).delete(synchronize_session=False)
+                    db.commit()
+                    return
+                except IntegrityError:
+                    # Another write inserted the row first; update it instead
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            db.close()
+
+    def get(self, job_id: str):
+        import models
+        db = self._session()
+        try:
+            row = db.get(models.TrainingJob, job_id)
+            return self._record(row) if row is not None else None
+        finally:
+            db.close()
+
+    def find_queued(self, bot_id: int, since: datetime):
+        """The latest retrain (not warm job) of bot_id queued since then and not started yet, or None"""
+        import models
+        db = self._session()
+        try:
+            row = db.query(models.TrainingJob).filter(
+                models.TrainingJob.bot_id == bot_id,
+                models.TrainingJob.status == "queued",
+                models.TrainingJob.warm.is_(False),
+                models.TrainingJob.queued_at >= since
+            ).order_by(models.TrainingJob.queued_at.desc()).first()
+            return self._record(row) if row is not None else None
+        finally:
+            db.close()
+
+    def _record(self, row) -> dict:
+        record = {key: getattr(row, key) for key in self._fields}
+        record["job_id"] = row.id
+        return record
+
+
+class TrainingScheduler:
+    """Runs bot training in a bounded worker pool outside the request path.
+
+    Requests for a bot that already has a queued job are merged into it, and
+    each job is debounced so a burst of script changes becomes one retrain.
+    At most one job per bot runs at a time, and ready bots are started in
+    the order they were queued so a busy bot cannot starve the others.
+    With a store, job status is also written there so other processes can
+    report jobs this one runs, and a retrain another process has queued
+    but not started yet takes this process's requests too.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = TRAINING_WORKERS,
+        debounce: float = TRAINING_DEBOUNCE_SECONDS,
+        max_delay: float = TRAINING_MAX_DELAY_SECONDS,
+        executor=None,
+        run_job=run_training_job,
+        store=None
+    ):
+        self.max_workers = max_workers
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.run_job = run_job
+        self.store = store
+        self._executor = executor
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()  # job_id -> TrainingJob, oldest first
+        self._pending = OrderedDict()  # bot_id -> queued job, in queue order
+        self._running = {}  # bot_id -> running job
+        self._thread = None
+        self._closed = False
+
+    def submit(self, bot_id: int, incremental: bool = False, warm: bool = False) -> TrainingJob:
+        """Queue a retrain of bot_id, merging with a job that has not started yet.
+
+        warm=True asks only for the bot's current model to be published; it
+        joins any queued or running job for the bot, since that leaves a
+        published model behind too, and otherwise starts without debounce.
+        """
+        if not warm and self.store is not None:
+            with self._cond:
+                queued_here = bot_id in self._pending
+            if not queued_here:
+                job = self._queued_elsewhere(bot_id, incremental)
+                if job is not None:
+                    return job
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Training scheduler is shut down")
+            now = time.monotonic()
+            job = self._pending.get(bot_id)
+            if warm and job is None:
+                job = self._running.get(bot_id)
+            if job is not None:
+                job.requests += 1
+                if not warm:
+                    # A full retrain request wins over incremental ones
+                    job.incremental = incremental if job.warm else job.incremental and incremental
+                    job.warm = False
+                    job._not_before = min(now + self.debounce, job._deadline)
+            else:
+                job = TrainingJob(bot_id, incremental, warm)
+                job._not_before = now if warm else now + self.debounce
+                job._deadline = now + self.max_delay
+                self._pending[bot_id] = job
+                self._jobs[job.id] = job
+                self._prune_history()
+            self._ensure_started()
+            self._cond.notify_all()
+            record = self._snapshot(job)
+        self._save(*record)
+        return job
+
+    def _queued_elsewhere(self, bot_id: int, incremental: bool):
+        """A retrain of bot_id that another process has queued and that covers this request, or None.
+
+        It reads the bot's scripts when it starts, so it sees changes committed
+        before now. Jobs queued longer ago than max_delay may belong to a process
+        that is gone, so they are not relied on.
+        """
+        try:
+            record = self.store.find_queued(bot_id, since=datetime.utcnow() - timedelta(seconds=self.max_delay))
+        except Exception as e:
+            logging.warning(f"Looking up queued training jobs for bot {bot_id} failed: {str(e)}")
+            return None
+        # A full retrain is only covered by another full retrain
+        if record is None or (record["incremental"] and not incremental):
+            return None
+        return TrainingJob.from_dict(record)
+
+    def get(self, job_id: str):
+        """A job of this process, or else the last status another process stored for it"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        record = self.store.get(job_id)
+        return TrainingJob.from_dict(record) if record is not None else None
+
+    def start(self):
+        """Fork the worker processes now, before the server starts its threads"""
+        with self._cond:
+            self._ensure_started()
+            executor = self._executor
+        # A process pool forks all of its workers on the first submit
+        executor.submit(os.getpid).result()
+
+    def shutdown(self, wait: bool = False):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch_loop, name="training-scheduler", daemon=True)
+            self._thread.start()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                job, wait = self._next_ready(time.monotonic())
+                if job is None:
+                    self._cond.wait(wait)
+                    continue
+                del self._pending[job.bot_id]
+                self._running[job.bot_id] = job
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+                job._started = time.monotonic()
+                record = self._snapshot(job)
+            self._save(*record)
+            try:
+                future = self._executor.submit(self.run_job, job.bot_id, job.incremental, job.warm)
+            except RuntimeError as e:
+                with self._cond:
+                    self._finish(job, error=str(e))
+                    record = self._snapshot(job)
+                self._save(*record)
+                continue
+            future.add_done_callback(partial(self._on_done, job))
+
+    def _next_ready(self, now: float):
+        """Return the first queued job allowed to start, or how long to wait for one"""
+        if len(self._running) >= self.max_workers:
+            return None, None
+        wait = None
+        for bot_id, job in self._pending.items():
+            if bot_id in self._running:
+                continue
+            if job._not_before <= now:
+                return job, None
+            delay = job._not_before - now
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _on_done(self, job: TrainingJob, future):
+        with self._cond:
+            if future.cancelled():
+                self._finish(job, error="cancelled")
+            elif future.exception() is not None:
+                self._finish(job, error=str(future.exception()))
+            else:
+                self._finish(job, result=future.result())
+            self._cond.notify_all()
+            record = self._snapshot(job)
+        self._save(*record)
+
+    def _snapshot(self, job: TrainingJob):
+        job._revision += 1
+        return job.as_dict(), job._revision
+
+    def _save(self, record: dict, revision: int):
+        # Written outside the lock so a slow database does not hold up the queue
+        if self.store is None:
+            return
+        try:
+            self.store.save(record, revision)
+        except Exception as e:
+            logging.warning(f"Storing status of training job {record['job_id']} failed: {str(e)}")
+
+    def _finish(self, job: TrainingJob, result: dict = None, error: str = None):
+        self._running.pop(job.bot_id, None)
+        job.finished_at = datetime.utcnow()
+        job.duration_seconds = time.monotonic() - job._started
+        if error is not None:
+            job.status = "failed"
+            job.error = error
+            logging.error(f"Training job {job.id} for bot {job.bot_id} failed: {error}")
+        else:
+            if not job.warm:
+                # The worker published a new model version; drop this process's stale copy
+                registry.invalidate(job.bot_id)
+                response_cache.invalidate(job.bot_id)
+            job.status = "done"
+            job.corpus_size = result["corpus_size"]
+            job.model_version = result["model_version"]
+            job.personality_profile = result["personality_profile"]
+            logging.info(
+                f"Training job {job.id} for bot {job.bot_id} done in {job.duration_seconds:.2f}s "
+                f"on {job.corpus_size} documents"
+            )
+        job._done.set()
+
+    def _prune_history(self):
+        while len(self._jobs) > TRAINING_JOB_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+
+
+scheduler = TrainingScheduler(store=DatabaseJobStore())